@@ -5,13 +5,19 @@ Created on Fri Mar  3 16:08:37 2023
 @author: jkalanger
 """
 
-import netCDF4
 import pandas as pd
 import numpy as np
 import datetime
 import os
+import json
 import time
-import copernicusmarine
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import stage,add_arrays,timed
+from result_cache import parameter_hash,file_fingerprint
+from design_statistics import design_sketch,update_sketch,sketch_percentiles,select_sites
+
+## copernicusmarine and netCDF4 are only imported by the functions that download and read the CMEMS files. If the processed temperature profiles
+## already exist, pyOTEC runs without them, which saves the import time and allows to run pyOTEC on machines where they are not installed.
 
 ## We use seawater temperature data from CMEMS for our OTEC analysis. If the data does not exist in the work folder yet, then it is downloaded with the function
 ## below. Essentially, we contact CMEMS's servers via an url created from input data like desired year, water depth, coordinates, etc, and download the data
@@ -44,6 +50,7 @@ def download_data(cost_level,inputs,studied_region,new_path):
         ## We store the filenames and their paths, so that the seawater temperature data can be accessed by pyOTEC later.
         
         files = []
+        downloads = []
         # print(depth_WW,depth_CW)
         for depth in [depth_WW,depth_CW]:
             for part in range(0,parts):
@@ -55,40 +62,26 @@ def download_data(cost_level,inputs,studied_region,new_path):
                 west = float(regions[regions['region']==studied_region]['west'].iloc[part])
                 east = float(regions[regions['region']==studied_region]['east'].iloc[part])
                                              
-                start_time = time.time()
                 filename = f'T_{round(depth,0)}m_{date_start[0:4]}_{studied_region}_{part+1}.nc'.replace(" ","_")
                 filepath = os.path.join(new_path, filename)
                 files.append(filepath)
-                directory_data_results='Data_Results/'
                 print(filepath)
+                
+                ## Files are only stored under their final name once they have been downloaded completely (see download_file below).
+                ## Therefore, an existing file is always complete, and interrupted downloads are simply started again.
+                
                 if os.path.isfile(filepath):           
                     print('File already exists. No download necessary.')
                     continue
                 else:  
-                    # Download the subset of data
-                    # try: 
-                    copernicusmarine.subset(
-                        dataset_id = "cmems_mod_glo_phy_my_0.083deg_P1D-m",
-                        dataset_version="202311",
-                        variables = ['thetao'],
-                        minimum_longitude = west,
-                        maximum_longitude = east,
-                        minimum_latitude = south,
-                        maximum_latitude = north,
-                        minimum_depth = depth,
-                        maximum_depth = depth,
-                        start_datetime = date_start,
-                        end_datetime = date_end,
-                        force_download = True,
-                        output_directory = directory_data_results+studied_region.replace(" ","_"),
-                        output_filename = filename
-                    )
-                        
-
-                    end_time = time.time()
-                    print(f'{filename} saved. Time for download: ' + str(round((end_time-start_time)/60,2)) + ' minutes.')
-                
-                
+                    downloads.append([filepath,depth,north,south,west,east,date_start,date_end])
+        
+        ## The downloads are mostly spent waiting for the CMEMS servers, so we run several of them at the same time.
+        
+        if len(downloads) > 0:
+            with ThreadPoolExecutor(max_workers=inputs['download_workers']) as executor:
+                for download in [executor.submit(download_file,*download,inputs) for download in downloads]:
+                    download.result()
         
         return files    
         
@@ -96,7 +89,154 @@ def download_data(cost_level,inputs,studied_region,new_path):
         raise ValueError('Entered region not valid. Please check for typos and whether the region is included in "download_ranges_per_region.csv"')
 
 
-def data_processing(files,sites_df,inputs,studied_region,new_path,water,nan_columns = None):
+@timed('download file')
+def download_file(filepath,depth,north,south,west,east,date_start,date_end,inputs):
+    
+    ## We download into a temporary file and only rename it to its final name once it could be opened successfully. Renaming is atomic, so that
+    ## an interrupted or corrupted download (e.g. a nc file with 1 kB size) can never be mistaken for a complete file. Failed downloads are
+    ## retried with an exponentially increasing waiting time.
+    
+    import netCDF4
+    import copernicusmarine
+    
+    directory,filename = os.path.split(filepath)
+    temporary_filename = filename.replace('.nc','_incomplete.nc')
+    temporary_filepath = os.path.join(directory,temporary_filename)
+    
+    for attempt in range(inputs['download_retries']+1):
+        start_time = time.time()
+        try:
+            if os.path.isfile(temporary_filepath):
+                os.remove(temporary_filepath)
+                
+            copernicusmarine.subset(
+                dataset_id = "cmems_mod_glo_phy_my_0.083deg_P1D-m",
+                dataset_version="202311",
+                variables = ['thetao'],
+                minimum_longitude = west,
+                maximum_longitude = east,
+                minimum_latitude = south,
+                maximum_latitude = north,
+                minimum_depth = depth,
+                maximum_depth = depth,
+                start_datetime = date_start,
+                end_datetime = date_end,
+                force_download = True,
+                output_directory = directory,
+                output_filename = temporary_filename
+            )
+            
+            netCDF4.Dataset(temporary_filepath,'r').close()
+            os.replace(temporary_filepath,filepath)
+            break
+        except Exception as error:
+            if attempt == inputs['download_retries']:
+                raise Warning(f'{filename} was not downloaded successfully. Please try downloading the file later.') from error
+            waiting_time = inputs['download_backoff']*2**attempt
+            print(f'Download of {filename} failed ({error}). Retrying in {waiting_time} seconds.')
+            time.sleep(waiting_time)
+    
+    end_time = time.time()
+    size = os.path.getsize(filepath)/1024**2
+    print(f'{filename} saved. Time for download: ' + str(round((end_time-start_time)/60,2)) + f' minutes ({round(size,1)} MB at {round(size/max(end_time-start_time,1E-3),2)} MB/s).')
+    
+    return filepath
+
+def match_grid_to_sites(longitude,latitude,sites):
+    
+    ## CMEMS coordinates are compared with the sites after rounding them to three decimals. Instead of comparing every grid point with the full site table,
+    ## we quantise both to integer keys in steps of 0.001 degrees and look up all grid points at once in the sorted site keys. The matches are returned
+    ## in the same order as the grid is traversed, i.e. longitude first and latitude second.
+    
+    lon_keys = np.round(np.array(longitude,dtype=np.float64)*1000).astype(np.int64)
+    lat_keys = np.round(np.array(latitude,dtype=np.float64)*1000).astype(np.int64)
+    
+    idx_lon,idx_lat = np.meshgrid(np.arange(len(lon_keys)),np.arange(len(lat_keys)),indexing='ij')
+    idx_lon = idx_lon.ravel()
+    idx_lat = idx_lat.ravel()
+    
+    # latitudes are shifted by 90 degrees so that every pair of coordinates maps to a unique key
+    grid_keys = lon_keys[idx_lon]*1000000 + lat_keys[idx_lat] + 90000
+    site_keys = np.round(sites[:,0]*1000).astype(np.int64)*1000000 + np.round(sites[:,1]*1000).astype(np.int64) + 90000
+    
+    if site_keys.size == 0:
+        return idx_lon[:0],idx_lat[:0],np.zeros(0,dtype=np.int64)
+    
+    order = np.argsort(site_keys,kind='stable')
+    position = np.minimum(np.searchsorted(site_keys[order],grid_keys),len(order)-1)
+    match = site_keys[order][position] == grid_keys
+    
+    return idx_lon[match],idx_lat[match],order[position[match]]
+
+def extract_profiles(T_water,idx_lon,idx_lat,T_water_profiles,chunk_size):
+    
+    ## Loading the complete thetao variable would make the memory demand grow with the bounding box of the downloaded region. Instead, we read
+    ## for each longitude only the latitudes spanned by its matched points, in time chunks of at most chunk_size MB, and write the profiles
+    ## directly into the preallocated output array. The matched points are ordered by longitude, so that the points of one longitude are adjacent.
+    
+    lon_values,first_column,count = np.unique(idx_lon,return_index=True,return_counts=True)
+    
+    for lon,start,n in zip(lon_values,first_column,count):
+        columns = slice(start,start+n)
+        lat_min = np.min(idx_lat[columns])
+        lat_max = np.max(idx_lat[columns])
+        
+        time_steps = max(1,int(chunk_size*1024**2/(T_water_profiles.itemsize*(lat_max-lat_min+1))))
+        
+        for t in range(0,T_water_profiles.shape[0],time_steps):
+            T_water_chunk = T_water[t:t+time_steps,0,lat_min:lat_max+1,lon]
+            T_water_profiles[t:t+time_steps,columns] = np.array(T_water_chunk[:,idx_lat[columns]-lat_min],dtype=T_water_profiles.dtype)
+    
+    return T_water_profiles
+
+def rolling_quartiles(T_water_profiles,window,chunk_size):
+    
+    ## Lower and upper quartile of every profile over a rolling window of time steps, equal to rolling(window).quantile(0.25) and quantile(0.75)
+    ## of pandas. Instead of two passes through a skiplist, every window is sorted once and both quartiles are linearly interpolated from it. Sorting the
+    ## short windows is faster than partitioning them. The windows are views of the profiles and only copied by the sort, which is done for chunk_size MB
+    ## of windows at once.
+    ## Like in pandas, the quartiles are NaN for the first window-1 time steps and for windows that contain NaN.
+    
+    n_time,n_sites = np.shape(T_water_profiles)
+    
+    T_quartile_low = np.full((n_time,n_sites),np.nan,dtype=np.float64)
+    T_quartile_high = np.full((n_time,n_sites),np.nan,dtype=np.float64)
+    
+    if n_time < window:
+        return T_quartile_low,T_quartile_high
+    
+    position_low = 0.25*(window-1)
+    position_high = 0.75*(window-1)
+    index_low = int(position_low)
+    index_high = int(position_high)
+    columns_per_chunk = max(1,int(chunk_size*1024**2/(8*window*(n_time-window+1))))
+    
+    for start in range(0,n_sites,columns_per_chunk):
+        columns = slice(start,start+columns_per_chunk)
+        
+        # pandas calculates rolling quantiles in float64, also for float32 profiles
+        T_water = np.array(T_water_profiles[:,columns],dtype=np.float64)
+        
+        T_windows = np.sort(np.lib.stride_tricks.sliding_window_view(T_water,window,axis=0),axis=-1)
+        
+        T_low = T_windows[...,index_low]
+        T_quartile_low[window-1:,columns] = T_low + (T_windows[...,min(index_low+1,window-1)] - T_low)*(position_low-index_low)
+        T_high = T_windows[...,index_high]
+        T_quartile_high[window-1:,columns] = T_high + (T_windows[...,min(index_high+1,window-1)] - T_high)*(position_high-index_high)
+        
+        del T_windows
+        
+        # the number of NaN per window follows from the cumulative number of NaN along the time axis
+        nan_count = np.concatenate([np.zeros((1,T_water.shape[1]),dtype=np.int64),np.cumsum(np.isnan(T_water),axis=0)])
+        nan_in_window = nan_count[window:] - nan_count[:-window] > 0
+        T_quartile_low[window-1:,columns][nan_in_window] = np.nan
+        T_quartile_high[window-1:,columns][nan_in_window] = np.nan
+    
+    return T_quartile_low,T_quartile_high
+
+def data_processing(files,sites_df,inputs,studied_region,new_path,water,nan_sites = None,parameter_hash = None,data_hash = None):
+    import netCDF4
+    
     ## Here we convert the pandas Dataframe storing site-specific data into a numpy array
     
     sites = np.vstack((sites_df['longitude'],sites_df['latitude'],sites_df['dist_shore'],sites_df['id'])).T
@@ -125,35 +265,60 @@ def data_processing(files,sites_df,inputs,studied_region,new_path,water,nan_colu
     ## for OTEC (e.g. points on land, too shallow/ deep water, inside marine protection areas, etc). In this loop, we check which downloaded data points
     ## could be occupied by OTEC plants, and store their coordinates and temperature profiles in a numpy array
     
-    T_water_profiles = np.zeros((time.shape[0],0),dtype=np.float64)
-    coordinates = np.zeros((0,2),dtype=np.float64)
-    dist_shore = np.zeros((1,0),dtype=np.float64)
-    id_sites = np.zeros((1,0),dtype=np.float64)
+    ## We first match the grid of every file with the sites, which only requires the coordinates. Knowing the total number of matched points,
+    ## we can allocate the output arrays once and fill them file by file, instead of growing them point by point.
     
-    for file in files:
-        T_water_nc = netCDF4.Dataset(file,'r')             
-        latitude = T_water_nc.variables['latitude'][:]
-        longitude = T_water_nc.variables['longitude'][:]
-        depth = int(T_water_nc.variables['depth'][:])
-        T_water = T_water_nc.variables['thetao'][:]
-        
-        data_points = np.round([(idx_lon,idx_lat,lon,lat) for idx_lon,lon in enumerate(longitude) for idx_lat,lat in enumerate(latitude)],3)
-        
-        for index,point in enumerate(data_points):
-            match = np.array(np.where((point[2]==sites[:,0]) & (point[3]==sites[:,1])))
-            if match.size != 0:
-                if T_water_profiles.shape[1] == 0:
-                    coordinates = [point[2],point[3]]
-                    dist_shore = sites[match,2]
-                    id_sites = sites[match,3]
-                    T_water_profiles = (np.array(T_water[:,:,int(point[1]),int(point[0])],dtype=np.float64))
-                else:
-                    coordinates = np.vstack((coordinates, [point[2],point[3]]))
-                    dist_shore = np.hstack((dist_shore, sites[match,2]))
-                    id_sites = np.hstack((id_sites, sites[match,3]))
-                    T_water_profiles = np.hstack((T_water_profiles,(np.array(T_water[:,:,int(point[1]),int(point[0])],dtype=np.float64))))
-            else:
-                pass
+    with stage('netCDF extraction') as record:
+        matches = []
+        for file in files:
+            T_water_nc = netCDF4.Dataset(file,'r')             
+            latitude = T_water_nc.variables['latitude'][:]
+            longitude = T_water_nc.variables['longitude'][:]
+        
+            idx_lon,idx_lat,idx_sites = match_grid_to_sites(longitude,latitude,sites)
+            matches.append([idx_lon,idx_lat,idx_sites,longitude,latitude])
+            T_water_nc.close()
+        
+        ## If the profiles were already processed from the same files and parameters, but for fewer sites (e.g. new sites in CMEMS_points_with_properties.csv
+        ## or looser depth filters), we only extract and clean the sites that are neither stored nor known to have no data. The matched sites of all files
+        ## give the order in which the sites are stored, which is the same as if all sites had been processed at once.
+        
+        filename = os.path.basename(processed_file(new_path,inputs,studied_region,water))
+        
+        id_matched = np.concatenate([sites[idx_sites,3] for _,_,idx_sites,_,_ in matches])
+        stored = stored_temperatures(new_path + filename,data_hash,sites_df['id'])
+        
+        if stored is not None:
+            known = np.concatenate([np.ravel(stored['id_sites']),stored['nan_sites']])
+            matches = [[idx_lon[missing],idx_lat[missing],idx_sites[missing],longitude,latitude]
+                       for idx_lon,idx_lat,idx_sites,longitude,latitude in matches
+                       for missing in [~np.isin(sites[idx_sites,3],known)]]
+            record['stored_sites'] = np.shape(stored['id_sites'])[1]
+    
+        n_points = sum([len(match[0]) for match in matches])
+        record['processed_sites'] = int(n_points)
+    
+        T_water_profiles = np.empty((time.shape[0],n_points),dtype=inputs['precision'])
+        coordinates = np.empty((n_points,2),dtype=np.float64)
+        dist_shore = np.empty((1,n_points),dtype=np.float64)
+        id_sites = np.empty((1,n_points),dtype=np.float64)
+    
+        column = 0
+        for file,(idx_lon,idx_lat,idx_sites,longitude,latitude) in zip(files,matches):
+            columns = slice(column,column+len(idx_lon))
+        
+            coordinates[columns,0] = np.round(np.array(longitude,dtype=np.float64)[idx_lon],3)
+            coordinates[columns,1] = np.round(np.array(latitude,dtype=np.float64)[idx_lat],3)
+            dist_shore[0,columns] = sites[idx_sites,2]
+            id_sites[0,columns] = sites[idx_sites,3]
+        
+            T_water_nc = netCDF4.Dataset(file,'r')
+            extract_profiles(T_water_nc.variables['thetao'],idx_lon,idx_lat,T_water_profiles[:,columns],inputs['nc_chunk_size'])
+            T_water_nc.close()
+        
+            column = column + len(idx_lon)
+        
+        add_arrays(record,T_water_profiles=T_water_profiles)
     
     ## After obtaining the relevant CMEMS points, we calculate power transmission losses from OTEC plant offshore to the public grid onshore in kilometres.
     
@@ -166,38 +331,40 @@ def data_processing(files,sites_df,inputs,studied_region,new_path,water,nan_colu
     ## Some data might either be missing (no timestamp) or faulty (e.g. T = -30000)
     ## First, we remove the faulty values
 
-    T_water_profiles[T_water_profiles <= 0] = np.nan
+    with stage('outlier cleaning',T_water_profiles=T_water_profiles):
+        T_water_profiles[T_water_profiles <= 0] = np.nan
     
-    ## Here, we resample the dataset to the temporal resolution given in the parameters_and_constants file
-    ## and to fill previously missing steps with NaN, which are then filled via linear interpolation
-    T_water_profiles_df = pd.DataFrame(T_water_profiles)
-    if T_water_profiles_df.shape[1] == 1:
-        T_water_profiles_df.columns = [str(coordinates[0]) + '_' + str(coordinates[1])]
-    else:
+        ## Here, we resample the dataset to the temporal resolution given in the parameters_and_constants file
+        ## and to fill previously missing steps with NaN, which are then filled via linear interpolation
+        T_water_profiles_df = pd.DataFrame(T_water_profiles)
         T_water_profiles_df.columns = [str(val[0]) + '_' + str(val[1]) for idx,val in enumerate(coordinates)]
-    T_water_profiles_df['time'] = timestamp
-    T_water_profiles_df = T_water_profiles_df.set_index('time').asfreq(f'{inputs["t_resolution"]}')       
-    T_water_profiles_df = T_water_profiles_df.interpolate(method='linear')
-    
-    # Calculating interquartiles. With a factor 3, we are less strict with outliers than the convention of 1.5
-    # With this, we want to account for extreme seawater temperature conditions that would otherwise be removed from the dataset
-    r = T_water_profiles_df.rolling(window=30)
-    mps = (r.quantile(0.75) - r.quantile(0.25))*3 
-
-    T_water_profiles_df[(T_water_profiles_df < T_water_profiles_df.quantile(0.25) - mps) |
-                        (T_water_profiles_df > T_water_profiles_df.quantile(0.75) + mps)] = np.nan
+        T_water_profiles_df['time'] = timestamp
+        T_water_profiles_df = T_water_profiles_df.set_index('time').asfreq(f'{inputs["t_resolution"]}')       
+        T_water_profiles_df = T_water_profiles_df.interpolate(method='linear')
     
-    T_water_profiles_df = T_water_profiles_df.interpolate(method='linear')
+        # Calculating interquartiles. With a factor 3, we are less strict with outliers than the convention of 1.5
+        # With this, we want to account for extreme seawater temperature conditions that would otherwise be removed from the dataset
+        # The rolling quartiles over 30 time steps are calculated in one pass with rolling_quartiles, the outliers are compared with the quartiles of the whole profile.
+        T_quartile_low,T_quartile_high = rolling_quartiles(T_water_profiles_df.to_numpy(),30,inputs['outlier_chunk_size'])
+        mps = (T_quartile_high - T_quartile_low)*3 
+        
+        T_water = T_water_profiles_df.to_numpy()
+        outliers = ((T_water < T_water_profiles_df.quantile(0.25).to_numpy() - mps) |
+                    (T_water > T_water_profiles_df.quantile(0.75).to_numpy() + mps))
+        T_water_profiles_df = T_water_profiles_df.mask(outliers)
     
-    ## In some case, points don't have any data at all. If there are profiles solely consisting of NaN, they are removed from the dataset
+        T_water_profiles_df = T_water_profiles_df.interpolate(method='linear')
     
-    if nan_columns is None:
-        nan_columns = np.where(T_water_profiles_df.isna())
-    else:
-        pass
+        ## In some case, points don't have any data at all. If there are profiles solely consisting of NaN, they are removed from the dataset.
+        ## The removed sites are identified by their id, so that the warm seawater profiles can be cleaned with the sites removed from the cold ones.
     
-    T_water_profiles_df = T_water_profiles_df.drop(T_water_profiles_df.iloc[:,nan_columns[1]],axis=1)
-    T_water_profiles = np.array(T_water_profiles_df,dtype=np.float64)
+        if nan_sites is None:
+            nan_columns = np.flatnonzero(T_water_profiles_df.isna().any(axis=0).to_numpy())
+        else:
+            nan_columns = np.flatnonzero(np.isin(id_sites[0],nan_sites))
+    
+        T_water_profiles_df = T_water_profiles_df.drop(T_water_profiles_df.iloc[:,nan_columns],axis=1)
+        T_water_profiles = np.array(T_water_profiles_df,dtype=inputs['precision'])
     
     ## To assess OTEC's economic and technical performance under off-design conditions, we design the plants for different warm and cold seawater temperatures
     ## Using combinations of minimum, median, and maximum temperature, we assess a total of nine configurations. For example, the most conservative configuration is
@@ -205,56 +372,334 @@ def data_processing(files,sites_df,inputs,studied_region,new_path,water,nan_colu
     
     ## Here, we calculate the design temperatures from the cleaned datasets    
     
-    if water == 'CW':       
-        T_water_design = np.round(np.array([np.max(T_water_profiles_df,axis=0),
-                                            np.median(T_water_profiles_df,axis=0),
-                                            np.min(T_water_profiles_df,axis=0)]),1)
-    elif water == 'WW':
-        T_water_design = np.round(np.array([np.min(T_water_profiles_df,axis=0),
-                                            np.median(T_water_profiles_df,axis=0),
-                                            np.max(T_water_profiles_df,axis=0)]),1) 
-    else:
-        raise ValueError('Invalid input for seawater. Please select "CW" for cold deep seawater or "WW" for warm surface seawater.')
+    T_water_design = design_temperatures(T_water_profiles_df,inputs['design_percentiles'],water)
+    
+    nan_sites = id_sites[0,nan_columns]
+    
+    coordinates = np.delete(coordinates,nan_columns,axis=0)
+    dist_shore = np.delete(dist_shore,nan_columns,axis=1)
+    eff_trans = np.delete(eff_trans,nan_columns,axis=1)
+    id_sites = np.delete(id_sites,nan_columns,axis=1)
+    
+    ## The newly processed sites are appended to the stored ones. Stored sites that are no longer in sites_df are left out. Afterwards, all sites are sorted
+    ## in the order in which they were matched, so that the file is the same as if it had been processed from scratch.
+    
+    if stored is not None:
+        kept = np.isin(stored['id_sites'][0],sites_df['id'])
+        
+        T_water_profiles_df = pd.concat([stored['T_water_profiles'].loc[:,kept],T_water_profiles_df],axis=1)
+        T_water_design = np.concatenate([stored['T_water_design'][:,kept],T_water_design],axis=1)
+        coordinates = np.concatenate([stored['coordinates'][kept],coordinates])
+        dist_shore = np.concatenate([stored['dist_shore'][:,kept],dist_shore],axis=1)
+        eff_trans = np.concatenate([stored['eff_trans'][:,kept],eff_trans],axis=1)
+        id_sites = np.concatenate([stored['id_sites'][:,kept],id_sites],axis=1)
+        nan_sites = np.concatenate([stored['nan_sites'][np.isin(stored['nan_sites'],sites_df['id'])],nan_sites])
+        
+        order = np.argsort(pd.Index(id_matched).get_indexer(id_sites[0]),kind='stable')
         
-    coordinates = np.delete(coordinates,nan_columns[1],axis=0)
-    dist_shore = np.delete(dist_shore,nan_columns[1],axis=1)
-    inputs['dist_shore'] = dist_shore
-    eff_trans = np.delete(eff_trans,nan_columns[1],axis=1)
-    inputs['eff_trans'] = eff_trans
-    id_sites = np.delete(id_sites,nan_columns[1],axis=1)
+        T_water_profiles_df = T_water_profiles_df.iloc[:,order]
+        T_water_design = T_water_design[:,order]
+        coordinates = coordinates[order]
+        dist_shore = dist_shore[:,order]
+        eff_trans = eff_trans[:,order]
+        id_sites = id_sites[:,order]
+        
+        T_water_profiles = np.array(T_water_profiles_df,dtype=inputs['precision'])
+    
+    # we return a new inputs dictionary instead of changing the one passed by the caller
+    inputs = {**inputs, 'dist_shore': dist_shore, 'eff_trans': eff_trans}
+    
+    # the positions of the removed sites among all matched sites, which were stored before the site ids
+    nan_columns = np.flatnonzero(np.isin(id_matched,nan_sites))
     
     ## Here we store the cleaned datasets as h5 files so that it does not have to recalculated later.
     
-    year = inputs['date_start'][0:4]
+    with stage('HDF export'):
+        # an outdated binary copy of the profiles (see save_mapped_temperatures) is removed first, so that it is never used with a different h5 file
+        remove_mapped_temperatures(new_path + filename)
+        
+        T_water_profiles_df.to_hdf(new_path + filename,key='T_water_profiles',mode='w')
+        pd.DataFrame(T_water_design).to_hdf(new_path + filename,key='T_water_design')
+        pd.DataFrame(dist_shore).to_hdf(new_path + filename,key='dist_shore')
+        pd.DataFrame(eff_trans).to_hdf(new_path + filename,key='eff_trans')
+        pd.DataFrame(coordinates).to_hdf(new_path + filename,key='coordinates')
+        pd.DataFrame(nan_columns).to_hdf(new_path + filename,key='nan_columns')
+        pd.DataFrame(id_sites).to_hdf(new_path + filename,key='id_sites')
+        pd.DataFrame(nan_sites).to_hdf(new_path + filename,key='nan_sites')
+    
+        # the parameter hash is stored with the profiles, so that the file is only reused if it was processed with the same files and parameters
+        if parameter_hash is not None:
+            pd.Series([parameter_hash]).to_hdf(new_path + filename,key='parameter_hash')
+        # the data hash leaves out the sites, so that further sites can be appended to the file later
+        if data_hash is not None:
+            pd.Series([data_hash]).to_hdf(new_path + filename,key='data_hash')
     
-    filename = f'T_{round(depth,0)}m_{year}_{studied_region}.h5'.replace(" ","_")   
-    T_water_profiles_df.to_hdf(new_path + filename,key='T_water_profiles',mode='w')
-    pd.DataFrame(T_water_design).to_hdf(new_path + filename,key='T_water_design')
-    pd.DataFrame(dist_shore).to_hdf(new_path + filename,key='dist_shore')
-    pd.DataFrame(eff_trans).to_hdf(new_path + filename,key='eff_trans')
-    pd.DataFrame(coordinates).to_hdf(new_path + filename,key='coordinates')
-    pd.DataFrame(nan_columns[1]).to_hdf(new_path + filename,key='nan_columns')
-    pd.DataFrame(id_sites).to_hdf(new_path + filename,key='id_sites')
+    with stage('binary export',T_water_profiles=T_water_profiles):
+        save_mapped_temperatures(new_path + filename,T_water_profiles,T_water_design,coordinates,id_sites,inputs,T_water_profiles_df.index,nan_sites,parameter_hash,data_hash)
     
     print(f'Processing {filename} successful. h5 temperature profiles exported.\n')
             
-    return T_water_profiles, T_water_design, coordinates, id_sites, T_water_profiles_df.index, inputs, nan_columns
+    return T_water_profiles, T_water_design, coordinates, id_sites, T_water_profiles_df.index, inputs, nan_sites
         
+def processed_file(new_path,inputs,studied_region,water):
+    
+    # name of the h5 file with the processed temperature profiles, which is used both to write and to look up the file. Like the downloaded
+    # files, it is named after the inlet depth of the parameters, not the depth of the CMEMS layer stored in the netCDF files.
+    
+    if water not in ['CW','WW']:
+        raise ValueError('Invalid input for seawater. Please select "CW" for cold deep seawater or "WW" for warm surface seawater.')
+    
+    return os.path.join(new_path,f'T_{round(inputs[f"length_{water}_inlet"],0)}m_{inputs["date_start"][0:4]}_{studied_region}.h5'.replace(" ","_"))
+
+def temperature_profiles(files,sites_df,inputs,studied_region,new_path):
+    
+    ## The processed temperature profiles are only reused if they were processed from the same files, sites and parameters.
+    ## For this, we compare the parameter hash stored in the h5 files with the hash of the current run.
+    
+    h5_file_WW = processed_file(new_path,inputs,studied_region,'WW')
+    h5_file_CW = processed_file(new_path,inputs,studied_region,'CW')
+    
+    files_CW = files[int(len(files)/2):int(len(files))]
+    files_WW = files[0:int(len(files)/2)]
+    
+    hash_CW = parameter_hash(processing_parameters(inputs),file_fingerprint(files_CW),sites_df,'CW')
+    hash_WW = parameter_hash(processing_parameters(inputs),file_fingerprint(files_WW),sites_df,'WW',hash_CW)
+    
+    # the data hashes leave out the sites, so that sites missing in existing files are appended instead of processing all sites again
+    
+    data_hash_CW = parameter_hash(processing_parameters(inputs),file_fingerprint(files_CW),'CW')
+    data_hash_WW = parameter_hash(processing_parameters(inputs),file_fingerprint(files_WW),'WW',data_hash_CW)
+    
+    with stage('temperature processing CW') as record:
+        record['cached'] = stored_parameter_hash(h5_file_CW) == hash_CW
+        if record['cached']:
+            T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_sites_CW = load_temperatures(h5_file_CW, inputs)
+            print(f'{h5_file_CW} already exist. No processing necessary.')
+        else:
+            T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_sites_CW = data_processing(files_CW,sites_df,inputs,studied_region,new_path,'CW',parameter_hash=hash_CW,data_hash=data_hash_CW)
+    with stage('temperature processing WW') as record:
+        record['cached'] = stored_parameter_hash(h5_file_WW) == hash_WW
+        if record['cached']:
+            T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_sites_WW = load_temperatures(h5_file_WW, inputs)
+            print(f'{h5_file_WW} already exist. No processing necessary.')
+        else:
+            T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_sites_WW = data_processing(files_WW,sites_df,inputs,studied_region,new_path,'WW',nan_sites_CW,parameter_hash=hash_WW,data_hash=data_hash_WW)
+    
+    return T_CW_profiles, T_CW_design, T_WW_profiles, T_WW_design, coordinates_CW, id_sites, timestamp, inputs
+
+def multi_year_temperatures(cost_level,sites_df,inputs,studied_region,dl_path,new_path):
+    
+    ## With design_years, the seawater temperatures of several years are downloaded and processed one year after another. Only the profiles of the current year
+    ## are held in memory, and the design temperatures of every site are updated in a streaming sketch (see design_statistics.py). The off-design analysis
+    ## uses the profiles of the year given by date_start and date_end, which is also processed if it is not one of the design years. Sites without data
+    ## in one of the years are removed from all of them.
+    
+    year = int(inputs['date_start'][0:4])
+    percentiles = sorted(inputs['design_percentiles'])
+    
+    if len(percentiles) != 3:
+        raise ValueError('Please enter three design percentiles, e.g. [0,50,100] for minimum, median and maximum.')
+    
+    sketches = {}
+    id_design = None
+    
+    for design_year in sorted(set(inputs['design_years']) | {year}):
+        print(f'\n++ Processing seawater temperature data of {design_year} ++\n')
+        
+        inputs_year = {**inputs,
+                       'date_start': str(design_year) + inputs['date_start'][4:],
+                       'date_end': str(design_year) + inputs['date_end'][4:]}
+        
+        with stage('download'):
+            files = download_data(cost_level,inputs_year,studied_region,dl_path)
+        
+        T_CW_profiles, _, T_WW_profiles, _, coordinates, id_sites, timestamp, inputs_year = temperature_profiles(files,sites_df,inputs_year,studied_region,new_path)
+        
+        if design_year == year:
+            reference = [T_CW_profiles, T_WW_profiles, coordinates, id_sites, timestamp, inputs_year]
+        
+        if design_year not in inputs['design_years']:
+            continue
+        
+        # the sketches only keep the sites that had data in all previous years
+        
+        with stage('design statistics',T_CW_profiles=T_CW_profiles,T_WW_profiles=T_WW_profiles):
+            if id_design is None:
+                id_design = id_sites[0]
+                sketches = {water: design_sketch(percentiles,len(id_design),inputs['design_compression']) for water in ['CW','WW']}
+            
+            kept = np.isin(id_design,id_sites[0])
+            id_design = id_design[kept]
+            columns = pd.Index(id_sites[0]).get_indexer(id_design)
+            
+            for water,T_water_profiles in [('CW',T_CW_profiles),('WW',T_WW_profiles)]:
+                select_sites(sketches[water],kept)
+                update_sketch(sketches[water],T_water_profiles[:,columns])
+        
+        del T_CW_profiles, T_WW_profiles
+    
+    ## The profiles of the off-design year are reduced to the sites that have design temperatures, and the design temperatures to the sites of the off-design year
+    
+    T_CW_profiles, T_WW_profiles, coordinates, id_sites, timestamp, inputs_year = reference
+    
+    kept = np.isin(id_design,id_sites[0])
+    id_design = id_design[kept]
+    columns = pd.Index(id_sites[0]).get_indexer(id_design)
+    
+    T_CW_design = np.round(sketch_percentiles(select_sites(sketches['CW'],kept))[::-1],1)
+    T_WW_design = np.round(sketch_percentiles(select_sites(sketches['WW'],kept)),1)
+    
+    inputs = {**inputs,
+              'dist_shore': inputs_year['dist_shore'][:,columns],
+              'eff_trans': inputs_year['eff_trans'][:,columns]}
+    
+    return T_CW_profiles[:,columns], T_CW_design, T_WW_profiles[:,columns], T_WW_design, coordinates[columns], id_sites[:,columns], timestamp, inputs
+
+def design_temperatures(T_water_profiles,percentiles,water):
+    
+    ## The warm seawater design temperatures are sorted from low to high, the cold seawater ones from high to low, so that the first configuration is the most conservative.
+    ## Minimum, median and maximum are calculated directly, other percentiles are interpolated linearly between the temperatures.
+    
+    if len(percentiles) != 3:
+        raise ValueError('Please enter three design percentiles, e.g. [0,50,100] for minimum, median and maximum.')
+    
+    if water == 'CW':
+        percentiles = sorted(percentiles,reverse=True)
+    elif water == 'WW':
+        percentiles = sorted(percentiles)
+    else:
+        raise ValueError('Invalid input for seawater. Please select "CW" for cold deep seawater or "WW" for warm surface seawater.')
+    
+    statistics = {0: np.min, 50: np.median, 100: np.max}
+    
+    return np.round(np.array([statistics[percentile](T_water_profiles,axis=0) if percentile in statistics else np.percentile(T_water_profiles,percentile,axis=0)
+                              for percentile in percentiles],dtype=np.float64),1)
+
 def load_temperatures(file,inputs):
     
-    # If the h5 files for the cleaned seawater temperature data already exists, it is merely loaded with this function
+    ## If the h5 files for the cleaned seawater temperature data already exists, it is merely loaded with this function. If there is a binary copy
+    ## of the profiles, the profiles are memory-mapped from it instead, so that loading does not depend on the size of the region.
+    
+    if os.path.isfile(mapped_files(file)['metadata']):
+        return load_mapped_temperatures(file,inputs)
     
     T_water_profiles_df = pd.read_hdf(file,key='T_water_profiles')
     timestamp = T_water_profiles_df.index
-    T_water_profiles = np.array(T_water_profiles_df,dtype=np.float64)      
+    T_water_profiles = np.array(T_water_profiles_df,dtype=inputs['precision'])      
     T_water_design = np.array(pd.read_hdf(file,key='T_water_design'),dtype=np.float64)  
     
-    inputs['dist_shore'] = np.array(pd.read_hdf(file,key='dist_shore'),dtype=np.float64)   
-    inputs['eff_trans'] = np.array(pd.read_hdf(file,key='eff_trans'),dtype=np.float64)
+    inputs = {**inputs,
+              'dist_shore': np.array(pd.read_hdf(file,key='dist_shore'),dtype=np.float64),
+              'eff_trans': np.array(pd.read_hdf(file,key='eff_trans'),dtype=np.float64)}
     
     coordinates = np.array(pd.read_hdf(file,key='coordinates'),dtype=np.float64)
-    nan_columns = np.array(pd.read_hdf(file,key='nan_columns'),dtype=np.float64)
+    nan_sites = np.ravel(np.array(pd.read_hdf(file,key='nan_sites'),dtype=np.float64))
     
     id_sites = np.array(pd.read_hdf(file,key='id_sites'),dtype=np.float64)
      
-    return T_water_profiles, T_water_design, coordinates, id_sites, timestamp, inputs, nan_columns
\ No newline at end of file
+    return T_water_profiles, T_water_design, coordinates, id_sites, timestamp, inputs, nan_sites
+
+## Next to every h5 file, the profiles are stored as a raw .npy file in the precision of the run and the small site data (design temperatures, distance
+## to shore, transmission efficiency, coordinates and ids) in a second .npy file. The timestamp, the removed sites and the hashes are stored in a json file,
+## which is written last, so that the binary copy is only used if it was written completely. The profiles are memory-mapped read-only, the operating
+## system only reads the parts that are used, e.g. the sites of one block of the off-design analysis.
+
+site_rows = {'T_water_design': slice(0,3),'dist_shore': slice(3,4),'eff_trans': slice(4,5),'coordinates': slice(5,7),'id_sites': slice(7,8)}
+
+def mapped_files(file):
+    
+    base = os.path.splitext(file)[0]
+    
+    return {'profiles': base + '_profiles.npy','sites': base + '_sites.npy','metadata': base + '.json'}
+
+def save_mapped_temperatures(file,T_water_profiles,T_water_design,coordinates,id_sites,inputs,timestamp,nan_sites,parameter_hash,data_hash):
+    
+    files = mapped_files(file)
+    
+    np.save(files['profiles'],np.ascontiguousarray(T_water_profiles,dtype=inputs['precision']))
+    np.save(files['sites'],np.concatenate([T_water_design,inputs['dist_shore'],inputs['eff_trans'],np.transpose(coordinates),id_sites]).astype(np.float64))
+    
+    metadata = {'shape': list(np.shape(T_water_profiles)),
+                'dtype': str(np.dtype(inputs['precision'])),
+                'start': str(timestamp[0]) if len(timestamp) > 0 else None,
+                'periods': len(timestamp),
+                'frequency': timestamp.freqstr,
+                'index_name': timestamp.name,
+                'nan_sites': np.ravel(nan_sites).tolist(),
+                'parameter_hash': parameter_hash,
+                'data_hash': data_hash}
+    
+    with open(files['metadata'] + '.tmp','w') as metadata_file:
+        json.dump(metadata,metadata_file)
+    os.replace(files['metadata'] + '.tmp',files['metadata'])
+
+def remove_mapped_temperatures(file):
+    
+    for mapped_file in mapped_files(file).values():
+        if os.path.isfile(mapped_file):
+            os.remove(mapped_file)
+
+def load_mapped_temperatures(file,inputs):
+    
+    files = mapped_files(file)
+    
+    with open(files['metadata']) as metadata_file:
+        metadata = json.load(metadata_file)
+    
+    T_water_profiles = np.load(files['profiles'],mmap_mode='r')
+    if T_water_profiles.dtype != np.dtype(inputs['precision']):
+        T_water_profiles = np.array(T_water_profiles,dtype=inputs['precision'])
+    
+    sites = np.load(files['sites'])
+    
+    inputs = {**inputs,
+              'dist_shore': sites[site_rows['dist_shore']],
+              'eff_trans': sites[site_rows['eff_trans']]}
+    
+    timestamp = pd.date_range(start=metadata['start'],periods=metadata['periods'],freq=metadata['frequency'],name=metadata['index_name'])
+    
+    return (T_water_profiles, sites[site_rows['T_water_design']], np.ascontiguousarray(np.transpose(sites[site_rows['coordinates']])),
+            sites[site_rows['id_sites']], timestamp, inputs, np.array(metadata['nan_sites'],dtype=np.float64))
+
+def stored_temperatures(file,data_hash,site_ids):
+    
+    ## Returns the stored profiles and site data if the file was processed from the same data and parameters (data_hash) and at least one of its sites
+    ## is still requested. Otherwise, None is returned and all sites are processed from scratch.
+    
+    if data_hash is None or not os.path.isfile(file):
+        return None
+    try:
+        if pd.read_hdf(file,key='data_hash').iloc[0] != data_hash:
+            return None
+        stored = {key: np.array(pd.read_hdf(file,key=key),dtype=np.float64) for key in ['T_water_design','dist_shore','eff_trans','coordinates','id_sites']}
+        stored['nan_sites'] = np.ravel(np.array(pd.read_hdf(file,key='nan_sites'),dtype=np.float64))
+        stored['T_water_profiles'] = pd.read_hdf(file,key='T_water_profiles')
+    except KeyError:
+        return None
+    
+    if not np.any(np.isin(stored['id_sites'],site_ids)):
+        return None
+    
+    return stored
+
+def processing_parameters(inputs):
+    
+    # these are the parameters that the processed seawater temperature profiles depend on
+    
+    return {key: inputs[key] for key in ['date_start','date_end','time_origin','t_resolution','threshold_AC_DC','precision','design_percentiles']}
+
+def stored_parameter_hash(file):
+    
+    # returns the parameter hash stored with the processed temperature profiles, or None for missing files and files processed without a hash.
+    # Files without the ids of the removed sites were processed before they were stored and are processed again.
+    
+    if not os.path.isfile(file):
+        return None
+    if os.path.isfile(mapped_files(file)['metadata']):
+        with open(mapped_files(file)['metadata']) as metadata_file:
+            return json.load(metadata_file)['parameter_hash']
+    try:
+        pd.read_hdf(file,key='nan_sites')
+        return pd.read_hdf(file,key='parameter_hash').iloc[0]
+    except KeyError:
+        return None
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Saturation properties of ammonia from a precomputed lookup table on the 0.1 °C grid of the saturation temperatures
+"""
+
+import numpy as np
+from functools import lru_cache
+
+## The saturation temperatures of the nominal designs are rounded to 0.1 °C (see saturation_pressures_and_temperatures), so that the plant sizing
+## evaluates the same few hundred saturation states again for every site and configuration. Instead, we evaluate the equation of state once per 0.1 °C
+## on the range below and look the properties up. The saturation temperatures at part load are not rounded and lie between the grid points. With the
+## default ammonia_off_grid = 'equation', the time series of the NumPy operation are therefore evaluated with the equation of state, and the table is only
+## a cache for the sizing. With 'interpolation', they are interpolated in the table, which takes about five times as long as the polynomial fit
+## and only pays off for slow equations of state. The Numba kernel (operation_kernel.py) always interpolates in the table.
+
+T_sat_min = -10.0       # lowest saturation temperature of the lookup table in °C
+T_sat_max = 50.0        # highest saturation temperature of the lookup table in °C
+T_sat_step = 0.1        # resolution of the lookup table in °C, equal to the rounding of the nominal saturation temperatures
+
+properties = ['p','h_liq','h_vap','s_liq','s_vap']
+
+def polynomial_fit(T_sat,selected=properties):
+
+    ## Approximation functions from Excel, which pyOTEC uses from the start. Saturation pressure in bar, enthalpies in kJ/kg and entropies in kJ/kgK
+    ## of saturated liquid and vapour. Only the selected properties are calculated.
+
+    p = 0.00002196*T_sat**3+0.00193103*T_sat**2+0.1695763*T_sat+4.25739601
+
+    saturated_ammonia = {'p': p}
+
+    if 'h_liq' in selected:
+        saturated_ammonia['h_liq'] = -0.0235*p**4+0.9083*p**3-12.93*p**2+97.316*p-39.559
+
+    if 'h_vap' in selected or 's_liq' in selected or 's_vap' in selected:
+        log_p = np.log(p)
+        saturated_ammonia['h_vap'] = 28.276*log_p+1418.1
+        saturated_ammonia['s_liq'] = 0.3947*log_p+0.4644
+        saturated_ammonia['s_vap'] = -0.352*log_p+6.1284
+
+    return saturated_ammonia
+
+## Equations of state that can be selected with the parameter "ammonia_eos". A new equation of state only needs to return (at least) the selected
+## properties for an array of saturation temperatures in °C. Since it is only evaluated once per grid point, also slow equations of state (e.g. Helmholtz energy
+## formulations) keep the speed of the lookup table if ammonia_off_grid is set to 'interpolation'.
+
+equations_of_state = {
+    'polynomial': polynomial_fit,
+    }
+
+@lru_cache(maxsize=None)
+def property_table(equation_of_state):
+
+    ## The grid is built like np.round(T,1) rounds, so that the grid points are bitwise equal to the rounded saturation temperatures.
+    ## The last entry of the table is NaN and is looked up for NaN temperatures, i.e. for infeasible designs.
+
+    if equation_of_state not in equations_of_state:
+        raise ValueError(f'Invalid equation of state for ammonia. Please choose between {", ".join(equations_of_state.keys())}.')
+
+    k_min = int(round(T_sat_min/T_sat_step))
+    k_max = int(round(T_sat_max/T_sat_step))
+    T_grid = np.append(np.arange(k_min,k_max+1)/round(1/T_sat_step),np.nan)
+
+    table = equations_of_state[equation_of_state](T_grid,properties)
+    table = {key: np.array(table[key],dtype=np.float64) for key in properties}
+    for value in table.values():
+        value.setflags(write=False)
+
+    return k_min,k_max,table
+
+def saturated_ammonia(T_sat,inputs,selected=properties):
+
+    ## Returns the selected saturation properties for an array of saturation temperatures with the same shape and precision. With 'equation', the
+    ## equation of state is evaluated directly, since the saturation temperatures at part load do not lie on the grid. With 'interpolation', the
+    ## properties are looked up if all temperatures lie on the grid, and otherwise the whole array is interpolated, which is faster than splitting
+    ## it into grid points and other values.
+
+    T_sat = np.asarray(T_sat)
+    dtype = T_sat.dtype if T_sat.dtype in [np.float32,np.float64] else np.float64
+
+    if inputs['ammonia_off_grid'] == 'equation':
+        if inputs['ammonia_eos'] not in equations_of_state:
+            raise ValueError(f'Invalid equation of state for ammonia. Please choose between {", ".join(equations_of_state.keys())}.')
+        values = equations_of_state[inputs['ammonia_eos']](T_sat,selected)
+    elif inputs['ammonia_off_grid'] == 'interpolation':
+        k_min,k_max,_ = property_table(inputs['ammonia_eos'])
+        if on_grid(T_sat,k_min,k_max,sample=True) and on_grid(T_sat,k_min,k_max):
+            return tabulated_ammonia(T_sat,inputs,selected)
+        values = interpolated_properties(T_sat,inputs,selected)
+    else:
+        raise ValueError('Invalid fallback for saturation temperatures between the grid points. Please choose between "equation" and "interpolation".')
+
+    return {key: np.asarray(values[key],dtype=dtype) for key in selected}
+
+def tabulated_ammonia(T_sat,inputs,selected=properties):
+
+    ## Looks the properties up for temperatures that are rounded to 0.1 °C, like the nominal saturation temperatures. The temperatures are not checked
+    ## for the grid, only for the range of the table, because the check would cost as much as the lookup itself.
+
+    T_sat = np.asarray(T_sat)
+    dtype = T_sat.dtype if T_sat.dtype in [np.float32,np.float64] else np.float64
+
+    k_min,k_max,table = property_table(inputs['ammonia_eos'])
+
+    index = np.rint(T_sat*round(1/T_sat_step))
+
+    if np.size(index) > 0 and (np.fmin.reduce(index,axis=None) < k_min or np.fmax.reduce(index,axis=None) > k_max):
+        return {key: np.asarray(value,dtype=dtype) for key,value in equations_of_state[inputs['ammonia_eos']](T_sat,selected).items() if key in selected}
+
+    # NaN temperatures of infeasible designs point to the last entry of the table, which is NaN
+    index = np.nan_to_num(index,copy=False,nan=k_max+1)
+    index -= k_min
+    index = index.astype(np.intp)
+
+    return {key: np.asarray(np.take(table[key],index),dtype=dtype) for key in selected}
+
+def on_grid(T_sat,k_min,k_max,sample=False):
+
+    ## Checks whether all temperatures lie on the grid of the table. A few units in the last place are tolerated, which only matters if the temperatures
+    ## are stored as float32. NaN counts as on the grid. With sample=True, only a few thousand values are checked, so that time series at part load are
+    ## passed to the fallback without scanning them completely.
+
+    if sample:
+        T_sat = np.ravel(T_sat)[::max(1,np.size(T_sat)//4096)]
+
+    y = T_sat*round(1/T_sat_step)
+    index = np.rint(y)
+    dtype = T_sat.dtype if T_sat.dtype in [np.float32,np.float64] else np.float64
+
+    if np.size(y) == 0:
+        return True
+
+    return not (np.fmax.reduce(np.abs(y-index),axis=None) > 4*np.finfo(dtype).eps*max(abs(k_min),abs(k_max))
+                or np.fmin.reduce(index,axis=None) < k_min or np.fmax.reduce(index,axis=None) > k_max)
+
+def interpolated_properties(T_sat,inputs,selected=properties):
+
+    ## Cubic Lagrange interpolation between the four closest grid points, which is exact for the cubic saturation pressure and deviates by less than 1E-10
+    ## (relative) from the polynomial fit for the other properties. Temperatures outside of the table are evaluated with the equation of state.
+
+    k_min,k_max,table = property_table(inputs['ammonia_eos'])
+
+    y = T_sat*round(1/T_sat_step)
+    inside = (y >= k_min+1) & (y < k_max-2)
+
+    index = np.floor(np.where(inside,y,k_min+1))
+    t = np.where(inside,y,k_min+1) - index
+    index = (index-k_min).astype(np.intp)
+
+    weights = [-t*(t-1)*(t-2)/6, (t+1)*(t-1)*(t-2)/2, -(t+1)*t*(t-2)/2, (t+1)*t*(t-1)/6]
+
+    values = {key: sum([weight*np.take(table[key],index+offset-1) for offset,weight in enumerate(weights)]) for key in selected}
+
+    if not np.all(inside):
+        outside = equations_of_state[inputs['ammonia_eos']](T_sat[~inside],selected)
+        for key in selected:
+            values[key][~inside] = outside[key]
+
+    return values
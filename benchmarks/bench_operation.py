@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the off-design operation and the regulation of the heat exchangers
+"""
+
+import numpy as np
+import pytest
+
+from synthetic_profiles import synthetic_sites,synthetic_inputs
+from off_design_analysis import on_design_analysis
+from otec_operation import otec_operation
+from operation_kernel import numba_available
+from general_scripts import enthalpies_entropies
+from components_regulation import pressure_regulation,initial_NTU_and_epsilon,evaporator_regulation,condenser_regulation
+
+n_sites = [10,1000,pytest.param(50000,marks=pytest.mark.large)]
+n_time = [365,2920]
+backends = ['numpy',pytest.param('numba',marks=pytest.mark.skipif(not numba_available,reason='Numba is not installed'))]
+
+def nominal_plant(profiles,inputs):
+
+    # plants with the lowest LCOE for the median design temperatures, including CAPEX and OPEX that otec_operation needs for the LCOE
+
+    otec_plant_nom,_ = on_design_analysis(profiles['T_WW_design'][1],profiles['T_CW_design'][1],inputs,'low_cost')
+
+    return otec_plant_nom
+
+def regulation_inputs(profiles,inputs,otec_plant_nom):
+
+    ## Prepares the inputs of the heat exchanger regulation like otec_operation does, so that the regulation can be timed on its own
+
+    T_evap_ts,evaporator_ts = pressure_regulation(profiles['T_WW_profiles'],otec_plant_nom,inputs,'evap')
+    T_cond_ts,condenser_ts = pressure_regulation(profiles['T_CW_profiles'],otec_plant_nom,inputs,'cond')
+
+    _,epsilon_evap_initial = initial_NTU_and_epsilon(inputs,otec_plant_nom,'evap')
+    _,epsilon_cond_initial = initial_NTU_and_epsilon(inputs,otec_plant_nom,'cond')
+
+    enthalpies_ts = enthalpies_entropies(evaporator_ts,condenser_ts,inputs)
+
+    return T_evap_ts,T_cond_ts,epsilon_evap_initial,epsilon_cond_initial,enthalpies_ts
+
+@pytest.mark.parametrize('backend',backends)
+@pytest.mark.parametrize('time_steps',n_time)
+@pytest.mark.parametrize('sites',n_sites)
+def bench_otec_operation(measure,sites,time_steps,backend):
+
+    profiles = synthetic_sites(sites,time_steps)
+    inputs = synthetic_inputs(profiles,operation_backend=backend)
+    otec_plant_nom = nominal_plant(profiles,inputs)
+
+    # the first call compiles the Numba kernel (or loads it from the cache), so that compilation is not part of the timed rounds
+    otec_operation(otec_plant_nom,profiles['T_WW_profiles'],profiles['T_CW_profiles'],inputs)
+
+    measure(otec_operation,otec_plant_nom,profiles['T_WW_profiles'],profiles['T_CW_profiles'],inputs,sites=sites,time_steps=time_steps)
+
+@pytest.mark.parametrize('backend',backends)
+def bench_mixed_precision_operation(measure,backend):
+
+    ## float64 temperature profiles with precision = 'float32' are cast to float32 by otec_operation, so that the sanity checks apply the
+    ## float32 tolerance to float32 time series and do not raise a Warning. The results equal those of float32 profiles.
+
+    profiles = synthetic_sites(1000,365)
+    inputs = synthetic_inputs(profiles,precision='float32',operation_backend=backend)
+    otec_plant_nom = nominal_plant(profiles,inputs)
+
+    T_WW_profiles = profiles['T_WW_profiles'].astype(np.float64)
+    T_CW_profiles = profiles['T_CW_profiles'].astype(np.float64)
+
+    otec_plant_ts = measure(otec_operation,otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs,sites=1000,time_steps=365)
+    otec_plant_ts_float32 = otec_operation(otec_plant_nom,T_WW_profiles.astype(np.float32),T_CW_profiles.astype(np.float32),inputs)
+
+    assert otec_plant_ts['p_net'].dtype == np.float32
+    for key,value in otec_plant_ts_float32.items():
+        assert np.array_equal(np.asarray(otec_plant_ts[key]),np.asarray(value),equal_nan=True)
+
+@pytest.mark.parametrize('time_steps',n_time)
+@pytest.mark.parametrize('sites',n_sites)
+def bench_evaporator_regulation(measure,sites,time_steps):
+
+    profiles = synthetic_sites(sites,time_steps)
+    inputs = synthetic_inputs(profiles)
+    otec_plant_nom = nominal_plant(profiles,inputs)
+    T_evap_ts,_,epsilon_evap_initial,_,enthalpies_ts = regulation_inputs(profiles,inputs,otec_plant_nom)
+
+    measure(evaporator_regulation,enthalpies_ts,profiles['T_WW_profiles'],T_evap_ts,epsilon_evap_initial,inputs,otec_plant_nom,sites=sites,time_steps=time_steps)
+
+@pytest.mark.parametrize('time_steps',n_time)
+@pytest.mark.parametrize('sites',n_sites)
+def bench_condenser_regulation(measure,sites,time_steps):
+
+    profiles = synthetic_sites(sites,time_steps)
+    inputs = synthetic_inputs(profiles)
+    otec_plant_nom = nominal_plant(profiles,inputs)
+    T_evap_ts,T_cond_ts,epsilon_evap_initial,epsilon_cond_initial,enthalpies_ts = regulation_inputs(profiles,inputs,otec_plant_nom)
+    m_NH3_ts,_,_,_ = evaporator_regulation(enthalpies_ts,profiles['T_WW_profiles'],T_evap_ts,epsilon_evap_initial,inputs,otec_plant_nom)
+
+    measure(condenser_regulation,profiles['T_CW_profiles'],inputs,otec_plant_nom,m_NH3_ts,T_cond_ts,enthalpies_ts,epsilon_cond_initial,sites=sites,time_steps=time_steps)
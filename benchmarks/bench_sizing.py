@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the plant sizing and the nominal design
+"""
+
+import numpy as np
+import pytest
+
+from synthetic_profiles import synthetic_sites,synthetic_inputs
+from otec_sizing import otec_sizing,seawater_pipe_sizing,pipe_pressure_drop
+from off_design_analysis import on_design_analysis
+from capex_opex_lcoe import capex_opex_lcoe
+
+n_sites = [10,1000,pytest.param(50000,marks=pytest.mark.large)]
+
+# the nominal design is compared between both design grids at the sizes of real regions
+design_sites = [1000,pytest.param(20000,marks=pytest.mark.large),pytest.param(50000,marks=pytest.mark.large)]
+
+@pytest.mark.parametrize('sites',n_sites)
+def bench_otec_sizing(measure,sites):
+
+    # one pair of temperature differences for the median design temperatures
+
+    profiles = synthetic_sites(sites,365)
+    inputs = synthetic_inputs(profiles)
+
+    measure(otec_sizing,profiles['T_WW_design'][1],profiles['T_CW_design'][1],3.0,3.0,inputs,'low_cost',sites=sites)
+
+@pytest.mark.parametrize('design_grid',['broadcast','loop'])
+@pytest.mark.parametrize('sites',design_sites)
+def bench_on_design_analysis(measure,sites,design_grid):
+
+    profiles = synthetic_sites(sites,365)
+    inputs = synthetic_inputs(profiles,design_grid=design_grid)
+
+    measure(on_design_analysis,profiles['T_WW_design'][1],profiles['T_CW_design'][1],inputs,'low_cost',sites=sites)
+
+@pytest.mark.parametrize('sites',n_sites)
+def bench_capex_opex_lcoe(measure,sites):
+
+    profiles = synthetic_sites(sites,365)
+    inputs = synthetic_inputs(profiles)
+    otec_plant_nom = otec_sizing(profiles['T_WW_design'][1],profiles['T_CW_design'][1],3.0,3.0,inputs,'low_cost')
+
+    measure(capex_opex_lcoe,otec_plant_nom,inputs,'low_cost',sites=sites)
+
+@pytest.mark.parametrize('max_p',[100,60])
+def bench_bisected_pipe_sizing(measure,max_p):
+
+    ## The bisection searches the largest velocity below max_p, so it is never more than pipe_velocity_tol below the velocity of the stepped method.
+    ## With the default limits, both methods give the same plants. With a lower max_p, the nominal LCOE differs by less than the bound documented
+    ## next to pipe_sizing in parameters_and_constants.py (-1 % to +10 %).
+
+    profiles = synthetic_sites(1000,365)
+    inputs = {method: synthetic_inputs(profiles,pipe_sizing=method) for method in ['stepped','bisection']}
+    for method_inputs in inputs.values():
+        method_inputs['pipe_properties'] = method_inputs['pipe_properties'][:8] + [max_p]
+
+    m_water = np.linspace(1E3,6E5,10000)
+    T_in = np.tile([5.0,25.0],5000)
+    velocity = {method: m_water/1027/seawater_pipe_sizing(T_in,m_water,1027,1122,method_inputs)['A_pipes'] for method,method_inputs in inputs.items()}
+
+    assert np.all(velocity['bisection'] >= velocity['stepped'] - inputs['bisection']['pipe_velocity_tol'])
+    assert np.all(pipe_pressure_drop(T_in,m_water,1027,1122,inputs['bisection'],velocity['bisection']) < max_p)
+
+    stepped,_ = on_design_analysis(profiles['T_WW_design'][1],profiles['T_CW_design'][1],inputs['stepped'],'low_cost')
+    bisected,_ = measure(on_design_analysis,profiles['T_WW_design'][1],profiles['T_CW_design'][1],inputs['bisection'],'low_cost',sites=1000)
+
+    deviation = bisected['LCOE_nom']/stepped['LCOE_nom']-1
+    if max_p == 100:
+        assert np.array_equal(deviation,np.zeros_like(deviation))
+    assert np.all((deviation > -0.01) & (deviation < 0.1))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the start of pyOTEC, which guards that plotting, download, netCDF, HDF5 and Numba backends are only imported when they are used
+"""
+
+import os
+import sys
+import time
+import subprocess
+import pytest
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## These packages are only needed for downloading, reading netCDF files, exporting time series, the Numba backend or plotting. In the fresh interpreter,
+## importing them is blocked, so that the import of pyOTEC fails if one of them is imported at module level again.
+
+lazy_packages = ['cartopy','copernicusmarine','netCDF4','tables','numba','matplotlib','scipy']
+
+modules = ['pyOTEC','global_analysis','CMEMS_download_and_processing','off_design_analysis','otec_operation','time_series_storage']
+
+def start_interpreter(code):
+
+    subprocess.run([sys.executable,'-c',code],cwd=repository,check=True,capture_output=True)
+
+@pytest.mark.parametrize('module',modules)
+def bench_headless_import(benchmark,module):
+
+    blocked = ''.join(f'sys.modules[{package!r}] = None; ' for package in lazy_packages)
+    code = f'import sys; {blocked}import {module}'
+
+    try:
+        start_interpreter(code)
+    except subprocess.CalledProcessError as error:
+        pytest.fail(f'{module} imports a backend at module level:\n{error.stderr.decode()}')
+
+    # the start of an interpreter that only imports NumPy and pandas is the lower bound of the headless start
+    start = time.perf_counter()
+    start_interpreter('import numpy, pandas')
+    benchmark.extra_info['numpy_pandas_s'] = round(time.perf_counter()-start,3)
+
+    benchmark.pedantic(start_interpreter,args=(code,),rounds=5,iterations=1)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Shared settings of the benchmarks
+"""
+
+import os
+import sys
+import tracemalloc
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def measure(benchmark):
+
+    ## Peak memory is measured in a separate call with tracemalloc, because tracing slows down the timed rounds. Afterwards, the function is timed
+    ## and, unless the benchmarks are disabled, the throughput in site-timesteps per second (sites per second for the nominal design) is stored with the results, next to the peak memory.
+
+    def run(function,*args,sites,time_steps=1,**kwargs):
+
+        tracemalloc.start()
+        result = function(*args,**kwargs)
+        _,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rounds = max(3,min(20,int(2E6/(sites*time_steps))))
+        benchmark.pedantic(function,args=args,kwargs=kwargs,rounds=rounds,iterations=1)
+
+        benchmark.extra_info['sites'] = sites
+        benchmark.extra_info['time_steps'] = time_steps
+        # with --benchmark-disable, the function runs once without timing and there are no statistics
+        if benchmark.stats is not None:
+            benchmark.extra_info['site_timesteps_per_s'] = round(sites*time_steps/benchmark.stats.stats.median,1)
+        benchmark.extra_info['peak_memory_MB'] = round(peak/1024**2,1)
+
+        return result
+
+    return run
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic seawater temperature profiles for the benchmarks, so that they run without downloading CMEMS data
+"""
+
+import numpy as np
+from functools import lru_cache
+
+from parameters_and_constants import parameters_and_constants
+
+@lru_cache(maxsize=4)
+def synthetic_sites(n_sites,n_time,precision='float64',seed=0):
+
+    ## The profiles cover one year with n_time equidistant time steps (365 for daily, 2920 for 3-hourly data). The warm surface seawater has an
+    ## annual mean between 24 and 29 °C with a seasonal amplitude of 1 to 3 °C, the cold deep seawater a mean between 4 and 6 °C with an amplitude
+    ## of 0.1 to 0.3 °C. Both carry some random noise. The design temperatures, distances to shore and transmission efficiencies are derived
+    ## like in data_processing. The arrays are read-only, because the generated sites are shared by all benchmarks.
+
+    rng = np.random.default_rng(seed)
+    inputs = parameters_and_constants(-136000,'low_cost','CMEMS')
+
+    phase = 2*np.pi*np.arange(n_time)[:,np.newaxis]/n_time + rng.uniform(0,2*np.pi,(1,n_sites))
+
+    T_WW_profiles = rng.uniform(24,29,(1,n_sites)) + rng.uniform(1,3,(1,n_sites))*np.sin(phase) + rng.normal(0,0.2,(n_time,n_sites))
+    T_CW_profiles = rng.uniform(4,6,(1,n_sites)) + rng.uniform(0.1,0.3,(1,n_sites))*np.sin(phase) + rng.normal(0,0.05,(n_time,n_sites))
+
+    T_WW_design = np.round(np.array([np.min(T_WW_profiles,axis=0),np.median(T_WW_profiles,axis=0),np.max(T_WW_profiles,axis=0)]),1)
+    T_CW_design = np.round(np.array([np.max(T_CW_profiles,axis=0),np.median(T_CW_profiles,axis=0),np.min(T_CW_profiles,axis=0)]),1)
+
+    dist_shore = rng.uniform(5,150,(1,n_sites))
+    eff_trans = np.where(dist_shore <= inputs['threshold_AC_DC'],
+                         0.979-1*10**-6*dist_shore**2-9*10**-5*dist_shore,
+                         0.964-8*10**-5*dist_shore)
+
+    sites = {'T_WW_profiles': T_WW_profiles.astype(precision),
+             'T_CW_profiles': T_CW_profiles.astype(precision),
+             'T_WW_design': T_WW_design,
+             'T_CW_design': T_CW_design,
+             'dist_shore': dist_shore,
+             'eff_trans': eff_trans}
+
+    for value in sites.values():
+        value.setflags(write=False)
+
+    return sites
+
+def synthetic_inputs(sites,**parameters):
+
+    # parameters_and_constants with the distances and transmission efficiencies of the synthetic sites, further parameters can be overwritten
+
+    inputs = parameters_and_constants(-136000,'low_cost','CMEMS')
+
+    return {**inputs,'dist_shore': sites['dist_shore'],'eff_trans': sites['eff_trans'],**parameters}
@@ -7,6 +7,9 @@ Created on Wed Feb 22 10:56:12 2023
 
 import numpy as np
 
+# nominal plant values from which the costs are calculated
+cost_variables = ['p_gross_nom','p_pump_total_nom','p_net_nom','A_evap','A_cond','m_pipes_WW','m_pipes_CW']
+
 def capex_opex_lcoe(otec_plant_nom,inputs,cost_level='low_cost'):
     
     ## Unpack results from otec_steady_state
@@ -77,21 +80,23 @@ def capex_opex_lcoe(otec_plant_nom,inputs,cost_level='low_cost'):
     CAPEX_mooring = CAPEX_structure / 4 
     CAPEX_platform = 3* CAPEX_structure / 4 
     
+    # the costs are flattened so that the dictionary holds one value per site, independent of whether the arrays carry a leading axis
+    
     CAPEX_OPEX_dict = {
-    'turbine_CAPEX': CAPEX_turbine[0],
-    'evap_CAPEX': CAPEX_evap[0],
-    'cond_CAPEX': CAPEX_cond[0],
-    'pump_CAPEX': CAPEX_pump,
-    'pipes_CAPEX': CAPEX_pipes,
+    'turbine_CAPEX': np.ravel(CAPEX_turbine),
+    'evap_CAPEX': np.ravel(CAPEX_evap),
+    'cond_CAPEX': np.ravel(CAPEX_cond),
+    'pump_CAPEX': np.ravel(CAPEX_pump),
+    'pipes_CAPEX': np.ravel(CAPEX_pipes),
     # 'structure_CAPEX': CAPEX_structure[0],
-    'mooring_CAPEX': CAPEX_mooring[0],
-    'platform_CAPEX': CAPEX_platform[0],
-    'deploy_CAPEX': CAPEX_deploy[0],
-    'man_CAPEX': CAPEX_man[0],
-    'cable_CAPEX': CAPEX_cable[0],
-    'extra_CAPEX': CAPEX_extra[0],
-    'OPEX': OPEX[0],
-    'LCOE':LCOE_nom[0]
+    'mooring_CAPEX': np.ravel(CAPEX_mooring),
+    'platform_CAPEX': np.ravel(CAPEX_platform),
+    'deploy_CAPEX': np.ravel(CAPEX_deploy),
+    'man_CAPEX': np.ravel(CAPEX_man),
+    'cable_CAPEX': np.ravel(CAPEX_cable),
+    'extra_CAPEX': np.ravel(CAPEX_extra),
+    'OPEX': np.ravel(OPEX),
+    'LCOE':np.ravel(LCOE_nom)
 }
     # np.where(LCOE_nom < 0)
     # CAPEX_total[0,1061]
@@ -111,7 +116,13 @@ def capex_opex_lcoe(otec_plant_nom,inputs,cost_level='low_cost'):
 
 def lcoe_time_series(otec_plant_nom,inputs,p_net_ts):
     
-    p_net_mean = np.nanmean(p_net_ts,axis=0)
+    # the time axis is the second to last axis, leading axes (e.g. configurations) are kept. The mean is accumulated in float64 also for float32 time series.
+    # It is taken over a contiguous copy with the time series of every site in one row, because NumPy would otherwise choose the order of the
+    # summation depending on the number of sites, and the LCOE would differ in the last digits between runs with different site blocks.
+    p_net_by_site = np.array(np.moveaxis(p_net_ts,-2,-1),dtype=np.float64,order='C')
+    infeasible = np.isnan(p_net_by_site)
+    p_net_by_site[infeasible] = 0
+    p_net_mean = np.expand_dims(np.sum(p_net_by_site,axis=-1)/np.sum(~infeasible,axis=-1),-2)
     e_mean_annual = -p_net_mean*8760
     
     lcoe_ts = (otec_plant_nom['CAPEX']*inputs['crf']+otec_plant_nom['OPEX'])*100/(e_mean_annual*inputs['availability_factor'])
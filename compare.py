@@ -15,53 +15,8 @@ import os
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 
+from results_catalog import catalog_file,query_costs
 
-# Function to find files with a specific pattern
-def find_files(directory, pattern):
-    file_list=[]
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            if pattern in filename:
-                file_list.append(os.path.join(root, filename))
-    return file_list
-
-def selection_sort_with_indexes(arr_ini):
-    """sort the arr_ini by ascending order"""
-    n = len(arr_ini)
-    arr = arr_ini.copy()
-    indexes = list(range(n))
-
-    for i in range(n):
-        # Find the minimum element in the unsorted part of the list
-        min_idx = i
-        for j in range(i + 1, n):
-            if arr[j] < arr[min_idx]:
-                min_idx = j
-
-        # Swap the minimum element with the current element in the original list and index list
-        arr[i], arr[min_idx] = arr[min_idx], arr[i]
-        indexes[i], indexes[min_idx] = indexes[min_idx], indexes[i]
-
-    return arr, indexes
-
-def extract_variable_path(path,string_left,string_right):
-    """Extract a variable a bath between string_left and string_right"""
-    # Find the index of "2020_"
-    start_index = path.find(string_left)
-    n=len(string_left)
-
-    if start_index != -1:
-        # Start searching for "MW" after the "2020_" index
-        end_index = path.find(string_right, start_index)
-
-        if end_index != -1:
-            # Extract the number
-            extracted_number = float(path[start_index + n:end_index])
-    #     else:
-    #         print("No '_MW' found after '2020_'.")
-    # else:
-    #     print("No '2020_' found in the string.")
-    return extracted_number   
 
 def func_powerlaw(x, m, c, c0):
     """hyperbolic funtion for fitting the results"""
@@ -69,7 +24,7 @@ def func_powerlaw(x, m, c, c0):
 
 
 
-def compare_economics_locations(locations):
+def compare_economics_locations(locations,year=None,cost_level=None,file=catalog_file):
     """Compare the results at the locations specified in the list 'locations'"""
     all_pgross=[]
     all_pnet=[]
@@ -77,10 +32,11 @@ def compare_economics_locations(locations):
     all_lcoe=[]
     all_fit=[]
     
+    # the runs are read from the results catalog that pyOTEC fills, already sorted by gross power output
+    # LCOE and pipe CAPEX are taken from configuration 5 (median design temperatures) at the best location of each run
+    all_runs = query_costs(['LCOE','pipes_CAPEX'],5,region=locations,year=year,cost_level=cost_level,file=file)
+    
     for location in locations :
-        pattern_eco = "eco_details"
-        pattern_net = "net_power_profiles_per_location_"
-
 
         folder_name = "Comparison/" + location
 
@@ -91,48 +47,12 @@ def compare_economics_locations(locations):
         else:
             print(f"The '{folder_name}' folder already exists.")
 
-        # Find and list files of economic results and power
-        eco_details_files = find_files("Data_Results/"+location, pattern_eco)
-        pnet_files = find_files("Data_Results/"+location, pattern_net)
-
-
-        # folders = []
-        # for file in eco_details_files : 
-        #     position = file.find("/eco")
-        #     if position != -1:
-        #         # Remove everything after "/eco"
-        #         folders.append(file[:position+1])  # +1 to include "/" in the result
-                
-
-        list_pipe_CAPEX=[]
-        list_LCOE=[]
-        list_pgross=[]
-        list_best_LCOE_position=[]
-        for file in eco_details_files:
-            df=pd.read_csv(file,sep=';')
-            list_LCOE.append(df['LCOE'].to_numpy())
-            list_pipe_CAPEX.append(df['pipes_CAPEX'].to_numpy())
-            list_pgross.append(extract_variable_path(file,"2020_","_MW"))
-            list_best_LCOE_position.append(int(extract_variable_path(file,"_pos_","_index_")))
-            
-        list_pnet=[]
-        for i,file in enumerate(pnet_files):
-            pnet_df=pd.read_csv(file,sep=';')
-            pnet_list=pnet_df['p_net'].to_numpy()
-            list_pnet.append(-pnet_list[list_best_LCOE_position[i]]/1000)
-
-
-        med_LCOE = []
-        med_pipe_CAPEX = []
-        for i,sublist in enumerate(list_LCOE):
-            med_pipe_CAPEX.append(list_pipe_CAPEX[i][4])
-            med_LCOE.append(sublist[4])
-
+        runs = all_runs[all_runs['region'] == location]
 
-        sorted_pgross, indexes = selection_sort_with_indexes(list_pgross)
-        sorted_LCOE = [med_LCOE[i] for i in indexes]
-        sorted_pnet = [list_pnet[i] for i in indexes]
-        sorted_pipe_CAPEX = [med_pipe_CAPEX[i]/1e6 for i in indexes]
+        sorted_pgross = runs['p_gross'].tolist()
+        sorted_LCOE = runs['LCOE'].tolist()
+        sorted_pnet = runs['best_p_net'].tolist()
+        sorted_pipe_CAPEX = (runs['pipes_CAPEX']/1e6).tolist()
 
         all_pgross.append(sorted_pgross)
         all_pnet.append(sorted_pnet)
@@ -7,6 +7,7 @@ Created on Mon Feb 27 10:34:18 2023
 
 import numpy as np
 from general_scripts import pressure_drop
+from ammonia_properties import saturated_ammonia
 
 def pressure_regulation(T_water_profiles,otec_plant_nom,inputs,HX):
     
@@ -21,9 +22,10 @@ def pressure_regulation(T_water_profiles,otec_plant_nom,inputs,HX):
     else:
         raise ValueError('Invalid heat exchanger input. Please choose between "evap" and "cond".')
             
-    p_sat_ts = 0.00002196*T_sat_ts**3+0.00193103*T_sat_ts**2+0.1695763*T_sat_ts+4.25739601
+    # besides the saturation pressure, we return the saturation properties of ammonia that are needed for the enthalpies afterwards
+    saturated_ts = saturated_ammonia(T_sat_ts,inputs,['p','h_vap','s_vap'] if HX == 'evap' else ['p','h_liq','h_vap','s_liq','s_vap'])
         
-    return T_sat_ts,p_sat_ts
+    return T_sat_ts,saturated_ts
 
 def initial_NTU_and_epsilon(inputs,otec_plant_nom,HX):
     
@@ -39,38 +41,103 @@ def initial_NTU_and_epsilon(inputs,otec_plant_nom,HX):
     
     return NTU_initial,epsilon_initial
 
+def nominal_tolerance(values_ts):
+    
+    # float32 time series can exceed the nominal values by a few units in the last place, which the sanity checks tolerate. For float64, no tolerance is applied.
+    
+    return 0 if values_ts.dtype == np.float64 else 8*np.finfo(values_ts.dtype).eps
+
+def heat_exchanger_regulation(Q_ts,T_in_ts,T_sat_ts,T_out_initial,m_water_nom,U,A,active,inputs):
+    
+    ## At part load, the seawater mass flow through the heat exchanger depends on the seawater outlet temperature, and the outlet temperature
+    ## depends on the effectiveness of the heat exchanger at that mass flow. We solve for the outlet temperature x at which both agree, i.e.
+    ## g(x) = T_in - epsilon(x)*(T_in - T_sat) - x = 0. Only the elements flagged as active are solved, and each element stops iterating
+    ## as soon as its own update falls below the tolerance.
+    
+    shape = np.broadcast_shapes(np.shape(Q_ts),np.shape(T_in_ts),np.shape(T_sat_ts),np.shape(T_out_initial),np.shape(active))
+    mask = np.broadcast_to(active,shape)
+    
+    # the residuals are always evaluated in float64, also if the time series are stored with a lower precision
+    dtype = np.result_type(Q_ts,T_in_ts,T_sat_ts)
+    
+    T_out = np.array(np.broadcast_to(T_out_initial,shape),dtype=np.float64)
+    
+    Q = np.array(np.broadcast_to(Q_ts,shape)[mask],dtype=np.float64)
+    T_in = np.array(np.broadcast_to(T_in_ts,shape)[mask],dtype=np.float64)
+    T_sat = np.array(np.broadcast_to(T_sat_ts,shape)[mask],dtype=np.float64)
+    # NTU = U*(m_water/m_nom)**0.65*A/(m_water*cp) is written as NTU_coefficient*m_water**-0.35 to save one power per iteration
+    NTU_coefficient = np.array(np.broadcast_to(U*A/(m_water_nom**0.65*inputs['cp_water']),shape)[mask],dtype=np.float64)
+    x = T_out[mask]
+    
+    # positions of the unconverged elements; the working arrays are shrunk alongside, so that converged elements are no longer computed
+    todo = np.arange(np.size(x))
+    x_todo = x.copy()
+    
+    for iteration in range(inputs['regulation_max_iter']):
+        m_water = -Q/(inputs['cp_water']*(x_todo-T_in))
+        NTU = NTU_coefficient*m_water**-0.35
+        exp_NTU = np.exp(-NTU)
+        x_fixed_point = T_in-(1-exp_NTU)*(T_in-T_sat)
+        
+        if inputs['regulation_solver'] == 'newton':
+            # Since m_water ~ 1/(x-T_in) and NTU ~ m_water**-0.35, the derivative of NTU with respect to x is 0.35*NTU/(x-T_in)
+            g = x_fixed_point - x_todo
+            dg = -(T_in-T_sat)*exp_NTU*0.35*NTU/(x_todo-T_in) - 1
+            x_newton = x_todo - g/dg
+            # we fall back to the fixed-point update where the Newton step is undefined or crosses the seawater inlet temperature
+            x_new = np.where(np.isfinite(x_newton) & ((x_newton-T_in)*(x_todo-T_in) > 0), x_newton, x_fixed_point)
+        elif inputs['regulation_solver'] == 'fixed_point':
+            x_new = x_fixed_point
+        else:
+            raise ValueError('Invalid regulation solver. Valid inputs are "newton" and "fixed_point"')
+            
+        x[todo] = x_new
+        unconverged = abs(x_new - x_todo) > inputs['regulation_tol']
+        
+        todo = todo[unconverged]
+        if todo.size == 0:
+            break
+        
+        x_todo = x_new[unconverged]
+        Q = Q[unconverged]
+        T_in = T_in[unconverged]
+        T_sat = T_sat[unconverged]
+        NTU_coefficient = NTU_coefficient[unconverged]
+    else:
+        print(f'Heat exchanger regulation did not converge for {todo.size} elements after {inputs["regulation_max_iter"]} iterations.')
+    
+    T_out[mask] = x
+    m_water_ts = -np.broadcast_to(Q_ts,shape)/(inputs['cp_water']*(T_out-np.broadcast_to(T_in_ts,shape)))
+    
+    return T_out.astype(dtype,copy=False),m_water_ts.astype(dtype,copy=False)
+
 def evaporator_regulation(enthalpies_ts,T_WW_profiles,T_evap_ts,epsilon_evap_initial,inputs,otec_plant_nom):
     
     T_WW_out_initial = T_WW_profiles - epsilon_evap_initial * (T_WW_profiles - T_evap_ts)
        
     m_NH3_initial = (-otec_plant_nom['m_WW_nom']*inputs['cp_water']*(T_WW_out_initial-T_WW_profiles)/(enthalpies_ts['h_3']-enthalpies_ts['h_2']))
     
+    # The booleans have the precision of the time series, so that multiplying with them does not promote float32 time series to float64
+    dtype = m_NH3_initial.dtype
+    
     # This boolean determines whether ammonia mass flow is restricted by turbine limitations
-    bool_turb = np.where(m_NH3_initial*(enthalpies_ts['h_4']-enthalpies_ts['h_3']) < otec_plant_nom['p_gross_nom'],1,0)
+    bool_turb = np.where(m_NH3_initial*(enthalpies_ts['h_4']-enthalpies_ts['h_3']) < otec_plant_nom['p_gross_nom'],1,0).astype(dtype)
     # This boolean determines whether ammonia mass flow is restricted by condenser limitations
-    bool_cond = np.where((bool_turb == 0) & (m_NH3_initial*(enthalpies_ts['h_1']-enthalpies_ts['h_4']) < otec_plant_nom['Q_cond_nom']),1,0)
+    bool_cond = np.where((bool_turb == 0) & (m_NH3_initial*(enthalpies_ts['h_1']-enthalpies_ts['h_4']) < otec_plant_nom['Q_cond_nom']),1,0).astype(dtype)
     # This boolean determines whether ammonia mass flow is restricted by evaporator limitations
-    bool_evap = np.where((bool_turb == 0) & (m_NH3_initial*(enthalpies_ts['h_1']-enthalpies_ts['h_4']) >= otec_plant_nom['Q_cond_nom']),1,0)  
+    bool_evap = np.where((bool_turb == 0) & (m_NH3_initial*(enthalpies_ts['h_1']-enthalpies_ts['h_4']) >= otec_plant_nom['Q_cond_nom']),1,0).astype(dtype)  
     
     m_NH3_turb = otec_plant_nom['m_NH3_nom']
     Q_evap_turb = m_NH3_turb*(enthalpies_ts['h_3']-enthalpies_ts['h_2'])
-    T_WW_out_turb_iteration = T_WW_out_initial
-    difference = np.ones(np.size(bool_turb))
     
-    while np.any(abs(difference) > 1E-7):
-        T_WW_out_turb = T_WW_out_turb_iteration
-        m_WW_turb = -Q_evap_turb/(inputs['cp_water']*(T_WW_out_turb-T_WW_profiles))
-        u_evap_turb = inputs['U_evap']*(m_WW_turb/otec_plant_nom['m_WW_nom'])**0.65
-        NTU_evap_turb = u_evap_turb*otec_plant_nom['A_evap']/(m_WW_turb*inputs['cp_water'])
-        epsilon_evap_turb = 1-np.exp(-NTU_evap_turb)
-        T_WW_out_turb_iteration = T_WW_profiles-epsilon_evap_turb*(T_WW_profiles-T_evap_ts)
-        difference = T_WW_out_turb_iteration - T_WW_out_turb
-    T_WW_out_turb = T_WW_out_turb_iteration
+    # Only the turbine-limited elements need to be solved. For all others, the turbine-limited values are multiplied by zero further below.
+    T_WW_out_turb,m_WW_turb = heat_exchanger_regulation(Q_evap_turb,T_WW_profiles,T_evap_ts,T_WW_out_initial,
+                                                        otec_plant_nom['m_WW_nom'],inputs['U_evap'],otec_plant_nom['A_evap'],bool_turb == 1,inputs)
     
     
     # Here we make sure that the condenser heat flow does not exceed the nominal design value
     m_NH3_target = otec_plant_nom['Q_cond_nom']/(enthalpies_ts['h_1']-enthalpies_ts['h_4'])
-    m_NH3_cond = np.ones(np.shape(m_NH3_target),dtype=np.float64)*otec_plant_nom['m_NH3_nom']   
+    m_NH3_cond = np.ones(np.shape(m_NH3_target),dtype=dtype)*otec_plant_nom['m_NH3_nom']   
     m_NH3_cond[m_NH3_target <= otec_plant_nom['m_NH3_nom']] = m_NH3_target[m_NH3_target <= otec_plant_nom['m_NH3_nom']]
  
     m_WW_cond = otec_plant_nom['m_WW_nom']
@@ -89,21 +156,26 @@ def evaporator_regulation(enthalpies_ts,T_WW_profiles,T_evap_ts,epsilon_evap_ini
     T_WW_out_ts = T_WW_out_turb*bool_turb + T_WW_out_cond*bool_cond + T_WW_out_evap*bool_evap
     Q_evap_ts = Q_evap_turb*bool_turb + Q_evap_cond*bool_cond + Q_evap_evap*bool_evap
     
-    # Sanity check whether regulated values do not exceed nominal design values
+    evaporator_sanity_check(m_NH3_ts,m_WW_ts,Q_evap_ts,T_WW_out_ts,T_evap_ts,otec_plant_nom,inputs)
+        
+    return m_NH3_ts,m_WW_ts,T_WW_out_ts,Q_evap_ts
+
+def evaporator_sanity_check(m_NH3_ts,m_WW_ts,Q_evap_ts,T_WW_out_ts,T_evap_ts,otec_plant_nom,inputs):
+    
+    # Sanity check whether regulated values do not exceed nominal design values. The time axis is the second to last axis, so that the check
+    # also holds when several configurations are simulated at once along a leading axis.
     
-    if np.any(np.round(np.amax(m_NH3_ts, axis=0),1) > np.round(otec_plant_nom['m_NH3_nom'],1)):
+    if np.any(np.round(np.amax(m_NH3_ts, axis=-2, keepdims=True),1) > np.round(otec_plant_nom['m_NH3_nom']*(1+nominal_tolerance(m_NH3_ts)),1)):
         raise Warning('Ammonia mass flow exceeds nominal design value.')
         
-    if np.any(np.round(np.amax(m_WW_ts, axis=0),1) > np.round(otec_plant_nom['m_WW_nom'],1)):
+    if np.any(np.round(np.amax(m_WW_ts, axis=-2, keepdims=True),1) > np.round(otec_plant_nom['m_WW_nom']*(1+nominal_tolerance(m_WW_ts)),1)):
         raise Warning('Warm seawater mass flow exceeds nominal design value.')
 
-    if np.any(np.round(np.amax(Q_evap_ts, axis=0),1) > np.round(otec_plant_nom['Q_evap_nom'],1)):
+    if np.any(np.round(np.amax(Q_evap_ts, axis=-2, keepdims=True),1) > np.round(otec_plant_nom['Q_evap_nom']*(1+nominal_tolerance(Q_evap_ts)),1)):
         raise Warning('Evaporator heat flow exceeds nominal design value.')
         
-    if np.any(np.round(np.amin(T_WW_out_ts - T_evap_ts, axis=0),1) < np.round(inputs['T_pinch_WW'],1)):
+    if np.any(np.round(np.amin(T_WW_out_ts - T_evap_ts, axis=-2, keepdims=True),1) < np.round(inputs['T_pinch_WW'],1)):
         raise Warning('Warm water pinch temperature below nominal design value.')
-        
-    return m_NH3_ts,m_WW_ts,T_WW_out_ts,Q_evap_ts
 
 
 def condenser_regulation(T_CW_profiles,inputs,otec_plant_nom,m_NH3_ts,T_cond_ts,enthalpies_ts,epsilon_cond_initial):
@@ -112,30 +184,22 @@ def condenser_regulation(T_CW_profiles,inputs,otec_plant_nom,m_NH3_ts,T_cond_ts,
     
     Q_cond_ts = m_NH3_ts*(enthalpies_ts['h_1'] - enthalpies_ts['h_4'])
     
-    m_CW_ts = otec_plant_nom['m_CW_nom']
-    T_CW_out_ts = T_CW_out_initial
-    T_CW_out_iteration = T_CW_out_initial
-    difference = np.ones(np.size(T_CW_out_initial))
-    
-    while np.any(abs(difference) > 1E-7):
-        T_CW_out_ts = T_CW_out_iteration
-        m_CW_ts = -Q_cond_ts/(inputs['cp_water']*(T_CW_out_ts-T_CW_profiles))
-        u_cond_ts = inputs['U_cond']*(m_CW_ts/otec_plant_nom['m_CW_nom'])**0.65
-        NTU_cond_ts = u_cond_ts*otec_plant_nom['A_cond']/(m_CW_ts*inputs['cp_water'])
-        epsilon_cond_ts = 1-np.exp(-NTU_cond_ts)
-        T_CW_out_iteration = T_CW_profiles-epsilon_cond_ts*(T_CW_profiles-T_cond_ts)
-        difference = T_CW_out_iteration - T_CW_out_ts
-    T_CW_out_ts = T_CW_out_iteration
+    T_CW_out_ts,m_CW_ts = heat_exchanger_regulation(Q_cond_ts,T_CW_profiles,T_cond_ts,T_CW_out_initial,
+                                                    otec_plant_nom['m_CW_nom'],inputs['U_cond'],otec_plant_nom['A_cond'],True,inputs)
+    
+    condenser_sanity_check(Q_cond_ts,T_CW_out_ts,T_cond_ts,otec_plant_nom,inputs)
+    
+    return T_CW_out_ts,m_CW_ts,Q_cond_ts
+
+def condenser_sanity_check(Q_cond_ts,T_CW_out_ts,T_cond_ts,otec_plant_nom,inputs):
     
     # Sanity check whether regulated values do not exceed nominal design values
     
-    if np.any(np.round(np.amin(Q_cond_ts, axis=0),1) < np.round(otec_plant_nom['Q_cond_nom'],1)):
+    if np.any(np.round(np.amin(Q_cond_ts, axis=-2, keepdims=True),1) < np.round(otec_plant_nom['Q_cond_nom']*(1+nominal_tolerance(Q_cond_ts)),1)):
         raise Warning('Condenser heat flow exceeds nominal design value.')
 
-    if np.any(np.round(np.amin(T_cond_ts - T_CW_out_ts, axis=0),1) < np.round(inputs['T_pinch_WW'],1)):
+    if np.any(np.round(np.amin(T_cond_ts - T_CW_out_ts, axis=-2, keepdims=True),1) < np.round(inputs['T_pinch_WW'],1)):
         raise Warning('Cold water pinch temperatire below nominal design value.')
-    
-    return T_CW_out_ts,m_CW_ts,Q_cond_ts
 
 def seawater_pipes_operation(otec_plant_nom,inputs,m_water_ts,t_water_in,rho_water,length,A_pipes,d_pipes,roughness_pipe,K_L,u_HX):
     
@@ -8,12 +8,101 @@ File containing various functions producing graphs for results visualization
 """
 
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import os
-import cartopy.crs as ccrs
+import json
+import inspect
+from concurrent.futures import ProcessPoolExecutor,as_completed
 
 import cost_analysis as ca
+from result_cache import parameter_hash
 
+## Every figure is described by the function that draws it, the png file and the data it shows. The figures are collected in a list (e.g. by
+## details_figures) and rendered together with render_figures, which draws them in a process pool on the non-interactive Agg backend.
+## The hash of the data and of the drawing function is stored for every png file in a manifest in the same folder, so that figures whose data
+## has not changed since the last rendering are skipped.
+
+figure_dpi = 200
+manifest_name = 'figures_manifest.json'
+
+def figure(function,file,**data):
+
+    return {'function': function,'file': file,'data': data}
+
+def figure_hash(job):
+
+    # the source code of the drawing function is part of the hash, so that changed figures are rendered again
+
+    return parameter_hash(job['function'].__name__,inspect.getsource(job['function']),job['data'],figure_dpi)
+
+def use_agg():
+
+    matplotlib.use('Agg')
+
+def draw_figure(function,file,data):
+
+    function(file,**data)
+
+    return file
+
+def read_manifest(directory):
+
+    file = os.path.join(directory,manifest_name)
+    if not os.path.isfile(file):
+        return {}
+    with open(file) as manifest_file:
+        return json.load(manifest_file)
+
+def write_manifest(directory,manifest):
+
+    file = os.path.join(directory,manifest_name)
+    with open(file + '.tmp','w') as manifest_file:
+        json.dump(manifest,manifest_file,indent=1,sort_keys=True)
+    os.replace(file + '.tmp',file)
+
+def render_figures(figures,workers=None):
+
+    ## Renders all figures whose hash differs from the one in the manifest or whose png file is missing. With more than one figure to render, they are
+    ## drawn in up to "workers" processes (default: one per CPU). The manifests are updated with the rendered figures, also if one of them fails.
+
+    manifests = {}
+    pending = []
+    for job in figures:
+        directory,filename = os.path.split(os.path.abspath(job['file']))
+        if directory not in manifests:
+            os.makedirs(directory,exist_ok=True)
+            manifests[directory] = read_manifest(directory)
+        job = {**job,'directory': directory,'filename': filename,'hash': figure_hash(job)}
+        if manifests[directory].get(filename) != job['hash'] or not os.path.isfile(job['file']):
+            pending.append(job)
+
+    workers = min(len(pending),workers or os.cpu_count() or 1)
+    rendered = []
+
+    try:
+        if workers <= 1:
+            # like in the worker processes, the figures are drawn on the non-interactive backend
+            if pending:
+                use_agg()
+            for job in pending:
+                draw_figure(job['function'],job['file'],job['data'])
+                rendered.append(job)
+        else:
+            with ProcessPoolExecutor(max_workers=workers,initializer=use_agg) as executor:
+                futures = {executor.submit(draw_figure,job['function'],job['file'],job['data']): job for job in pending}
+                for future in as_completed(futures):
+                    future.result()
+                    rendered.append(futures[future])
+    finally:
+        for job in rendered:
+            manifests[job['directory']][job['filename']] = job['hash']
+        for directory in {job['directory'] for job in rendered}:
+            write_manifest(directory,manifests[directory])
+
+    print(f'{len(rendered)} figures rendered, {len(figures)-len(pending)} unchanged figures skipped.')
+
+    return [job['file'] for job in rendered]
 
 
 
@@ -35,16 +124,25 @@ def plot_capex_opex(new_path, capex_opex_comparison, sites, p_gross,studied_regi
         pass
     else:
         os.makedirs(new_path+'/Details')
-    
-    # plot_details(new_path,T_WW,T_CW,labels,array_plot_cost,cost_dict,keys,array_CAPEX_percentage)
-    bar_plot(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross)
-    
+
+    figures = []
+    # figures += details_figures(new_path,T_WW,T_CW,labels,array_plot_cost,cost_dict,keys,array_CAPEX_percentage)
+    figures += bar_plot_figures(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross)
+    render_figures(figures)
+
     return cost_dict,best_LCOE_location_index
 
 
 
 def bar_plot(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross):
     """Plot the median costs and percentages on a bar plot"""
+    return render_figures(bar_plot_figures(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross))
+
+def bar_plot_figures(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross):
+    return [figure(draw_bar_plot,new_path+f'med_bar_{-p_gross}kW.png',cost_dict=cost_dict,array_CAPEX_percentage=array_CAPEX_percentage,
+                   T_WW=T_WW,T_CW=T_CW,p_gross=p_gross)]
+
+def draw_bar_plot(file,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross):
 
     categories = ['Thermodynamics', 'Pipes', 'Structure', 'Other']
     components = [['turbine_CAPEX', 'evap_CAPEX', 'cond_CAPEX', 'pump_CAPEX'],
@@ -122,7 +220,7 @@ def bar_plot(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross):
         for j, value in enumerate(percentage_t[i]):
             if value > 0:
                 num_color += 1
-                
+
                 ax2.text(x[j], bottom_values_percentage[i][j] + value / 2, component_array[j][i] +
                          ' ' + str(round(cost_t[i][j], 1)) + 'M\$', ha='center', va='center', zorder=10)
 
@@ -131,9 +229,9 @@ def bar_plot(new_path,cost_dict,array_CAPEX_percentage,T_WW,T_CW,p_gross):
     plt.title(f'Warm water at {T_WW[1]}$^\circ$C and Cold water at {T_CW[1]}$^\circ$C'+"\n" + f"Gross power = {p_gross/-1000}MW" +
               "\n" + f"Total CAPEX={round(total_cost,0)}M\$  LCOE={round(cost_dict['LCOE'][4],2)} ct/kWh")
     # {round(total_CAPEX[4]/1e6,0)}
-    plt.savefig(new_path+f'med_bar_{-p_gross}kW.png', dpi=200, bbox_inches='tight')
+    plt.savefig(file, dpi=figure_dpi, bbox_inches='tight')
     plt.close()
-    
+
 
 def plot_average_LCOE_on_map(capex_opex_comparison, sites):
     """Not working yet, the structure of the data should be :
@@ -142,6 +240,9 @@ def plot_average_LCOE_on_map(capex_opex_comparison, sites):
         with masked values when there is land or when the water depth is too low.
         We can maybe consider going back to the initial latitude and longitude data to put a mask
     """
+    # cartopy is only needed for the map and is therefore imported here
+    import cartopy.crs as ccrs
+    
     LCOE = ca.extract_LCOE(capex_opex_comparison)
     average_LCOE = ca.average_LCOE_location(LCOE)
     # id=sites.index.values
@@ -169,34 +270,46 @@ def plot_average_LCOE_on_map(capex_opex_comparison, sites):
 def plot_details(new_path,T_WW,T_CW,labels,array_plot_cost,cost_dict,keys,array_CAPEX_percentage):
     """Creates 9 plots for each of the 9 configuration of cold and warm water considered
         with the cost in dollars and the percentage in total capex"""
+    return render_figures(details_figures(new_path,T_WW,T_CW,labels,array_plot_cost,cost_dict,keys,array_CAPEX_percentage))
+
+def details_figures(new_path,T_WW,T_CW,labels,array_plot_cost,cost_dict,keys,array_CAPEX_percentage):
+    figures = []
     index=0
     for i,t_ww in enumerate(T_WW):
         for j,t_cw in enumerate(T_CW):
+            title = f'Warm water at {t_ww}$^\circ$C and Cold water at {t_cw}$^\circ$C'+"\n"+f"LCOE={round(cost_dict['LCOE'][index],2)} ct/kWh"
 
             """Plot the raw costs in dollars"""
-            plt.figure()
-            plt.ylabel('Cost [\$]')
-            plt.title(f'Warm water at {t_ww}$^\circ$C and Cold water at {t_cw}$^\circ$C'+"\n"+f"LCOE={round(cost_dict['LCOE'][index],2)} ct/kWh")
-            plt.bar(labels,array_plot_cost[index])
-            plt.xticks(rotation=30, ha='right')
-            plt.savefig(new_path+'/Details/'+f'costs_{i}_{j}.png',dpi=200, bbox_inches='tight')
-            plt.close()
+            figures.append(figure(draw_detail,new_path+'/Details/'+f'costs_{i}_{j}.png',
+                                  ylabel='Cost [\$]',title=title,labels=labels,values=array_plot_cost[index]))
 
             """Plot the percentage of total capex"""
-            plt.figure()
-            plt.ylabel('Percentage of total capex [%]')
-            plt.title(f'Warm water at {t_ww}$^\circ$C and Cold water at {t_cw}$^\circ$C'+"\n"+f"LCOE={round(cost_dict['LCOE'][index],2)} ct/kWh")
-            plt.bar(keys,array_CAPEX_percentage[index])
-            plt.xticks(rotation=30, ha='right')
-            plt.savefig(new_path+'/Details/'+f'capex_percentage{i}_{j}.png',dpi=200, bbox_inches='tight')
-            plt.close()
+            figures.append(figure(draw_detail,new_path+'/Details/'+f'capex_percentage{i}_{j}.png',
+                                  ylabel='Percentage of total capex [%]',title=title,labels=keys,values=array_CAPEX_percentage[index]))
 
             index +=1
+    return figures
+
+def draw_detail(file,ylabel,title,labels,values):
+    plt.figure()
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.bar(labels,values)
+    plt.xticks(rotation=30, ha='right')
+    plt.savefig(file,dpi=figure_dpi, bbox_inches='tight')
+    plt.close()
 
 
 
 def plot_config_159(new_path,labels,array_plot_cost,cost_dict,best_longitude,best_latitude):
     """Same plots but with the configurations 1, 5 and 9 (best, median and worst) to compare them"""
+    return render_figures(config_159_figures(new_path,labels,array_plot_cost,cost_dict,best_longitude,best_latitude))
+
+def config_159_figures(new_path,labels,array_plot_cost,cost_dict,best_longitude,best_latitude):
+    return [figure(draw_config_159,new_path+f'costs_min_max_med.png',labels=labels,array_plot_cost=array_plot_cost,cost_dict=cost_dict,
+                   best_longitude=best_longitude,best_latitude=best_latitude)]
+
+def draw_config_159(file,labels,array_plot_cost,cost_dict,best_longitude,best_latitude):
     X = np.arange(len(labels))
     plt.figure()
     plt.ylabel('Cost [\$]')
@@ -210,14 +323,20 @@ def plot_config_159(new_path,labels,array_plot_cost,cost_dict,best_longitude,bes
     plt.legend()
     plt.title(
         f'Costs at best location : Longitude {best_longitude} / Latitude {best_latitude}')
-    plt.savefig(new_path+f'costs_min_max_med.png',
-                dpi=200, bbox_inches='tight')
+    plt.savefig(file,
+                dpi=figure_dpi, bbox_inches='tight')
     plt.close()
-    
-    
-    
+
+
+
 def plot_percentage_159(keys,array_CAPEX_percentage,cost_dict,new_path):
     """Plots percentages with the configurations 1, 5 and 9 (best, median and worst) to compare them"""
+    return render_figures(percentage_159_figures(keys,array_CAPEX_percentage,cost_dict,new_path))
+
+def percentage_159_figures(keys,array_CAPEX_percentage,cost_dict,new_path):
+    return [figure(draw_percentage_159,new_path+f'percentage_min_max_med.png',keys=keys,array_CAPEX_percentage=array_CAPEX_percentage,cost_dict=cost_dict)]
+
+def draw_percentage_159(file,keys,array_CAPEX_percentage,cost_dict):
     X_percentage = np.arange(len(keys))
     plt.figure()
     plt.ylabel('Percentage of total capex [%]')
@@ -229,12 +348,12 @@ def plot_percentage_159(keys,array_CAPEX_percentage,cost_dict,new_path):
             label='High $\Delta$T ' + f"LCOE={round(cost_dict['LCOE'][-1],2)} ct/kWh")
     plt.xticks(X_percentage + 0.25, keys, rotation=30, ha='right')
     plt.legend()
-    plt.savefig(new_path+f'percentage_min_max_med.png',
-                dpi=200, bbox_inches='tight')
+    plt.savefig(file,
+                dpi=figure_dpi, bbox_inches='tight')
     plt.close()
-    
-    
-    
+
+
+
 # def camembert_plot(new_path,cost_t,cost_sorted,labels,array_plot_cost,T_WW,T_CW,p_gross,cost_dict):
 #     size=4
 #     # normalizing data to 2 pi
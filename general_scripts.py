@@ -6,6 +6,7 @@ Created on Wed Feb 22 11:57:49 2023
 """
 
 import numpy as np
+from ammonia_properties import tabulated_ammonia
 
 def pressure_drop(T_water_ts,u_water_ts,d_pipes,rho_water,roughness_pipe,length,K_L,u_HX):
     
@@ -27,28 +28,35 @@ def saturation_pressures_and_temperatures(T_WW_in,T_CW_in,del_T_WW,del_T_CW,inpu
     T_cond[infeasible_T==1] = np.nan
     T_evap[infeasible_T==1] = np.nan
     
-    p_evap = 0.00002196*T_evap**3+0.00193103*T_evap**2+0.1695763*T_evap+4.25739601
-    p_cond = 0.00002196*T_cond**3+0.00193103*T_cond**2+0.1695763*T_cond+4.25739601
+    # since the saturation temperatures are rounded to 0.1 °C, all saturation properties of ammonia can be looked up from the property table
     
-    return T_evap,T_cond,p_evap,p_cond
+    evaporator = tabulated_ammonia(T_evap,inputs)
+    condenser = tabulated_ammonia(T_cond,inputs)
+    
+    return T_evap,T_cond,evaporator,condenser
 
-def enthalpies_entropies(p_evap,p_cond,inputs):
+def enthalpies_entropies(evaporator,condenser,inputs):
       
     eff_isen_turb = inputs['eff_isen_turb']
     
-    # Enthalpy and Entropy at Inlet (Evaporator Outlet, 100% Steam Quality, using approximation functions from Excel)
-    h_3 = 28.276*np.log(p_evap)+1418.1
-    s_3 = -0.352*np.log(p_evap)+6.1284
+    # evaporator and condenser hold the saturation properties of ammonia at the evaporation and condensation temperatures, see ammonia_properties.py
+    
+    p_evap = evaporator['p']
+    p_cond = condenser['p']
+    
+    # Enthalpy and Entropy at Inlet (Evaporator Outlet, 100% Steam Quality)
+    h_3 = evaporator['h_vap']
+    s_3 = evaporator['s_vap']
     
-    # Enthalpy and Entropy at Outlet, using approximation functions from Excel
+    # Enthalpy and Entropy at Outlet
        
-    s_4_liq = 0.3947*np.log(p_cond)+0.4644
-    s_4_vap = -0.352*np.log(p_cond)+6.1284
+    s_4_liq = condenser['s_liq']
+    s_4_vap = condenser['s_vap']
     
     # Enthalpies of Liquid and Vapour Phase (Enthalpy at Liquid Phase equals Enthalpy and NH3 Pump Inlet)
     
-    h_4_liq = -0.0235*p_cond**4+0.9083*p_cond**3-12.93*p_cond**2+97.316*p_cond-39.559
-    h_4_vap = 28.276*np.log(p_cond)+1418.1
+    h_4_liq = condenser['h_liq']
+    h_4_vap = condenser['h_vap']
     
     x_4_isen = (s_3-s_4_liq)/(s_4_vap-s_4_liq)
     h_4_isen = h_4_vap*x_4_isen+h_4_liq*(1-x_4_isen)
@@ -58,7 +66,7 @@ def enthalpies_entropies(p_evap,p_cond,inputs):
     s_4 = s_4_vap*x_4+s_4_liq*(1-x_4)
       
     h_1 = h_4_liq # inlet enthalpy
-    h_2 = 1/inputs['rho_NH3']*(p_evap-p_cond)*100000/1000/inputs['eff_isen_pump']+h_1 # outlet enthalpy
+    h_2 = 1/inputs['rho_NH3']*(p_evap-p_cond)*1E5/1E3/inputs['eff_isen_pump']+h_1 # outlet enthalpy
 
     enthalpies = {
         'h_1': h_1,
@@ -67,4 +75,13 @@ def enthalpies_entropies(p_evap,p_cond,inputs):
         'h_4': h_4,
         }
     
-    return enthalpies
\ No newline at end of file
+    return enthalpies
+
+def p_gross_label(p_gross):
+    
+    # label of the gross power output in MW for file and folder names, e.g. "136.0" for one plant size or "10.0-136.0" for a range of plant sizes
+    
+    if np.ndim(p_gross) == 0:
+        return f'{-p_gross/1000}'
+    else:
+        return f'{-np.max(p_gross)/1000}-{-np.min(p_gross)/1000}'
@@ -5,109 +5,126 @@ Created on Tue Apr 27 11:16:02 2021
 @author: jkalanger
 """
 
+## With this script, we run pyOTEC for all regions listed in "download_ranges_per_region.csv". The regions are analysed in parallel in separate processes,
+## starting with the regions that have the most sites, so that the largest regions do not end up running alone at the end of the sweep.
+## Each finished region is written to a ledger file. If the sweep is interrupted, it continues with the regions that are not in the ledger yet.
+## The regions are recorded with the analysed year and a hash of the model parameters, so that a sweep with another year or changed parameters
+## (e.g. in parameters_and_constants.py) analyses all regions again instead of skipping them.
+
 import os
 import time
 import pandas as pd
 import numpy as np
-import platform
+from concurrent.futures import ProcessPoolExecutor,as_completed
 
 from parameters_and_constants import parameters_and_constants
-from off_design_analysis import off_design_analysis
-from CMEMS_download_and_processing import download_data,data_processing,load_temperatures
-   
-def pyOTEC(studied_region,p_gross=-136000,cost_level='low_cost'):
+from pyOTEC import pyOTEC
+from result_cache import parameter_hash,model_parameters
+
+ledger_key = ['region','p_gross','cost_level','year','parameters']
+
+def region_jobs(cost_level='low_cost'):
+
+    ## Like before, the gross power output of the plants is limited by the electricity demand of each region, and regions without demand data are skipped.
+    ## The number of sites per region is counted with the same depth filter that pyOTEC applies.
+
+    inputs = parameters_and_constants(-136000,cost_level,'CMEMS')
+
+    unique_regions = pd.read_csv('download_ranges_per_region.csv',delimiter=';',encoding='latin-1').drop_duplicates(subset=['region'])
+    unique_regions = unique_regions[~np.isnan(unique_regions['demand']) & (unique_regions['demand'] != 0)]
+
+    sites_df = pd.read_csv('CMEMS_points_with_properties.csv',delimiter=';')
+    sites_df = sites_df[(sites_df['water_depth'] <= inputs['min_depth']) & (sites_df['water_depth'] >= inputs['max_depth'])]
+    sites_per_region = sites_df['region'].value_counts()
+
+    jobs = pd.DataFrame()
+    jobs['region'] = unique_regions['region']
+    jobs['p_gross'] = np.where(-unique_regions['demand']*1000000000/8760 < -136000,-136000,(-unique_regions['demand']*1000000000/8760).astype(int))
+    jobs['cost_level'] = cost_level
+    jobs['year'] = inputs['date_start'][0:4]
+    jobs['parameters'] = [parameter_hash(model_parameters(parameters_and_constants(int(p_gross),cost_level,'CMEMS'))) for p_gross in jobs['p_gross']]
+    jobs['n_sites'] = [sites_per_region.get(region,0) for region in jobs['region']]
+
+    return jobs.sort_values(by='n_sites',ascending=False).reset_index(drop=True)
+
+def run_region(studied_region,p_gross,cost_level):
+
+    # we only return the runtime and the size of the results, because sending the results back to the main process would copy them
+
     start = time.time()
-    parent_dir = os.getcwd() + 'Data_Results/'
-    
-    if platform.system() == 'Windows':
-        new_path = os.path.join(parent_dir,f'{studied_region}\\'.replace(" ","_"))
-    else :
-        new_path = os.path.join(parent_dir,f'{studied_region}/'.replace(" ","_"))
-    
-    if os.path.isdir(new_path):
-        pass
-    else:
-        os.mkdir(new_path)
-        
-    inputs = parameters_and_constants(p_gross,cost_level,'CMEMS')
-    year = inputs['date_start'][0:4]  
-    
-    # if os.path.isfile(new_path+f'net_power_profiles_{studied_region}_{year}__{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_")):
-    #     print(f'{studied_region} already analysed.')
-    # else:
-  
-        
-    depth_WW = inputs['length_WW_inlet']
-    depth_CW = inputs['length_CW_inlet']
-      
-    files = download_data(cost_level,inputs,studied_region,new_path)
-    
-    print('\n++ Processing seawater temperature data ++\n')    
-    
-    sites_df = pd.read_csv('CMEMS_points_with_properties.csv',delimiter=';',encoding='latin-1')
-    sites_df = sites_df[(sites_df['region']==studied_region) & (sites_df['water_depth'] <= inputs['min_depth']) & (sites_df['water_depth'] >= inputs['max_depth'])]   
-    sites_df = sites_df.sort_values(by=['longitude','latitude'],ascending=True)
-    
-    h5_file_WW = os.path.join(new_path, f'T_{round(depth_WW,0)}m_{year}_{studied_region}.h5'.replace(" ","_"))
-    h5_file_CW = os.path.join(new_path, f'T_{round(depth_CW,0)}m_{year}_{studied_region}.h5'.replace(" ","_"))
-    
-    if os.path.isfile(h5_file_CW):
-        T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_columns_CW = load_temperatures(h5_file_CW, inputs)
-        print(f'{h5_file_CW} already exist. No processing necessary.')
-    else:
-        T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_columns_CW = data_processing(files[int(len(files)/2):int(len(files))],sites_df,inputs,studied_region,new_path,'CW')
-    
-    if os.path.isfile(h5_file_WW):
-        T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_columns_WW = load_temperatures(h5_file_WW, inputs)
-        print(f'{h5_file_WW} already exist. No processing necessary.')
-    else:
-        T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_columns_WW = data_processing(files[0:int(len(files)/2)],sites_df,inputs,studied_region,new_path,'WW',nan_columns_CW)
-         
-    otec_plants = off_design_analysis(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,coordinates_CW,timestamp,studied_region,new_path,cost_level)  
-    
-    sites = pd.DataFrame()
-    sites.index = np.squeeze(id_sites)
-    sites['longitude'] = coordinates_CW[:,0]
-    sites['latitude'] = coordinates_CW[:,1]
-    sites['p_net_nom'] = -otec_plants['p_net_nom'].T/1000
-    sites['AEP'] = -np.mean(otec_plants['p_net'],axis=0)*8760/1000000
-    sites['CAPEX'] = otec_plants['CAPEX'].T/1000000
-    sites['LCOE'] = otec_plants['LCOE'].T
-    sites['Configuration'] = otec_plants['Configuration'].T
-    sites['T_WW_min'] = T_WW_design[0,:]
-    sites['T_WW_med'] = T_WW_design[1,:]
-    sites['T_WW_max'] = T_WW_design[2,:]
-    sites['T_CW_min'] = T_CW_design[2,:]
-    sites['T_CW_med'] = T_CW_design[1,:]
-    sites['T_CW_max'] = T_CW_design[0,:]
-    
-    sites = sites.dropna(axis='rows')
-
-    p_net_profile = pd.DataFrame(np.mean(otec_plants['p_net'],axis=1),columns=['p_net'],index=timestamp)
-    
-    p_gross = inputs['p_gross']
-    
-    sites.to_csv(new_path + f'OTEC_sites_{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_"),index=True, index_label='id',float_format='%.3f')
-    p_net_profile.to_csv(new_path + f'net_power_profiles_{studied_region}_{year}__{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_"),index=True)
-    
-    end = time.time()
-    print('Total runtime: ' + str(round((end-start)/60,2)) + ' minutes.')
-    
-    return otec_plants, sites_df
+    otec_plants,_ = pyOTEC(studied_region,p_gross,cost_level)
+
+    return time.time()-start,np.shape(otec_plants['p_net'])
+
+def global_analysis(cost_level='low_cost',ledger_file=None):
+
+    inputs = parameters_and_constants(-136000,cost_level,'CMEMS')
+
+    if ledger_file is None:
+        ledger_file = os.path.join(os.getcwd(),'Data_Results',f'global_analysis_ledger_{cost_level}.csv')
+
+    if not os.path.isdir(os.path.dirname(ledger_file)):
+        os.makedirs(os.path.dirname(ledger_file))
+
+    ## Regions that are already in the ledger with the same gross power output, cost level, year and model parameters are skipped. Failed regions
+    ## are not recorded as finished, so that they are tried again in the next sweep.
+
+    jobs = region_jobs(cost_level)
+
+    if os.path.isfile(ledger_file):
+        ledger = pd.read_csv(ledger_file,delimiter=';',dtype={'year': str,'parameters': str})
+        if not set(ledger_key).issubset(ledger.columns):
+            # ledgers written without year and parameter hash get empty columns, so that their regions are analysed again
+            ledger = ledger.reindex(columns=ledger_key + [column for column in ledger.columns if column not in ledger_key])
+            ledger.to_csv(ledger_file,index=False,sep=';')
+        ledger = ledger.dropna(subset=ledger_key)
+        finished = set(zip(*[ledger[key] for key in ledger_key]))
+        jobs = jobs[[key not in finished for key in zip(*[jobs[key] for key in ledger_key])]]
+        print(f'{len(finished)} regions already analysed according to {ledger_file}.')
+
+    print(f'\n++ Analysing {len(jobs)} regions with {inputs["region_workers"]} processes ++\n')
+
+    start = time.time()
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=inputs['region_workers']) as executor:
+        futures = {executor.submit(run_region,job['region'],int(job['p_gross']),job['cost_level']): job for _,job in jobs.iterrows()}
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                runtime,shape = future.result()
+            except Exception as error:
+                print(f'{job["region"]} failed: {error}')
+                failed.append(job['region'])
+                continue
+
+            n_time,n_sites = shape if len(shape) == 2 else (shape[0],1)
+
+            result = pd.DataFrame({'region': [job['region']],
+                                   'p_gross': [job['p_gross']],
+                                   'cost_level': [job['cost_level']],
+                                   'year': [job['year']],
+                                   'parameters': [job['parameters']],
+                                   'n_sites': [n_sites],
+                                   'runtime_s': [round(runtime,1)],
+                                   'sites_per_s': [round(n_sites/runtime,3)],
+                                   'site_timesteps_per_s': [round(n_sites*n_time/runtime,1)],
+                                   'finished': [pd.Timestamp.now().isoformat(timespec='seconds')]})
+
+            # the ledger is appended after every region, so that it survives an interrupted sweep
+            result.to_csv(ledger_file,mode='a',header=not os.path.isfile(ledger_file),index=False,sep=';')
+
+            print(f'{job["region"]} finished: {n_sites} sites in {round(runtime/60,2)} minutes ({round(n_sites*n_time/runtime,1)} site-timesteps per second).')
+
+    print(f'\nGlobal analysis finished in {round((time.time()-start)/60,2)} minutes.')
+    if failed:
+        print(f'{len(failed)} regions failed and will be repeated in the next run: {", ".join(failed)}')
+
+    return failed
 
 if __name__ == "__main__":
-    
-    unique_regions = pd.read_csv('HYCOM_download_ranges_per_region.csv',delimiter=';',encoding='latin-1').drop_duplicates(subset=['region'])   
-    regions = list(unique_regions['region'])   
-    demand = list(unique_regions['demand'])
+
     cost_level = 'low_cost'
-    
-    for index,region in enumerate(regions):
-        studied_region = region
-        if np.isnan(demand[index]) or demand[index] == 0:
-            continue
-        elif -demand[index]*1000000000/8760 < -136000:
-            p_gross = -136000
-        else:
-            p_gross = int(-demand[index]*1000000000/8760)
-        pyOTEC(studied_region,p_gross,cost_level)
+
+    global_analysis(cost_level)
@@ -9,13 +9,116 @@ import numpy as np
 import pandas as pd
 import os
 
-from otec_sizing import otec_sizing
-from capex_opex_lcoe import capex_opex_lcoe
+from otec_sizing import otec_sizing,net_power
+from capex_opex_lcoe import capex_opex_lcoe,cost_variables
 # from parameters_and_constants import parameters_and_constants
 from otec_operation import otec_operation
+from time_series_storage import create_time_series_file,write_time_series_block
+from general_scripts import p_gross_label
+from result_cache import parameter_hash,model_parameters,off_design_parameters,load_cached,store_cached
+from telemetry import stage,add_arrays
 
 def on_design_analysis(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
     
+    if inputs['design_grid'] == 'broadcast':
+        return on_design_analysis_broadcast(T_WW_in,T_CW_in,inputs,cost_level)
+    elif inputs['design_grid'] == 'loop':
+        return on_design_analysis_loop(T_WW_in,T_CW_in,inputs,cost_level)
+    else:
+        raise ValueError('Invalid design grid. Valid inputs are "broadcast" and "loop"')
+
+def unique_columns(values):
+    
+    # returns the unique columns of a 2D array and the index of the unique column for every column, lexsort is much faster than np.unique with an axis
+    
+    order = np.lexsort(values)
+    sorted_values = values[:,order]
+    first = np.concatenate([[True],np.any(sorted_values[:,1:] != sorted_values[:,:-1],axis=0)])
+    
+    index = np.empty(np.shape(values)[1],dtype=np.int64)
+    index[order] = np.cumsum(first)-1
+    
+    return sorted_values[:,first],index
+
+def on_design_analysis_broadcast(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
+    
+    del_T_WW_min, \
+    del_T_CW_min, \
+    del_T_WW_max, \
+    del_T_CW_max, \
+    interval_WW, \
+    interval_CW = inputs['del_T_for_looping']
+    
+    ## Instead of sizing the plants for one pair of temperature differences after another, we size them for all pairs at once. For this, the
+    ## temperature differences get a leading grid axis that numpy broadcasts against the sites. Grid point k corresponds to the k-th pair in the
+    ## order of the loop version, i.e. del_T_CW varies slowest and del_T_WW fastest.
+    
+    del_T_CW_range = np.arange(del_T_CW_min,del_T_CW_max+interval_CW,interval_CW)/10
+    del_T_WW_range = np.arange(del_T_WW_min,del_T_WW_max+interval_WW,interval_WW)/10
+    
+    shape = np.broadcast_shapes(np.shape(T_WW_in),np.shape(T_CW_in),np.shape(inputs['eff_trans']),np.shape(inputs['p_gross']))
+    grid_shape = (len(del_T_CW_range)*len(del_T_WW_range),) + shape
+    
+    del_T_CW = np.repeat(del_T_CW_range,len(del_T_WW_range)).reshape((-1,) + (1,)*len(shape))
+    del_T_WW = np.tile(del_T_WW_range,len(del_T_CW_range)).reshape((-1,) + (1,)*len(shape))
+    
+    ## The plants only depend on the site through the seawater temperatures, the gross power output and, for the net power, the transmission
+    ## efficiency. Since the design temperatures are rounded to 0.1 °C, many sites share the same temperatures. We therefore size the plants once
+    ## for every combination of warm and cold seawater temperature and gross power output, and only spread the values that the costs depend on
+    ## to all sites and temperature differences.
+    
+    design_inputs = np.stack([np.broadcast_to(T_WW_in,shape).ravel(),
+                              np.broadcast_to(T_CW_in,shape).ravel(),
+                              np.broadcast_to(inputs['p_gross'],shape).ravel()])
+    unique_inputs,site_index = unique_columns(design_inputs)
+    
+    # the net power is calculated per site below, so the transmission efficiency is not needed here
+    otec_plant_unique = otec_sizing(unique_inputs[0],
+                                    unique_inputs[1],
+                                    del_T_WW.reshape(-1,1),
+                                    del_T_CW.reshape(-1,1),
+                                    {**inputs,'p_gross': unique_inputs[2],'eff_trans': 1},
+                                    cost_level)
+    
+    # the values of the unique combinations are spread with one flat index per site and pair of temperature differences
+    n_unique = np.shape(unique_inputs)[1]
+    grid_index = (np.arange(len(del_T_WW))[:,np.newaxis]*n_unique + site_index).reshape(grid_shape)
+    spread = lambda value: np.take(np.broadcast_to(value,(len(del_T_WW),n_unique)),grid_index)
+    
+    # the gross power output does not depend on the temperature differences, so the costs that only depend on it are calculated once per site
+    
+    otec_plant_nominal = {key: spread(otec_plant_unique[key]) for key in cost_variables + ['Q_evap_nom'] if key not in ['p_gross_nom','p_net_nom']}
+    otec_plant_nominal['p_gross_nom'] = np.broadcast_to(np.asarray(inputs['p_gross'],dtype=np.float64),shape)
+    otec_plant_nominal['p_net_nom'],_ = net_power(otec_plant_nominal['p_pump_total_nom'],otec_plant_nominal['Q_evap_nom'],inputs)
+    
+    all_CAPEX_OPEX,CAPEX,OPEX,LCOE_nom = capex_opex_lcoe(otec_plant_nominal, inputs, cost_level)
+    
+    ## For every site, we pick the pair with the lowest LCOE and take the corresponding plant and costs from the grid, so that they do not need
+    ## to be calculated again.
+    
+    lcoe_matrix_nominal = np.nan_to_num(np.broadcast_to(LCOE_nom,grid_shape),nan=10000) # replace NaN with unreasonably high value
+    index_lowest_lcoe = np.argmin(lcoe_matrix_nominal,axis=0)
+    
+    otec_plant_nominal_lowest_lcoe = {}
+    for key,value in otec_plant_unique.items():
+        otec_plant_nominal_lowest_lcoe[key] = np.broadcast_to(value,(len(del_T_WW),n_unique))[index_lowest_lcoe,site_index.reshape(shape)]
+    
+    otec_plant_nominal_lowest_lcoe['p_net_nom'],otec_plant_nominal_lowest_lcoe['eff_net_nom'] = net_power(otec_plant_nominal_lowest_lcoe['p_pump_total_nom'],
+                                                                                                           otec_plant_nominal_lowest_lcoe['Q_evap_nom'],
+                                                                                                           inputs)
+    
+    # the costs that only depend on the gross power output hold one value per site instead of one per site and pair of temperature differences
+    lowest_lcoe = lambda value: np.take_along_axis(np.broadcast_to(np.reshape(value,(-1,) + shape),grid_shape),index_lowest_lcoe[np.newaxis],axis=0)[0]
+    all_CAPEX_OPEX = {key: np.ravel(lowest_lcoe(value)) for key,value in all_CAPEX_OPEX.items()}
+    
+    otec_plant_nominal_lowest_lcoe['CAPEX'] = lowest_lcoe(CAPEX)
+    otec_plant_nominal_lowest_lcoe['OPEX'] = lowest_lcoe(OPEX)
+    otec_plant_nominal_lowest_lcoe['LCOE_nom'] = lowest_lcoe(LCOE_nom)
+    
+    return otec_plant_nominal_lowest_lcoe,all_CAPEX_OPEX
+
+def on_design_analysis_loop(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
+    
     # inputs = parameters_and_constants(cost_level)
    
     del_T_WW_min, \
@@ -25,10 +128,9 @@ def on_design_analysis(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
     interval_WW, \
     interval_CW = inputs['del_T_for_looping']
     
-    if T_WW_in.ndim == 0:
-        lcoe_matrix_nominal = np.empty([int((del_T_WW_max-del_T_WW_min)/interval_WW+1),int((del_T_CW_max-del_T_CW_min)/interval_CW+1)],dtype=np.float64)
-    else: 
-        lcoe_matrix_nominal = np.empty([int((del_T_WW_max-del_T_WW_min)/interval_WW+1),int((del_T_CW_max-del_T_CW_min)/interval_CW+1),np.shape(T_WW_in)[0]],dtype=np.float64)
+    # the sites can carry leading axes, e.g. when several configurations are sized at once
+    shape = np.broadcast_shapes(np.shape(T_WW_in),np.shape(T_CW_in),np.shape(inputs['eff_trans']),np.shape(inputs['p_gross']))
+    lcoe_matrix_nominal = np.empty([int((del_T_WW_max-del_T_WW_min)/interval_WW+1),int((del_T_CW_max-del_T_CW_min)/interval_CW+1)] + list(shape),dtype=np.float64)
     
     for i in range(del_T_CW_min,(del_T_CW_max+interval_CW),interval_CW):
         for j in range(del_T_WW_min,del_T_WW_max+interval_WW,interval_WW):  
@@ -51,17 +153,10 @@ def on_design_analysis(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
             otec_plant_nominal['OPEX'] = OPEX
             otec_plant_nominal['LCOE_nom'] = LCOE_nom
             
-            if T_WW_in.ndim == 0:          
-                lcoe_matrix_nominal[int((i-del_T_CW_min)/interval_CW)][int((j-del_T_WW_min)/interval_WW)] = LCOE_nom
-                lcoe_matrix_nominal = np.nan_to_num(lcoe_matrix_nominal,nan=10000) # replace NaN with unreasonably high value
-                del_T_pair = divmod(lcoe_matrix_nominal.argmin(),lcoe_matrix_nominal.shape[1])
-                del_T_CW = (del_T_pair[0] * interval_CW + 20)/10
-                del_T_WW = (del_T_pair[1] * interval_CW + 20)/10
-            else:
-                lcoe_matrix_nominal[int((i-del_T_CW_min)/interval_CW)][int((j-del_T_WW_min)/interval_WW)][:] = LCOE_nom
-                lcoe_matrix_nominal = np.nan_to_num(lcoe_matrix_nominal,nan=10000) # replace NaN with unreasonably high value
-                del_T_CW = ( np.argmin(np.min(lcoe_matrix_nominal,axis=1),axis=0) * interval_CW + 20)/10
-                del_T_WW = ( np.argmin(np.min(lcoe_matrix_nominal,axis=0),axis=0) * interval_WW + 20)/10
+            lcoe_matrix_nominal[int((i-del_T_CW_min)/interval_CW)][int((j-del_T_WW_min)/interval_WW)] = LCOE_nom
+            lcoe_matrix_nominal = np.nan_to_num(lcoe_matrix_nominal,nan=10000) # replace NaN with unreasonably high value
+            del_T_CW = ( np.argmin(np.min(lcoe_matrix_nominal,axis=1),axis=0) * interval_CW + 20)/10
+            del_T_WW = ( np.argmin(np.min(lcoe_matrix_nominal,axis=0),axis=0) * interval_WW + 20)/10
        
     
     # It would be more elegant to not re-calculate the plants, but I don't know how to make it better.
@@ -86,84 +181,234 @@ def on_design_analysis(T_WW_in,T_CW_in,inputs,cost_level='low_cost'):
     
     return otec_plant_nominal_lowest_lcoe,all_CAPEX_OPEX
 
-def off_design_analysis(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,coordinates,timestamp,studied_region,new_path,cost_level='low_cost'):
-       
-    print('\n++ Initiate off-design analysis ++\n')
+def design_grid_size(inputs):
     
-    results_matrix = {}
+    # number of pairs of temperature differences for which the plants are sized
     
-    if T_WW_design.ndim == 1:
-        lcoe_matrix = np.empty((len(T_WW_design),len(T_CW_design)),dtype=np.float64) 
-    else:    
-        lcoe_matrix = np.empty((len(T_WW_design),len(T_CW_design),np.shape(T_WW_profiles)[1]),dtype=np.float64)
+    del_T_WW_min, \
+    del_T_CW_min, \
+    del_T_WW_max, \
+    del_T_CW_max, \
+    interval_WW, \
+    interval_CW = inputs['del_T_for_looping']
+    
+    return int((del_T_WW_max-del_T_WW_min)/interval_WW+1)*int((del_T_CW_max-del_T_CW_min)/interval_CW+1)
+
+## Memory that one configuration needs per site, used to fit batches of configurations and blocks of sites into memory_budget. The numbers of arrays
+## were measured with tracemalloc for 2000 sites, 366 daily time steps and the 49 pairs of temperature differences of the default design grid.
+## on_design_analysis holds up to 51 float64 arrays per site and pair of temperature differences at the same time (plant dimensions and costs)
+## if all sites have different design temperatures, and fewer if sites share them (21 to 34 for real and synthetic regions).
+## otec_operation returns 16 time series per site in the selected precision (m_NH3 to eff_net). While they are calculated, the regulation solvers
+## and the enthalpies need up to 19 further float64 arrays per site and time step with the 'numpy' backend (about 1 with 'numba').
+
+design_arrays = 55          # float64 arrays per site and pair of temperature differences in on_design_analysis
+operation_time_series = 16  # time series per site and time step returned by otec_operation, in the selected precision
+operation_work_arrays = 20  # float64 working arrays per site and time step in otec_operation
+
+def bytes_per_configuration(n_grid,n_time,itemsize):
+    
+    # the plants are sized before they are operated, so only the larger of both stages counts
+    
+    return max(8*design_arrays*n_grid,(itemsize*operation_time_series + 8*operation_work_arrays)*n_time)
+
+def configurations_per_batch(n_configurations,shape_profiles,inputs):
+    
+    ## Each configuration in a batch adds one set of plants sized for all temperature differences in on_design_analysis and one set of time series
+    ## arrays in otec_operation. We estimate their size with bytes_per_configuration and limit the batch to the memory budget.
+    
+    n_grid = design_grid_size(inputs)
+    n_time = shape_profiles[0]
+    n_sites = np.prod(shape_profiles[1:],dtype=np.int64)
+    
+    bytes_per_batch_item = n_sites*bytes_per_configuration(n_grid,n_time,np.dtype(inputs['precision']).itemsize)
+    
+    return int(np.clip(inputs['memory_budget']*1024**2//bytes_per_batch_item,1,n_configurations))
+
+def sites_per_block(shape_profiles,inputs):
+    
+    ## A block of sites needs memory for one configuration (see bytes_per_configuration) and for the time series of the plants with the lowest
+    ## LCOE so far, which are kept until the block is exported. The warm and cold temperature profiles of the block are added as well.
+    
+    n_grid = design_grid_size(inputs)
+    n_time = shape_profiles[0]
+    n_sites = np.prod(shape_profiles[1:],dtype=np.int64)
+    itemsize = np.dtype(inputs['precision']).itemsize
+    
+    bytes_per_site = bytes_per_configuration(n_grid,n_time,itemsize) + itemsize*(operation_time_series+2)*n_time
+    
+    return int(np.clip(inputs['memory_budget']*1024**2//bytes_per_site,1,max(n_sites,1)))
+
+def lowest_lcoe_configurations(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,cost_level,cache_path):
+    
+    ## Instead of running the on-design and off-design analysis nine times, we stack the design temperatures of several configurations along a
+    ## leading configuration axis and simulate them in one vectorised call. Configuration index_ww + index_cw*3 + 1 uses the warm and cold
+    ## seawater design temperatures with indices index_ww and index_cw.
+    
+    ## If several gross power outputs are given, every plant size is combined with every configuration. These cases are stacked along the
+    ## same leading axis, so that the temperature profiles are only loaded once for all plant sizes.
+    
+    p_gross_sizes = np.atleast_1d(inputs['p_gross'])
+    n_configurations = len(T_WW_design)*len(T_CW_design)
+    
+    index_size = np.repeat(np.arange(len(p_gross_sizes)),n_configurations)
+    index_WW = np.tile(np.tile(np.arange(len(T_WW_design)),len(T_CW_design)),len(p_gross_sizes))
+    index_CW = np.tile(np.repeat(np.arange(len(T_CW_design)),len(T_WW_design)),len(p_gross_sizes))
+    
+    batch_size = configurations_per_batch(len(index_WW),np.shape(T_WW_profiles),inputs)
+    
+    ## Instead of keeping the results of all configurations, we only keep the plant with the lowest LCOE found so far for every site. After each
+    ## configuration, the sites for which it has a lower LCOE are overwritten with masked assignment. Since we only replace on strictly lower LCOE,
+    ## ties and sites without any feasible configuration keep the first configuration, like configuration 1 was used as default before.
+    ## For every plant size, we also keep the lowest LCOE of all configurations, which gives the LCOE per site and plant size.
+    
+    otec_plant_lowest_lcoe = None
     
     CAPEX_OPEX_for_comparison = []
-    for index_cw,t_cw_design in enumerate(T_CW_design):
-        for index_ww,t_ww_design in enumerate(T_WW_design):
-            
-            # print(f'Configuration {index_ww + index_cw*3 + 1}')
-            
-            otec_plant_nominal_lowest_lcoe,all_CAPEX_OPEX = on_design_analysis(t_ww_design,t_cw_design,inputs,cost_level)          
-            otec_plant_off_design = otec_operation(otec_plant_nominal_lowest_lcoe,T_WW_profiles,T_CW_profiles,inputs)
+    for start in range(0,len(index_WW),batch_size):
+        
+        cases = np.arange(start,min(start+batch_size,len(index_WW)))
+        
+        # the second axis is the time axis, along which the nominal values are broadcast against the temperature profiles
+        t_ww_design = T_WW_design[index_WW[cases]][:,np.newaxis]
+        t_cw_design = T_CW_design[index_CW[cases]][:,np.newaxis]
+        inputs_cases = {**inputs, 'p_gross': p_gross_sizes[index_size[cases]].reshape((-1,) + (1,)*np.ndim(T_WW_profiles))}
+        
+        # the nominal designs do not depend on the off-design parameters, so they are reused when only those change
+        # the telemetry records every batch with the configurations (and plant sizes) that it contains
+        configurations = [int(index_WW[case] + index_CW[case]*3 + 1) for case in cases]
+        
+        with stage('nominal sizing',T_WW_design=t_ww_design) as record:
+            record['configurations'] = configurations
+            nominal_key = parameter_hash(model_parameters(inputs_cases,off_design_parameters),t_ww_design,t_cw_design,cost_level)
+            otec_plant_nominal_lowest_lcoe = load_cached(cache_path,'nominal',nominal_key)
+            record['cached'] = otec_plant_nominal_lowest_lcoe is not None
+            if otec_plant_nominal_lowest_lcoe is None:
+                otec_plant_nominal_lowest_lcoe,_ = on_design_analysis(t_ww_design,t_cw_design,inputs_cases,cost_level)
+                store_cached(cache_path,'nominal',nominal_key,otec_plant_nominal_lowest_lcoe,inputs['cache_size'])
+        
+        with stage('off-design operation',T_WW_profiles=T_WW_profiles,T_CW_profiles=T_CW_profiles) as record:
+            record['configurations'] = configurations
+            otec_plant_off_design = otec_operation(otec_plant_nominal_lowest_lcoe,T_WW_profiles,T_CW_profiles,inputs_cases)
+            add_arrays(record,p_net=otec_plant_off_design['p_net'])
+        
+        otec_plant_off_design.update(otec_plant_nominal_lowest_lcoe)
+        
+        for index,case in enumerate(cases):
             
-            otec_plant_off_design.update(otec_plant_nominal_lowest_lcoe)
+            configuration = index_WW[case] + index_CW[case]*3 + 1
+            # print(f'Configuration {configuration}')
             
-            # otec_plant_off_design['Configuration'] = index_ww + index_cw*3 + 1
+            lcoe = np.ravel(np.nan_to_num(otec_plant_off_design['LCOE'][index],nan=10000)) # replace NaN with unreasonably high value
             
+            if otec_plant_lowest_lcoe is None:
+                # we copy the arrays, because slices would keep the arrays of the whole batch in memory
+                otec_plant_lowest_lcoe = {key: np.array(value[index]) for key,value in otec_plant_off_design.items()}
+                lcoe_lowest = lcoe
+                configuration_lowest_LCOE = np.full(np.shape(lcoe),configuration)
+                lcoe_per_size = np.full((len(p_gross_sizes),) + np.shape(lcoe),10000,dtype=np.float64)
+            else:
+                lower_lcoe = lcoe < lcoe_lowest
+                for key,value in otec_plant_lowest_lcoe.items():
+                    np.copyto(value,otec_plant_off_design[key][index],where=lower_lcoe)
+                lcoe_lowest = np.where(lower_lcoe,lcoe,lcoe_lowest)
+                configuration_lowest_LCOE[lower_lcoe] = configuration
             
-            results_matrix[index_ww + index_cw*3 + 1] = otec_plant_off_design
+            lcoe_per_size[index_size[case]] = np.minimum(lcoe_per_size[index_size[case]],lcoe)
             
-            if T_WW_design.ndim == 1:
-                lcoe_matrix[index_cw][index_ww]  = otec_plant_off_design['LCOE']
-            else:    
-                lcoe_matrix[index_cw][index_ww][:]  = otec_plant_off_design['LCOE']
-                
+            # the cost breakdown is evaluated per configuration, which is cheap compared to sizing the plants
+            all_CAPEX_OPEX,_,_,_ = capex_opex_lcoe({key: value[index] for key,value in otec_plant_nominal_lowest_lcoe.items()},inputs_cases,cost_level)
             CAPEX_OPEX_for_comparison.append([all_CAPEX_OPEX])
-    
-    lcoe_matrix = np.nan_to_num(lcoe_matrix,nan=10000) # replace NaN with unreasonably high value
-              
-    index_CW_lowest_LCOE = np.argmin(np.min(lcoe_matrix,axis=1),axis=0)
-    index_WW_lowest_LCOE = np.argmin(np.min(lcoe_matrix,axis=0),axis=0)
-    
-    configuration_lowest_LCOE = (index_WW_lowest_LCOE + index_CW_lowest_LCOE*3 + 1).T
+        
+        del otec_plant_off_design,otec_plant_nominal_lowest_lcoe
     
     if T_WW_design.ndim == 1:
-        otec_plant_lowest_lcoe = results_matrix[configuration_lowest_LCOE]
-    else:
-    
-        # Here we make a dummy dictionary which we will overwrite with the values of the best off-design plants.
-        # We use configuration 1 as default because most plants return that configuration as the one with lowest LCOE
-
-        otec_plant_lowest_lcoe = results_matrix[1]
-        
-        for index, plant in enumerate(index_WW_lowest_LCOE):
-            if configuration_lowest_LCOE[index] == 1:
-                continue
-            else:
-                for key in otec_plant_lowest_lcoe:
-                    if np.ndim(otec_plant_lowest_lcoe[key]) <= 1:
-                        otec_plant_lowest_lcoe[key][index] = results_matrix[configuration_lowest_LCOE[index]][key][index]
-                    else:
-                        otec_plant_lowest_lcoe[key][:,index] = results_matrix[configuration_lowest_LCOE[index]][key][:,index]
+        configuration_lowest_LCOE = configuration_lowest_LCOE[0]
         
     otec_plant_lowest_lcoe['Configuration'] = configuration_lowest_LCOE
     
-    net_power_df = pd.DataFrame(np.round(otec_plant_lowest_lcoe['p_net']/otec_plant_lowest_lcoe['p_gross_nom'],3))
-    net_power_df.columns = [str(val[0]) + '_' + str(val[1]) for idx,val in enumerate(coordinates)]
+    # The LCOE per plant size (rows) and site (columns) is only added for plant size sweeps. The LCOE-optimal size of each site is
+    # stored in p_gross_nom, because the plants above are selected across all sizes.
+    if np.ndim(inputs['p_gross']) > 0:
+        otec_plant_lowest_lcoe['LCOE_per_size'] = np.where(lcoe_per_size < 10000,lcoe_per_size,np.nan)
+    
+    return otec_plant_lowest_lcoe, CAPEX_OPEX_for_comparison
 
-    net_power_df['Time'] = timestamp
-    net_power_df = net_power_df.set_index('Time')
+def off_design_analysis(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,coordinates,timestamp,studied_region,new_path,cost_level='low_cost'):
+       
+    print('\n++ Initiate off-design analysis ++\n')
+    
+    site_labels = [str(val[0]) + '_' + str(val[1]) for idx,val in enumerate(coordinates)]
     
     date_start = inputs['date_start']
-    p_gross = inputs['p_gross']
+    p_gross = p_gross_label(inputs['p_gross'])
     
-    # net_power_df.to_hdf(new_path + f'Net_power_profiles_{studied_region}_{date_start[0:4]}_{-p_gross/1000}_MW_{cost_level}.h5'.replace(" ","_"),key='net_power',mode='w')
-       
-    for key,value in otec_plant_lowest_lcoe.items():
-        if value.ndim == 1:
-            value = value.reshape(1,-1)             
-        pd.DataFrame(np.round(value,2), columns=net_power_df.columns).to_hdf(new_path + f'Time_series_data_{studied_region}_{date_start[0:4]}_{-p_gross/1000}_MW_{cost_level}.h5',key=f'{key}',mode='a')
+    ## With site_blocks = True, the sites are split into blocks that fit into the memory budget (see sites_per_block). Each block is sized,
+    ## operated and exported before the next one, and only the per-site results and the time series in block_time_series are kept
+    ## for the whole region. Since all sites are simulated independently of each other, the results are identical to a run with one block.
+    
+    n_sites = np.shape(T_WW_profiles)[-1]
+    n_time = np.shape(T_WW_profiles)[0]
+    block_size = sites_per_block(np.shape(T_WW_profiles),inputs) if inputs['site_blocks'] else n_sites
+    
+    ## The results are cached with a hash of the parameters, design temperatures and temperature profiles that they depend on.
+    ## A rerun with unchanged inputs loads them from the cache instead of recalculating them. By default, only the nominal designs are cached.
+    
+    cache_path = os.path.join(new_path,'cache')
+    
+    ## All variables are written into a chunked and compressed h5 file, which can be read per variable or site with load_time_series
+    
+    file = new_path + f'Time_series_data_{studied_region}_{date_start[0:4]}_{p_gross}_MW_{cost_level}.h5'
+    h5_file,columns = create_time_series_file(file,site_labels,timestamp,inputs['export_sites'])
     
+    results_per_block = []
+    with h5_file:
+        for first_site in range(0,max(n_sites,1),block_size):
+            
+            block = slice(first_site,first_site+block_size)
+            if block_size < n_sites:
+                print(f'Sites {first_site+1} to {min(first_site+block_size,n_sites)} of {n_sites}')
+            
+            inputs_block = {**inputs,'dist_shore': inputs['dist_shore'][...,block],'eff_trans': inputs['eff_trans'][...,block]}
+            T_WW_design_block,T_CW_design_block = T_WW_design[...,block],T_CW_design[...,block]
+            T_WW_profiles_block,T_CW_profiles_block = T_WW_profiles[...,block],T_CW_profiles[...,block]
+            
+            # the off-design results are only cached with cache_off_design = True, because they contain all time series of the block
+            if inputs['cache_off_design']:
+                off_design_key = parameter_hash(model_parameters(inputs_block),T_WW_design_block,T_CW_design_block,T_WW_profiles_block,T_CW_profiles_block,cost_level)
+                results = load_cached(cache_path,'off_design',off_design_key)
+            else:
+                results = None
+            
+            if results is None:
+                results = lowest_lcoe_configurations(T_WW_design_block,T_CW_design_block,T_WW_profiles_block,T_CW_profiles_block,inputs_block,cost_level,cache_path)
+                if inputs['cache_off_design']:
+                    store_cached(cache_path,'off_design',off_design_key,results,inputs['cache_size'])
+            
+            otec_plant_block, CAPEX_OPEX_block = results
+            
+            with stage('HDF export',p_net=otec_plant_block['p_net']):
+                variables = write_time_series_block(h5_file,otec_plant_block,columns,first_site,inputs,inputs['export_variables'])
+            
+            if block_size < n_sites:
+                otec_plant_block = {key: value for key,value in otec_plant_block.items()
+                                    if key in inputs['block_time_series'] or np.ndim(value) < 2 or np.shape(value)[0] != n_time}
+            
+            results_per_block.append([otec_plant_block,CAPEX_OPEX_block])
+            del results
+    
+    print(f'{len(variables)} variables of {len(columns)} sites exported to {file}.')
     print('\nTime series data successfully exported as h5 file.\n\nEnd of script.')
     
-    return otec_plant_lowest_lcoe, CAPEX_OPEX_for_comparison
\ No newline at end of file
+    if len(results_per_block) == 1:
+        return results_per_block[0]
+    
+    # the blocks are contiguous, so the results of the region are concatenated along the site axis
+    
+    otec_plant_lowest_lcoe = {key: np.concatenate([otec_plant_block[key] for otec_plant_block,_ in results_per_block],axis=-1)
+                              for key in results_per_block[0][0].keys()}
+    
+    CAPEX_OPEX_for_comparison = [[{key: np.concatenate([CAPEX_OPEX_block[configuration][0][key] for _,CAPEX_OPEX_block in results_per_block])
+                                   for key in all_CAPEX_OPEX[0].keys()}]
+                                 for configuration,all_CAPEX_OPEX in enumerate(results_per_block[0][1])]
+    
+    return otec_plant_lowest_lcoe, CAPEX_OPEX_for_comparison
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Optional Numba backend of otec_operation, which computes the operating point of every time step, site and configuration in one fused loop
+"""
+
+import math
+import numpy as np
+
+from ammonia_properties import property_table,T_sat_step
+from components_regulation import initial_NTU_and_epsilon,evaporator_sanity_check,condenser_sanity_check
+from capex_opex_lcoe import lcoe_time_series
+
+## Numba is optional. Without it, numba_available is False and otec_operation keeps using the NumPy functions in components_regulation.
+## The compiled kernel is cached on disk (cache=True), so that it is only compiled once per precision and not at every start of pyOTEC.
+
+try:
+    from numba import njit,prange
+    numba_available = True
+except ImportError:
+    numba_available = False
+
+    def njit(*args,**kwargs):
+        return lambda function: function
+
+    prange = range
+
+## The kernel follows the NumPy functions step by step: pressure_regulation, enthalpies_entropies, evaporator_regulation, condenser_regulation and
+## seawater_pipes_operation. Instead of full time x sites temporaries, every operating point only keeps a few scalars. The saturation properties of
+## ammonia are taken from the property table of ammonia_properties; between the grid points they are interpolated like with ammonia_off_grid = 'interpolation'.
+
+@njit(cache=True)
+def saturation_state(T_sat,table,k_min,k_max,tol):
+
+    # returns p, h_liq, h_vap, s_liq and s_vap of saturated ammonia, and False if the temperature is outside of the table
+
+    if math.isnan(T_sat):
+        return np.nan,np.nan,np.nan,np.nan,np.nan,True
+
+    y = T_sat*round(1/T_sat_step)
+    k = math.floor(y+0.5)
+
+    if abs(y-k) <= tol and k >= k_min and k <= k_max:
+        i = k-k_min
+        return table[0,i],table[1,i],table[2,i],table[3,i],table[4,i],True
+
+    if y < k_min+1 or y >= k_max-2:
+        return np.nan,np.nan,np.nan,np.nan,np.nan,False
+
+    # cubic Lagrange interpolation between the four closest grid points, like interpolated_properties
+    i = math.floor(y)
+    t = y-i
+    i = i-k_min
+    w0 = -t*(t-1)*(t-2)/6
+    w1 = (t+1)*(t-1)*(t-2)/2
+    w2 = -(t+1)*t*(t-2)/2
+    w3 = (t+1)*t*(t-1)/6
+
+    return (w0*table[0,i-1] + w1*table[0,i] + w2*table[0,i+1] + w3*table[0,i+2],
+            w0*table[1,i-1] + w1*table[1,i] + w2*table[1,i+1] + w3*table[1,i+2],
+            w0*table[2,i-1] + w1*table[2,i] + w2*table[2,i+1] + w3*table[2,i+2],
+            w0*table[3,i-1] + w1*table[3,i] + w2*table[3,i+1] + w3*table[3,i+2],
+            w0*table[4,i-1] + w1*table[4,i] + w2*table[4,i+1] + w3*table[4,i+2],
+            True)
+
+@njit(cache=True)
+def regulated_outlet_temperature(Q,T_in,T_sat,x,NTU_coefficient,cp_water,newton,tol,max_iter):
+
+    # scalar version of heat_exchanger_regulation, returns the seawater outlet temperature and whether it converged
+
+    for iteration in range(max_iter):
+        m_water = -Q/(cp_water*(x-T_in))
+        NTU = NTU_coefficient*m_water**-0.35
+        exp_NTU = math.exp(-NTU)
+        x_new = T_in-(1-exp_NTU)*(T_in-T_sat)
+
+        if newton:
+            g = x_new - x
+            dg = -(T_in-T_sat)*exp_NTU*0.35*NTU/(x-T_in) - 1
+            x_newton = x - g/dg
+            if math.isfinite(x_newton) and (x_newton-T_in)*(x-T_in) > 0:
+                x_new = x_newton
+
+        # like in heat_exchanger_regulation, NaN counts as converged
+        converged = not (abs(x_new - x) > tol)
+        x = x_new
+        if converged:
+            return x,True
+
+    return x,False
+
+@njit(cache=True)
+def pipe_pump_power(m_water,T_in,rho_water,A_pipes,d_pipes,length,roughness_pipe,K_L,eff_hyd,eff_el):
+
+    # scalar version of seawater_pipes_operation and pressure_drop
+
+    u_water = m_water/rho_water/A_pipes
+    u_HX = u_water/2
+
+    dyn_visc = 0.000000344285714*T_in**2-0.000047107142857*T_in+0.001766642857143
+    Re = u_water*rho_water*d_pipes/dyn_visc
+    f = 0.25/(math.log10((roughness_pipe/d_pipes)/3.7+5.74/(Re**0.9))**2)
+
+    p_drop = ((f*rho_water*length/d_pipes*0.5*u_water**2)+(K_L*rho_water*0.5*u_HX**2))/1000
+
+    return m_water/rho_water*p_drop/eff_hyd/eff_el
+
+@njit(parallel=True,cache=True)
+def fused_operation(T_WW_profiles,T_CW_profiles,nominal,table,k_min,k_max,tol,constants,newton,regulation_tol,max_iter,results):
+
+    ## T_WW_profiles and T_CW_profiles have the shape (configurations, time, sites), nominal holds the nominal values (see nominal_keys) with the shape
+    ## (keys, configurations, sites) and results is filled with the time series (see result_keys). Every configuration and time step is one parallel task.
+    ## Returns the number of operating points per task whose regulation did not converge and whose saturation temperatures are outside of the table.
+
+    n_configurations,n_time,n_sites = T_WW_profiles.shape
+
+    T_pinch_WW,T_pinch_CW,cp_water,U_evap,U_cond,eff_isen_turb,rho_NH3,eff_isen_pump,eff_pump_NH3_mech, \
+        rho_WW,rho_CW,length_WW,length_CW,roughness_pipe,K_L,eff_hyd,eff_el,eff_turb_el,eff_turb_mech = constants
+
+    unconverged = np.zeros(n_configurations*n_time,dtype=np.int64)
+    outside_table = np.zeros(n_configurations*n_time,dtype=np.int64)
+
+    for task in prange(n_configurations*n_time):
+        c = task // n_time
+        t = task % n_time
+
+        for s in range(n_sites):
+            T_WW = np.float64(T_WW_profiles[c,t,s])
+            T_CW = np.float64(T_CW_profiles[c,t,s])
+
+            m_NH3_nom = nominal[0,c,s]
+            m_WW_nom = nominal[1,c,s]
+            m_CW_nom = nominal[2,c,s]
+            Q_evap_nom = nominal[3,c,s]
+            Q_cond_nom = nominal[4,c,s]
+            T_evap_nom = nominal[5,c,s]
+            T_cond_nom = nominal[6,c,s]
+            del_T_WW = nominal[7,c,s]
+            del_T_CW = nominal[8,c,s]
+            A_evap = nominal[9,c,s]
+            A_cond = nominal[10,c,s]
+            p_gross_nom = nominal[11,c,s]
+            epsilon_evap = nominal[12,c,s]
+            epsilon_cond = nominal[13,c,s]
+            A_pipes_WW = nominal[14,c,s]
+            d_pipes_WW = nominal[15,c,s]
+            A_pipes_CW = nominal[16,c,s]
+            d_pipes_CW = nominal[17,c,s]
+            eff_trans = nominal[18,c,s]
+
+            # pressure_regulation
+            if T_WW - Q_evap_nom/(m_WW_nom*cp_water) - T_evap_nom < T_pinch_WW:
+                T_evap = T_WW - del_T_WW - T_pinch_WW
+            else:
+                T_evap = T_evap_nom
+            if T_cond_nom - (T_CW - Q_cond_nom/(m_CW_nom*cp_water)) < T_pinch_CW:
+                T_cond = T_CW + del_T_CW + T_pinch_CW
+            else:
+                T_cond = T_cond_nom
+
+            # enthalpies_entropies
+            p_evap,_,h_3,_,s_3,inside_evap = saturation_state(T_evap,table,k_min,k_max,tol)
+            p_cond,h_4_liq,h_4_vap,s_4_liq,s_4_vap,inside_cond = saturation_state(T_cond,table,k_min,k_max,tol)
+            if not (inside_evap and inside_cond):
+                outside_table[task] += 1
+
+            x_4_isen = (s_3-s_4_liq)/(s_4_vap-s_4_liq)
+            h_4_isen = h_4_vap*x_4_isen+h_4_liq*(1-x_4_isen)
+            h_4 = (h_4_isen-h_3)*eff_isen_turb+h_3
+            h_1 = h_4_liq
+            h_2 = 1/rho_NH3*(p_evap-p_cond)*1E5/1E3/eff_isen_pump+h_1
+
+            # evaporator_regulation, the branches are combined with booleans like in the NumPy version, so that NaN propagates the same way
+            T_WW_out_initial = T_WW - epsilon_evap*(T_WW - T_evap)
+            m_NH3_initial = -m_WW_nom*cp_water*(T_WW_out_initial-T_WW)/(h_3-h_2)
+
+            bool_turb = 1.0 if m_NH3_initial*(h_4-h_3) < p_gross_nom else 0.0
+            bool_cond = 1.0 if bool_turb == 0 and m_NH3_initial*(h_1-h_4) < Q_cond_nom else 0.0
+            bool_evap = 1.0 if bool_turb == 0 and m_NH3_initial*(h_1-h_4) >= Q_cond_nom else 0.0
+
+            Q_evap_turb = m_NH3_nom*(h_3-h_2)
+            T_WW_out_turb = T_WW_out_initial
+            if bool_turb == 1:
+                T_WW_out_turb,converged = regulated_outlet_temperature(Q_evap_turb,T_WW,T_evap,T_WW_out_initial,
+                                                                       U_evap*A_evap/(m_WW_nom**0.65*cp_water),cp_water,newton,regulation_tol,max_iter)
+                if not converged:
+                    unconverged[task] += 1
+            m_WW_turb = -Q_evap_turb/(cp_water*(T_WW_out_turb-T_WW))
+
+            m_NH3_target = Q_cond_nom/(h_1-h_4)
+            m_NH3_cond = m_NH3_target if m_NH3_target <= m_NH3_nom else m_NH3_nom
+            Q_evap_cond = m_NH3_cond*(h_3-h_2)
+            Q_evap_evap = -m_WW_nom*cp_water*(T_WW_out_initial-T_WW)
+
+            m_NH3 = m_NH3_nom*bool_turb + m_NH3_cond*bool_cond + m_NH3_nom*bool_evap
+            m_WW = m_WW_turb*bool_turb + m_WW_nom*bool_cond + m_WW_nom*bool_evap
+            T_WW_out = T_WW_out_turb*bool_turb + T_WW_out_initial*bool_cond + T_WW_out_initial*bool_evap
+            Q_evap = Q_evap_turb*bool_turb + Q_evap_cond*bool_cond + Q_evap_evap*bool_evap
+
+            # condenser_regulation
+            T_CW_out_initial = T_CW + epsilon_cond*(T_cond-T_CW)
+            Q_cond = m_NH3*(h_1 - h_4)
+            T_CW_out,converged = regulated_outlet_temperature(Q_cond,T_CW,T_cond,T_CW_out_initial,
+                                                              U_cond*A_cond/(m_CW_nom**0.65*cp_water),cp_water,newton,regulation_tol,max_iter)
+            if not converged:
+                unconverged[task] += 1
+            m_CW = -Q_cond/(cp_water*(T_CW_out-T_CW))
+
+            # power consumption of the pumps and net power output
+            p_pump_NH3 = m_NH3*(h_2-h_1)/eff_pump_NH3_mech
+            p_gross = m_NH3*(h_4-h_3)
+            p_pump_WW = pipe_pump_power(m_WW,T_WW,rho_WW,A_pipes_WW,d_pipes_WW,length_WW,roughness_pipe,K_L,eff_hyd,eff_el)
+            p_pump_CW = pipe_pump_power(m_CW,T_CW,rho_CW,A_pipes_CW,d_pipes_CW,length_CW,roughness_pipe,K_L,eff_hyd,eff_el)
+            p_pump_total = p_pump_NH3 + p_pump_WW + p_pump_CW
+
+            p_net = (p_gross*eff_turb_el*eff_turb_mech + p_pump_total)*eff_trans
+            if p_net > 0:
+                p_net = np.nan
+
+            results[0,c,t,s] = m_NH3
+            results[1,c,t,s] = T_evap
+            results[2,c,t,s] = T_WW_out
+            results[3,c,t,s] = m_WW
+            results[4,c,t,s] = Q_evap
+            results[5,c,t,s] = T_cond
+            results[6,c,t,s] = T_CW_out
+            results[7,c,t,s] = m_CW
+            results[8,c,t,s] = Q_cond
+            results[9,c,t,s] = p_gross
+            results[10,c,t,s] = p_net
+            results[11,c,t,s] = p_pump_total
+            results[12,c,t,s] = p_pump_NH3
+            results[13,c,t,s] = p_pump_WW
+            results[14,c,t,s] = p_pump_CW
+            results[15,c,t,s] = -p_net/Q_evap
+
+    return unconverged.sum(),outside_table.sum()
+
+nominal_keys = ['m_NH3_nom','m_WW_nom','m_CW_nom','Q_evap_nom','Q_cond_nom','T_evap_nom','T_cond_nom','del_T_WW','del_T_CW',
+                'A_evap','A_cond','p_gross_nom','epsilon_evap','epsilon_cond','A_pipes_WW','d_pipes_WW','A_pipes_CW','d_pipes_CW','eff_trans']
+
+result_keys = ['m_NH3','T_evap','T_WW_out','m_WW','Q_evap','T_cond','T_CW_out','m_CW','Q_cond',
+               'p_gross','p_net','p_pump_total','p_pump_NH3','p_pump_WW','p_pump_CW','eff_net']
+
+constant_keys = ['T_pinch_WW','T_pinch_CW','cp_water','U_evap','U_cond','eff_isen_turb','rho_NH3','eff_isen_pump','eff_pump_NH3_mech',
+                 'rho_WW','rho_CW','length_WW','length_CW','roughness_pipe','K_L','eff_hyd','eff_el','eff_turb_el','eff_turb_mech']
+
+def otec_operation_fused(otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs):
+
+    ## Same inputs and outputs as otec_operation. The nominal values have the shape (sites) or (configurations, 1, sites) and the temperature profiles
+    ## (time, sites). Returns None if the operating points cannot be computed with the kernel, so that otec_operation falls back to NumPy.
+
+    dtype = np.dtype(inputs['precision'])
+
+    _,epsilon_evap = initial_NTU_and_epsilon(inputs,otec_plant_nom,'evap')
+    _,epsilon_cond = initial_NTU_and_epsilon(inputs,otec_plant_nom,'cond')
+    nominal_values = {**otec_plant_nom,'epsilon_evap': epsilon_evap,'epsilon_cond': epsilon_cond,'eff_trans': inputs['eff_trans']}
+
+    shape = np.broadcast_shapes(np.shape(T_WW_profiles),np.shape(T_CW_profiles),*[np.shape(nominal_values[key]) for key in nominal_keys])
+    if len(shape) > 3:
+        return None
+    shape = (1,)*(3-len(shape)) + shape
+    n_configurations,n_time,n_sites = shape
+
+    # the nominal values do not change over time, so they are stored once per configuration and site
+    nominal = np.empty((len(nominal_keys),n_configurations,n_sites),dtype=np.float64)
+    for index,key in enumerate(nominal_keys):
+        value = np.asarray(nominal_values[key],dtype=np.float64)
+        nominal[index] = np.broadcast_to(value.reshape((1,)*(3-value.ndim) + value.shape),(n_configurations,1,n_sites))[:,0,:]
+
+    T_WW = np.broadcast_to(np.asarray(T_WW_profiles,dtype=dtype),shape)
+    T_CW = np.broadcast_to(np.asarray(T_CW_profiles,dtype=dtype),shape)
+
+    k_min,k_max,table = property_table(inputs['ammonia_eos'])
+    table = np.array([table[key] for key in ['p','h_liq','h_vap','s_liq','s_vap']])
+    tol = 4*np.finfo(dtype).eps*max(abs(k_min),abs(k_max))
+
+    constants = tuple(float(inputs[key]) for key in constant_keys)
+
+    results = np.empty((len(result_keys),) + shape,dtype=dtype)
+
+    unconverged,outside_table = fused_operation(T_WW,T_CW,nominal,table,k_min,k_max,tol,constants,inputs['regulation_solver'] == 'newton',
+                                                float(inputs['regulation_tol']),int(inputs['regulation_max_iter']),results)
+
+    if outside_table > 0:
+        print(f'{outside_table} saturation temperatures are outside of the ammonia property table. The operation is calculated with NumPy instead.')
+        return None
+
+    if unconverged > 0:
+        print(f'Heat exchanger regulation did not converge for {unconverged} elements after {inputs["regulation_max_iter"]} iterations.')
+
+    # the leading configuration axis is removed again if the nominal values do not have one
+    ndim = max(np.ndim(T_WW_profiles),np.ndim(T_CW_profiles),*[np.ndim(nominal_values[key]) for key in nominal_keys])
+    otec_plant_ts = {key: results[index].reshape(shape[3-ndim:]) for index,key in enumerate(result_keys)}
+
+    otec_plant_nom_precision = {key: np.asarray(value,dtype=dtype) for key,value in otec_plant_nom.items()}
+    evaporator_sanity_check(otec_plant_ts['m_NH3'],otec_plant_ts['m_WW'],otec_plant_ts['Q_evap'],otec_plant_ts['T_WW_out'],otec_plant_ts['T_evap'],otec_plant_nom_precision,inputs)
+    condenser_sanity_check(otec_plant_ts['Q_cond'],otec_plant_ts['T_CW_out'],otec_plant_ts['T_cond'],otec_plant_nom_precision,inputs)
+
+    otec_plant_ts['LCOE'] = lcoe_time_series(otec_plant_nom,inputs,otec_plant_ts['p_net'])
+
+    return otec_plant_ts
@@ -19,13 +19,38 @@ def otec_operation(otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs):
     
     # to avoid confusion with the variables used for plant sizing, we use the suffix ts for time series
     
-    T_evap_ts,p_evap_ts = pressure_regulation(T_WW_profiles,otec_plant_nom,inputs,'evap')
-    T_cond_ts,p_cond_ts = pressure_regulation(T_CW_profiles,otec_plant_nom,inputs,'cond')
+    # The time series are calculated with inputs['precision']. The temperature profiles and the nominal values are cast to that precision,
+    # because NumPy would otherwise promote every time series to the wider of the two, and the tolerance of the sanity checks would no longer
+    # match the precision of the nominal values. The LCOE is calculated from the float64 nominal values.
+    
+    T_WW_profiles = np.asarray(T_WW_profiles,dtype=inputs['precision'])
+    T_CW_profiles = np.asarray(T_CW_profiles,dtype=inputs['precision'])
+    
+    ## With operation_backend = 'numba', all operating points are computed in one compiled loop without intermediate time series.
+    ## If Numba is not installed, or the kernel cannot handle the inputs, the NumPy functions below are used.
+    
+    if inputs['operation_backend'] == 'numba':
+        # the kernel and Numba are only imported when they are used, because importing Numba takes about a second
+        from operation_kernel import numba_available,otec_operation_fused
+        if numba_available:
+            otec_plant_ts = otec_operation_fused(otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs)
+            if otec_plant_ts is not None:
+                return otec_plant_ts
+        else:
+            print('Numba is not installed. The operation is calculated with NumPy instead.')
+    elif inputs['operation_backend'] != 'numpy':
+        raise ValueError('Invalid operation backend. Please choose between "numpy" and "numba".')
+    
+    otec_plant_nom_float64 = otec_plant_nom
+    otec_plant_nom = {key: np.asarray(value,dtype=inputs['precision']) for key,value in otec_plant_nom.items()}
+    
+    T_evap_ts,evaporator_ts = pressure_regulation(T_WW_profiles,otec_plant_nom,inputs,'evap')
+    T_cond_ts,condenser_ts = pressure_regulation(T_CW_profiles,otec_plant_nom,inputs,'cond')
     
     NTU_evap_initial,epsilon_evap_initial = initial_NTU_and_epsilon(inputs,otec_plant_nom,'evap')
     NTU_cond_initial,epsilon_cond_initial = initial_NTU_and_epsilon(inputs,otec_plant_nom,'cond')
        
-    enthalpies_ts = enthalpies_entropies(p_evap_ts,p_cond_ts,inputs)
+    enthalpies_ts = enthalpies_entropies(evaporator_ts,condenser_ts,inputs)
            
     m_NH3_ts,m_WW_ts,T_WW_out_ts,Q_evap_ts = evaporator_regulation(enthalpies_ts,T_WW_profiles,T_evap_ts,epsilon_evap_initial,inputs,otec_plant_nom)
     t_CW_out_ts,m_CW_ts,Q_cond_ts = condenser_regulation(T_CW_profiles,inputs,otec_plant_nom,m_NH3_ts,T_cond_ts,enthalpies_ts,epsilon_cond_initial)
@@ -59,7 +84,7 @@ def otec_operation(otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs):
     
     p_pump_total_ts = p_pump_NH3_ts + p_pump_WW_ts + p_pump_CW_ts
     
-    p_net_ts = (p_gross_ts*inputs['eff_turb_el']*inputs['eff_turb_mech'] + p_pump_total_ts)*inputs['eff_trans']
+    p_net_ts = (p_gross_ts*inputs['eff_turb_el']*inputs['eff_turb_mech'] + p_pump_total_ts)*np.asarray(inputs['eff_trans'],dtype=inputs['precision'])
     
     if np.any(p_net_ts > 0):
         # print('Infeasible systems detected and replaced by NaN')
@@ -67,7 +92,7 @@ def otec_operation(otec_plant_nom,T_WW_profiles,T_CW_profiles,inputs):
     
     eff_net_ts = -p_net_ts/Q_evap_ts
     
-    LCOE_ts = lcoe_time_series(otec_plant_nom,inputs,p_net_ts)
+    LCOE_ts = lcoe_time_series(otec_plant_nom_float64,inputs,p_net_ts)
     
     otec_plant_ts = {
         'm_NH3': m_NH3_ts,
@@ -48,6 +48,109 @@ def condenser_sizing(T_CW_in,del_T_CW,T_cond,m_NH3,enthalpies,inputs):
     
     return condenser
 
+def pipe_pairs_and_diameter(A_pipes,max_d):
+    
+    # To avoid making the same calculation twice for inlet and outlet pipe, we assume that they form one single pipe
+    # with the same properties (diameter, thickness, etc.) and loading (water flow, pressure drop, etc.)
+    # Therefore, we don't count the individual inlet and outlet pipes, but the pipe pairs. Once we have the required pairs,
+    # we multiply the pairs with 2 to obtain the number of actual pipes needed.
+    
+    # We need the smallest number of pipe pairs for which the diameter does not exceed max_d. Instead of adding one pair at a time,
+    # we calculate it directly with ceil and correct the result by one pair where floating point rounding puts it on the wrong side of max_d.
+    
+    pipe_pairs = np.fmax(1,np.ceil(A_pipes*4/(np.pi*max_d**2)))
+    
+    pipe_pairs = np.where(np.sqrt(A_pipes*4/(np.pi*pipe_pairs)) > max_d, pipe_pairs + 1, pipe_pairs)
+    pipe_pairs = np.where((pipe_pairs > 1) & (np.sqrt(A_pipes*4/(np.pi*np.fmax(1,pipe_pairs - 1))) <= max_d), pipe_pairs - 1, pipe_pairs)
+    
+    d_pipes = np.sqrt(A_pipes*4/(np.pi*pipe_pairs))
+    
+    return pipe_pairs,d_pipes
+
+def pipe_pressure_drop(T_in,m_water,rho,length,inputs,u_pipes):
+    
+    # pressure drop in kPa of the pipes sized for the flow velocity u_pipes
+    
+    rho_pipe,roughness_pipe = inputs['pipe_material']
+    K_L = inputs['pipe_properties'][3]
+    max_d = inputs['pipe_properties'][7]
+    
+    pipe_pairs,d_pipes = pipe_pairs_and_diameter(m_water/rho/u_pipes,max_d)
+    
+    return pressure_drop(T_in,u_pipes,d_pipes,rho,roughness_pipe,length,K_L,u_pipes/2)
+
+def stepped_pipe_velocity(T_in,m_water,rho,length,inputs,u_pipes):
+    
+    # like in the original model, the pressure drop of all pipes starts at the nominal pressure drop, so that the nominal velocity is only kept if it is below max_p
+    
+    pressure_drop_nom = inputs['pipe_properties'][6]
+    max_p = inputs['pipe_properties'][8]
+    
+    u_pipes = np.array(u_pipes,dtype=np.float64)
+    p_drop = np.ones(np.size(m_water),dtype=np.float64)*pressure_drop_nom
+    
+    active = np.flatnonzero(p_drop >= max_p)
+    while active.size > 0:
+        u_pipes[active] = u_pipes[active] - 0.1
+        p_drop[active] = pipe_pressure_drop(T_in[active],m_water[active],rho,length,inputs,u_pipes[active])
+        active = active[p_drop[active] >= max_p]
+    
+    return u_pipes
+
+def bisected_pipe_velocity(T_in,m_water,rho,length,inputs):
+    
+    ## The upper end of the search is the first velocity that the stepped method evaluates, i.e. one step below the nominal velocity if the nominal
+    ## pressure drop is not below max_p. Pipes that are feasible there get the same velocity as with the stepped method. For all others, we search
+    ## the largest velocity between 0.1 m/s and the upper end at which the pressure drop is below max_p.
+    
+    u_nom = inputs['pipe_properties'][4]
+    pressure_drop_nom = inputs['pipe_properties'][6]
+    max_d = inputs['pipe_properties'][7]
+    max_p = inputs['pipe_properties'][8]
+    
+    u_pipes = np.ones(np.size(m_water),dtype=np.float64)*(u_nom - 0.1 if pressure_drop_nom >= max_p else u_nom)
+    
+    active = np.flatnonzero(pipe_pressure_drop(T_in,m_water,rho,length,inputs,u_pipes) >= max_p)
+    T_active = T_in[active]
+    m_active = m_water[active]
+    
+    ## With a given number of pipe pairs, the pressure drop increases with the velocity. With increasing velocity, however, fewer pipe pairs are
+    ## needed, and the pressure drop falls whenever one pair less is needed. Therefore, we go from the upper end down through the velocity ranges
+    ## with one, two, ... more pipe pairs, until the pressure drop at the lower end of a range (where the diameter reaches max_d) is below max_p.
+    ## The largest feasible velocity is then bisected within that range.
+    
+    u_high = u_pipes[active]
+    u_low = np.full(active.size,np.nan)
+    pipe_pairs,_ = pipe_pairs_and_diameter(m_active/rho/u_high,max_d)
+    
+    searching = np.arange(active.size)
+    while searching.size > 0:
+        # slightly above the lower end, so that rounding does not add another pipe pair
+        u_range = np.fmax(0.1,m_active[searching]/rho/(pipe_pairs[searching]*np.pi*max_d**2/4)*(1+1E-9))
+        feasible = pipe_pressure_drop(T_active[searching],m_active[searching],rho,length,inputs,u_range) < max_p
+        u_low[searching[feasible]] = u_range[feasible]
+        
+        lower = ~feasible & (u_range > 0.1)
+        u_high[searching[lower]] = u_range[lower]
+        pipe_pairs[searching[lower]] += 1
+        searching = searching[lower]
+    
+    found = np.flatnonzero(~np.isnan(u_low))
+    while found.size > 0 and np.max(u_high[found]-u_low[found]) > inputs['pipe_velocity_tol']:
+        u_mid = (u_low[found]+u_high[found])/2
+        feasible = pipe_pressure_drop(T_active[found],m_active[found],rho,length,inputs,u_mid) < max_p
+        u_low[found] = np.where(feasible,u_mid,u_low[found])
+        u_high[found] = np.where(feasible,u_high[found],u_mid)
+    
+    u_pipes[active] = u_low
+    
+    # pipes for which not even 0.1 m/s is below max_p, or whose velocity is not feasible because of rounding, are sized with the stepped method
+    infeasible = active[~(pipe_pressure_drop(T_active,m_active,rho,length,inputs,u_low) < max_p)]
+    if infeasible.size > 0:
+        u_pipes[infeasible] = stepped_pipe_velocity(T_in[infeasible],m_water[infeasible],rho,length,inputs,np.ones(infeasible.size)*u_nom)
+    
+    return u_pipes
+
 def seawater_pipe_sizing(T_in,m_water,rho,length,inputs):
     
     ## Load and unpack inputs to improve readibility of code below   
@@ -63,62 +166,71 @@ def seawater_pipe_sizing(T_in,m_water,rho,length,inputs):
     max_d, \
     max_p = inputs['pipe_properties']
     
-    u_pipes = np.ones(np.size(T_in),dtype=np.float64)*u_pipes
-    p_drop = np.ones(np.size(T_in),dtype=np.float64)*pressure_drop_nom
+    # the mass flow can carry more axes than the temperature, e.g. when several temperature differences are sized at once
+    shape = np.broadcast_shapes(np.shape(T_in),np.shape(m_water))
     
-
-    while np.any(p_drop >= max_p):
-        
-        u_pipes[p_drop >= max_p] = u_pipes[p_drop >= max_p] - 0.1
-        u_HX = u_pipes/2
-        
-        A_pipes = m_water/rho/u_pipes
-        
-        # To avoid making the same calculation twice for inlet and outlet pipe, we assume that they form one single pipe
-        # with the same properties (diameter, thickness, etc.) and loading (water flow, pressure drop, etc.)
-        # Therefore, we don't count the individual inlet and outlet pipes, but the pipe pairs. Once we have the required pairs,
-        # we multiply the pairs with 2 to obtain the number of actual pipes needed.
-        
-        pipe_pairs = np.zeros(np.size(T_in),dtype=np.float64)       
-        
-        d_pipes = np.ones(np.size(T_in),dtype=np.float64)*(max_d+0.1)
-        thickness = d_pipes/SDR_ratio
-        
-        
-        
-        while np.any(d_pipes > max_d):
-            pipe_pairs[d_pipes > max_d] = pipe_pairs[d_pipes > max_d] + 1
-            d_pipes = np.sqrt(A_pipes*4/(np.pi*pipe_pairs))
-            thickness = d_pipes/SDR_ratio # adjust the thickness of the pipe based on its diameter
-                            
-        m_pipes = np.pi/4*((d_pipes+2*thickness)**2-d_pipes**2)*length*rho_pipe*pipe_pairs
-        
-        num_pipes = pipe_pairs*2
-        
-        # print(d_pipes,thickness)
-        
-        p_drop = pressure_drop(T_in,u_pipes,d_pipes,rho,roughness_pipe,length,K_L,u_HX)
+    T_in = np.broadcast_to(T_in,shape).ravel()
+    m_water = np.broadcast_to(m_water,shape).ravel()
+    
+    ## The flow velocity in the pipes is reduced until the pressure drop falls below max_p. With the "stepped" method, we reduce the velocity
+    ## in steps of 0.1 m/s like the original model, but only recalculate the pipes that still exceed the maximum pressure drop. With the
+    ## "bisection" method, we search the velocity at which the pressure drop reaches max_p between 0.1 m/s and the first velocity that the
+    ## stepped method evaluates.
+    
+    if inputs['pipe_sizing'] == 'stepped':
+        u_pipes = stepped_pipe_velocity(T_in,m_water,rho,length,inputs,np.ones(np.size(m_water),dtype=np.float64)*u_pipes)
+    elif inputs['pipe_sizing'] == 'bisection':
+        u_pipes = bisected_pipe_velocity(T_in,m_water,rho,length,inputs)
+    else:
+        raise ValueError('Invalid pipe sizing method. Valid inputs are "stepped" and "bisection"')
+    
+    A_pipes = m_water/rho/u_pipes
+    
+    pipe_pairs,d_pipes = pipe_pairs_and_diameter(A_pipes,max_d)
+    thickness = d_pipes/SDR_ratio # adjust the thickness of the pipe based on its diameter
+    
+    m_pipes = np.pi/4*((d_pipes+2*thickness)**2-d_pipes**2)*length*rho_pipe*pipe_pairs
+    
+    num_pipes = pipe_pairs*2
+    
+    p_drop = pressure_drop(T_in,u_pipes,d_pipes,rho,roughness_pipe,length,K_L,u_pipes/2)
        
     p_pump = m_water/rho*p_drop/inputs['eff_hyd']/inputs['eff_el']
     
     pipes = {
-        'd_pipes': d_pipes,
-        'num_pipes': num_pipes,
-        'm_pipes': m_pipes,
-        'A_pipes': A_pipes,
-        'p_pump': p_pump
+        'd_pipes': d_pipes.reshape(shape),
+        'num_pipes': num_pipes.reshape(shape),
+        'm_pipes': m_pipes.reshape(shape),
+        'A_pipes': A_pipes.reshape(shape),
+        'p_pump': p_pump.reshape(shape)
         }
     
     return pipes
 
 
+def net_power(p_pump_total,Q_evap,inputs):
+    
+    # the transmission efficiency is the only site property apart from the seawater temperatures that the nominal plant depends on
+    
+    p_net = (inputs['p_gross']*inputs['eff_turb_el']*inputs['eff_turb_mech'] + p_pump_total)*inputs['eff_trans']  
+    eff_net = -p_net/Q_evap
+    
+    if np.any(p_net > 0):
+        # print('Infeasible systems detected and replaced by NaN')
+        p_net = np.where(p_net > 0, np.nan, p_net)
+    
+    return p_net,eff_net
+
 def otec_sizing(T_WW_in,T_CW_in,del_T_WW,del_T_CW,inputs,cost_level):
         
     # inputs = parameters_and_constants(cost_level)
     
-    T_evap,T_cond,p_evap,p_cond = saturation_pressures_and_temperatures(T_WW_in,T_CW_in,del_T_WW,del_T_CW,inputs)
+    T_evap,T_cond,evaporator,condenser = saturation_pressures_and_temperatures(T_WW_in,T_CW_in,del_T_WW,del_T_CW,inputs)
+    
+    p_evap = evaporator['p']
+    p_cond = condenser['p']
             
-    enthalpies = enthalpies_entropies(p_evap,p_cond,inputs)
+    enthalpies = enthalpies_entropies(evaporator,condenser,inputs)
     
     m_NH3,p_pump_NH3 = ammonia_pump_sizing(p_evap,p_cond,enthalpies,inputs)
     
@@ -139,12 +251,7 @@ def otec_sizing(T_WW_in,T_CW_in,del_T_WW,del_T_CW,inputs,cost_level):
     
     p_pump_total = p_pump_NH3/inputs['eff_pump_NH3_mech'] + pipes_WW['p_pump'] + pipes_CW['p_pump']
     
-    p_net = (inputs['p_gross']*inputs['eff_turb_el']*inputs['eff_turb_mech'] + p_pump_total)*inputs['eff_trans']  
-    eff_net = -p_net/evaporator['Q_evap']
-    
-    if np.any(p_net > 0):
-        # print('Infeasible systems detected and replaced by NaN')
-        p_net = np.where(p_net > 0, np.nan, p_net)
+    p_net,eff_net = net_power(p_pump_total,evaporator['Q_evap'],inputs)
    
     
     # Pack results
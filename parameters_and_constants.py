@@ -32,7 +32,55 @@ def parameters_and_constants(p_gross=-136000,cost_level='low_cost',data='CMEMS')
         date_start = '2020-01-01 00:00:00'      
         date_end = '2020-12-31 21:00:00'
         
-    t_resolution = '24H'    
+        download_workers = 4    # number of CMEMS downloads running at the same time
+        download_retries = 3    # number of times a failed download is retried
+        download_backoff = 10   # waiting time in seconds before the first retry, doubled for every further retry
+        
+    t_resolution = '24H'
+
+    ## The plants are designed for percentiles of the seawater temperatures (see off_design_analysis.py), by default the minimum, median and maximum.
+    ## With design_years, e.g. list(range(2000,2021)), the design temperatures are calculated over several years, which are downloaded and processed one after
+    ## another without holding all profiles in memory (see design_statistics.py). The off-design analysis still uses the year given by date_start and date_end.
+
+    design_percentiles = [0,50,100]     # three percentiles of the warm seawater temperatures, the cold seawater temperatures use them in reverse order
+    design_years = None                 # list of years for the design temperatures, None uses the year given by date_start and date_end
+    design_compression = 200            # number of centroids per site that summarise the temperatures of several years
+    
+    memory_budget = 4000    # memory in MB that the time series of the off-design analysis may occupy at once
+    
+    site_blocks = False     # True splits the sites into blocks that fit into memory_budget, which are simulated and exported one after another
+    block_time_series = ['p_net']   # time series that are kept for all sites with site_blocks = True, all other time series are only exported
+    
+    region_workers = 2      # number of regions analysed in parallel by global_analysis, each of them using up to memory_budget
+    
+    nc_chunk_size = 64      # maximum size in MB of the seawater temperature chunks read at once from the netCDF files
+    outlier_chunk_size = 64 # maximum size in MB of the rolling windows that are sorted at once by the outlier filter
+    
+    ## Precision of the seawater temperature profiles and the off-design time series. With 'float32', memory and bandwidth are halved,
+    ## while the plant sizing, the residuals of the regulation solvers and the LCOE are still calculated with float64. Compared to 'float64',
+    ## temperatures, mass flows and heat flows deviate by less than 1E-6 (relative), the ammonia pump power (a small enthalpy difference) by less than 5E-4
+    ## (relative) and the LCOE by less than 2E-5 (relative). The gross and net power deviate by less than 2E-5 of the nominal gross power p_gross
+    ## (about 1.4 kW at 136 MW). Relative to the net power of each time step, the deviation is larger where the net power is close to zero (up to 3E-3).
+    ## The selected configurations are unchanged.
+    
+    precision = 'float64'
+    
+    ## Export of the off-design time series
+    
+    export_variables = None         # list of variables to export, e.g. ['p_net','LCOE'], None exports all variables
+    export_sites = None             # list of site labels ("longitude_latitude") or column indices to export, None exports all sites
+    export_chunks = [365,64]        # chunk size in time steps x sites of the compressed h5 file
+    export_complevel = 2            # compression level (0-9) of blosc with zstd, higher levels compress slightly better but write much slower
+    
+    ## Cache of the nominal designs and off-design results, stored in the folder "cache" of each run
+    
+    cache_size = 4000               # maximum size of the cache in MB, the least recently used results are deleted first. 0 disables the cache
+    cache_off_design = False        # True also caches the off-design results, which hold all time series of all sites and take about as much disk space as memory
+    
+    ## Telemetry of the run stages (download, processing, sizing, off-design operation, export), reported in a json file next to the results
+    
+    telemetry = True                # records wall time, CPU time and array sizes of every stage
+    profile_stage = None            # name of one stage to profile with cProfile (e.g. 'off-design operation'), the statistics are stored next to the report
 
     ## Physical properties
     
@@ -44,6 +92,9 @@ def parameters_and_constants(p_gross=-136000,cost_level='low_cost',data='CMEMS')
     
     fluid_properties = [rho_NH3,rho_WW,rho_CW,cp_water]
     
+    ammonia_eos = 'polynomial'      # equation of state for the saturation properties of ammonia, see ammonia_properties.py
+    ammonia_off_grid = 'equation'   # saturation temperatures between the 0.1 °C grid points (i.e. at part load) are evaluated with the 'equation' of state or by 'interpolation' in the table, which only pays off for slow equations of state
+    
     roughness_pipe = 0.03 #053     # roughness of pipe in m 
     
     if cost_level == 'low_cost':        
@@ -83,6 +134,8 @@ def parameters_and_constants(p_gross=-136000,cost_level='low_cost',data='CMEMS')
                          interval_WW,
                          interval_CW]
     
+    design_grid = 'broadcast'   # 'broadcast' sizes the plants for all temperature differences at once, 'loop' sizes them one pair after another
+    
     temperatures = [T_pinch_WW,
                     T_pinch_CW,
                     del_T_for_looping]
@@ -94,6 +147,14 @@ def parameters_and_constants(p_gross=-136000,cost_level='low_cost',data='CMEMS')
     
     U = [U_evap,U_cond]
     
+    ## Off-design regulation of the heat exchangers
+    
+    regulation_solver = 'newton'    # 'newton' or 'fixed_point' iteration for the seawater outlet temperature at part load
+    regulation_tol = 1E-7           # convergence tolerance of the seawater outlet temperature in °C
+    regulation_max_iter = 200       # maximum number of iterations per heat exchanger
+    
+    operation_backend = 'numpy'     # 'numpy' or 'numba' (one compiled loop over all operating points, saturation properties between the 0.1 °C grid points are interpolated)
+    
     ## Seawater pipes
     
     length_WW_inlet = 21.598819732666016    # warm seawater inlet pipe length in m, according to Copernicus dataset depth
@@ -110,6 +171,13 @@ def parameters_and_constants(p_gross=-136000,cost_level='low_cost',data='CMEMS')
     pressure_drop_nom = 100     # maximum pressure in 
     max_d = 8             # maximum inner seawater pipe diameter in m
     max_p = 100             # maximum pressure drop in kPa 
+    pipe_sizing = 'stepped'     # 'stepped' lowers the flow velocity in steps of 0.1 m/s until the pressure drop is below max_p, 'bisection' solves for the largest velocity below max_p
+    pipe_velocity_tol = 0.001   # tolerance in m/s of the flow velocity found with the 'bisection' method
+    
+    ## With the default max_p and max_d, the pressure drop is already below max_p at the first step (2.0 m/s), and both methods give the same plants.
+    ## With tighter limits (e.g. max_p = 60 kPa or max_d = 4 m), the bisection finds velocities between the steps of 0.1 m/s (never more than
+    ## pipe_velocity_tol below the stepped velocity), which changed the nominal LCOE by -0.6 % to +8 % and the selected temperature differences of
+    ## up to a third of the sites in our tests with CMEMS and synthetic sites. 'bisection' is therefore no replacement for the original model.
     
     pipe_properties = [length_WW,
                        length_CW,
@@ -18,13 +18,14 @@ import time
 import pandas as pd
 import numpy as np
 import platform
-import matplotlib.pyplot as plt
 
 import CMEMS_download_and_processing as Cdp
 import parameters_and_constants as pc
 import off_design_analysis as oda
-import create_plots as cp
 import cost_analysis as co
+from general_scripts import p_gross_label
+from results_catalog import register_run
+from telemetry import start_run,stage,write_report
 
 
 
@@ -35,75 +36,103 @@ import cost_analysis as co
 def pyOTEC(studied_region,p_gross=-136000,cost_level='low_cost'):
     start = time.time()
     parent_dir = os.getcwd() + '/Data_Results/'
+    
+    ## p_gross can also be a list of gross power outputs. Then, all plant sizes are evaluated in one run with the same temperature data,
+    ## and pyOTEC returns the plant size with the lowest LCOE for each site.
+    
+    if np.ndim(p_gross) > 0:
+        p_gross = np.array(p_gross,dtype=np.float64)
+    
     inputs = pc.parameters_and_constants(p_gross,cost_level,'CMEMS')
     year = inputs['date_start'][0:4]
     
+    # runs with design temperatures over several years are stored separately from the runs that are designed for one year only
+    
+    if inputs['design_years'] is None:
+        period = year
+    else:
+        period = f'{year}_design_{min(inputs["design_years"])}-{max(inputs["design_years"])}'
+    
     if platform.system() == 'Windows':
         dl_path = os.path.join(parent_dir,f'{studied_region}\\'.replace(" ","_"))
-        new_path = dl_path + f'{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}\\'.replace(" ","_")
+        new_path = dl_path + f'{studied_region}_{period}_{p_gross_label(p_gross)}_MW_{cost_level}\\'.replace(" ","_")
     else :
         dl_path = os.path.join(parent_dir,f'{studied_region}/'.replace(" ","_"))
-        new_path = dl_path+ f'{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}/'.replace(" ","_")
+        new_path = dl_path+ f'{studied_region}_{period}_{p_gross_label(p_gross)}_MW_{cost_level}/'.replace(" ","_")
     
     if os.path.isdir(new_path):
         pass
     else:
         os.makedirs(new_path)
+    
+    ## The stages of the run are timed and reported in a json file next to the results, see telemetry.py
+    
+    start_run(new_path,inputs)
         
 
         
-    depth_WW = inputs['length_WW_inlet']
-    depth_CW = inputs['length_CW_inlet']
       
-    files = Cdp.download_data(cost_level,inputs,studied_region,dl_path)
-    
-    print('\n++ Processing seawater temperature data ++\n')   
+    with stage('site filtering') as record:
+        sites_df = pd.read_csv('CMEMS_points_with_properties.csv',delimiter=';')
+        sites_df = sites_df[(sites_df['region']==studied_region) & (sites_df['water_depth'] <= inputs['min_depth']) & (sites_df['water_depth'] >= inputs['max_depth'])]   
+        sites_df = sites_df.sort_values(by=['longitude','latitude'],ascending=True)
+        record['sites'] = len(sites_df)
     
-    sites_df = pd.read_csv('CMEMS_points_with_properties.csv',delimiter=';')
-    sites_df = sites_df[(sites_df['region']==studied_region) & (sites_df['water_depth'] <= inputs['min_depth']) & (sites_df['water_depth'] >= inputs['max_depth'])]   
-    sites_df = sites_df.sort_values(by=['longitude','latitude'],ascending=True)
+    ## With design_years, the years are downloaded and processed one after another, see multi_year_temperatures in CMEMS_download_and_processing.py
     
-  
-    h5_file_WW = os.path.join(new_path, f'T_{round(depth_WW,0)}m_{year}_{studied_region}.h5'.replace(" ","_"))
-    h5_file_CW = os.path.join(new_path, f'T_{round(depth_CW,0)}m_{year}_{studied_region}.h5'.replace(" ","_"))
-    
-    if os.path.isfile(h5_file_CW):
-        T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_columns_CW = Cdp.load_temperatures(h5_file_CW, inputs)
-        print(f'{h5_file_CW} already exist. No processing necessary.')
-    else:
-        T_CW_profiles, T_CW_design, coordinates_CW, id_sites, timestamp, inputs, nan_columns_CW = Cdp.data_processing(files[int(len(files)/2):int(len(files))],sites_df,inputs,studied_region,new_path,'CW')
-    if os.path.isfile(h5_file_WW):
-        T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_columns_WW = Cdp.load_temperatures(h5_file_WW, inputs)
-        print(f'{h5_file_WW} already exist. No processing necessary.')
+    if inputs['design_years'] is None:
+        with stage('download'):
+            files = Cdp.download_data(cost_level,inputs,studied_region,dl_path)
+        
+        print('\n++ Processing seawater temperature data ++\n')   
+        
+        T_CW_profiles, T_CW_design, T_WW_profiles, T_WW_design, coordinates_CW, id_sites, timestamp, inputs = Cdp.temperature_profiles(files,sites_df,inputs,studied_region,new_path)
     else:
-        T_WW_profiles, T_WW_design, coordinates_WW, id_sites, timestamp, inputs, nan_columns_WW = Cdp.data_processing(files[0:int(len(files)/2)],sites_df,inputs,studied_region,new_path,'WW',nan_columns_CW)
-         
-    otec_plants,capex_opex_comparison = oda.off_design_analysis(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,coordinates_CW,timestamp,studied_region,new_path,cost_level)  
-    
-    sites = pd.DataFrame()
-    sites.index = np.squeeze(id_sites)
-    sites['longitude'] = coordinates_CW[:,0]
-    sites['latitude'] = coordinates_CW[:,1]
-    sites['p_net_nom'] = -otec_plants['p_net_nom'].T/1000
-    sites['AEP'] = -np.nanmean(otec_plants['p_net'],axis=0)*8760/1000000
-    sites['CAPEX'] = otec_plants['CAPEX'].T/1000000
-    sites['LCOE'] = otec_plants['LCOE'].T
-    sites['Configuration'] = otec_plants['Configuration'].T
-    sites['T_WW_min'] = T_WW_design[0,:]
-    sites['T_WW_med'] = T_WW_design[1,:]
-    sites['T_WW_max'] = T_WW_design[2,:]
-    sites['T_CW_min'] = T_CW_design[2,:]
-    sites['T_CW_med'] = T_CW_design[1,:]
-    sites['T_CW_max'] = T_CW_design[0,:]
-    
-    sites = sites.dropna(axis='rows')
+        T_CW_profiles, T_CW_design, T_WW_profiles, T_WW_design, coordinates_CW, id_sites, timestamp, inputs = Cdp.multi_year_temperatures(cost_level,sites_df,inputs,studied_region,dl_path,new_path)
+    
+    with stage('off-design analysis',T_WW_profiles=T_WW_profiles,T_CW_profiles=T_CW_profiles):
+        otec_plants,capex_opex_comparison = oda.off_design_analysis(T_WW_design,T_CW_design,T_WW_profiles,T_CW_profiles,inputs,coordinates_CW,timestamp,studied_region,new_path,cost_level)  
+    
+    with stage('CSV export') as record:
+        sites = pd.DataFrame()
+        sites.index = np.squeeze(id_sites)
+        sites['longitude'] = coordinates_CW[:,0]
+        sites['latitude'] = coordinates_CW[:,1]
+        if np.ndim(inputs['p_gross']) > 0:
+            sites['p_gross_opt'] = -otec_plants['p_gross_nom'].T/1000
+        sites['p_net_nom'] = -otec_plants['p_net_nom'].T/1000
+        sites['AEP'] = -np.nanmean(otec_plants['p_net'],axis=0)*8760/1000000
+        sites['CAPEX'] = otec_plants['CAPEX'].T/1000000
+        sites['LCOE'] = otec_plants['LCOE'].T
+        sites['Configuration'] = otec_plants['Configuration'].T
+        sites['T_WW_min'] = T_WW_design[0,:]
+        sites['T_WW_med'] = T_WW_design[1,:]
+        sites['T_WW_max'] = T_WW_design[2,:]
+        sites['T_CW_min'] = T_CW_design[2,:]
+        sites['T_CW_med'] = T_CW_design[1,:]
+        sites['T_CW_max'] = T_CW_design[0,:]
+    
+        sites = sites.dropna(axis='rows')
 
-    p_net_profile = pd.DataFrame(np.mean(otec_plants['p_net'],axis=1),columns=['p_net'],index=timestamp)
+        p_net_profile = pd.DataFrame(np.mean(otec_plants['p_net'],axis=1),columns=['p_net'],index=timestamp)
     
-    p_gross = inputs['p_gross']
+        p_gross = p_gross_label(inputs['p_gross'])
    
-    sites.to_csv(new_path + f'OTEC_sites_{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_"),index=True, index_label='id',float_format='%.3f',sep=';')
-    p_net_profile.to_csv(new_path + f'net_power_profiles_per_day_{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_"),index=True,sep=';')
+        sites.to_csv(new_path + f'OTEC_sites_{studied_region}_{year}_{p_gross}_MW_{cost_level}.csv'.replace(" ","_"),index=True, index_label='id',float_format='%.3f',sep=';')
+        p_net_profile.to_csv(new_path + f'net_power_profiles_per_day_{studied_region}_{year}_{p_gross}_MW_{cost_level}.csv'.replace(" ","_"),index=True,sep=';')
+    
+        ## For a sweep over plant sizes, we also store the lowest LCOE of every site (rows) and plant size in MW (columns)
+    
+        if 'LCOE_per_size' in otec_plants:
+            lcoe_per_size = pd.DataFrame(otec_plants['LCOE_per_size'].T,index=np.squeeze(id_sites),columns=-inputs['p_gross']/1000)
+            lcoe_per_size = lcoe_per_size.loc[sites.index]
+            lcoe_per_size.to_csv(new_path + f'LCOE_per_size_{studied_region}_{year}_{p_gross}_MW_{cost_level}.csv'.replace(" ","_"),index=True, index_label='id',float_format='%.3f',sep=';')
+        record['sites'] = len(sites)
+    
+    ## Every run is registered in the results catalog, which the comparisons in compare.py query instead of searching the result files
+    
+    with stage('results catalog'):
+        register_run(studied_region,year,inputs['p_gross'],cost_level,new_path,otec_plants,capex_opex_comparison,id_sites,file=os.path.join(parent_dir,'results_catalog.sqlite'))
     
     ## Further analysis, credit: Lucas Vatinel
     ## functions CWP_details and eco_details have not been fully validated, use with caution!
@@ -126,6 +155,7 @@ def pyOTEC(studied_region,p_gross=-136000,cost_level='low_cost'):
     
     # all_pnet_df.to_csv(new_path + f'net_power_profiles_per_location_{studied_region}_{year}_{-p_gross/1000}_MW_{cost_level}.csv'.replace(" ","_"),index=False,sep=';') 
     
+    # import create_plots as cp     # plotting (matplotlib and cartopy) is only imported if it is used
     # cost_dict,best_LCOE_index = cp.plot_capex_opex(new_path,capex_opex_comparison,sites,p_gross,studied_region)
     # #enregistrer ce résultat afin qu'on puisse l'utiliser pour comparer les LCOE etc pour différentes puissances ou différentes hypothèses de calculs (ex: épaisseur de tuyau)
     # eco = pd.DataFrame.from_dict(cost_dict)
@@ -134,6 +164,9 @@ def pyOTEC(studied_region,p_gross=-136000,cost_level='low_cost'):
         
     # co.extract_costs_at_study_location(sites,capex_opex_comparison,user_lon=55.25,user_lat=-20.833)s
     
+    write_report(new_path + f'run_report_{studied_region}_{year}_{p_gross}_MW_{cost_level}.json'.replace(" ","_"),
+                 region=studied_region,year=year,design_years=inputs['design_years'],p_gross=p_gross,cost_level=cost_level,precision=inputs['precision'],operation_backend=inputs['operation_backend'])
+    
     end = time.time()
     print('Total runtime: ' + str(round((end-start)/60,2)) + ' minutes.')
     
@@ -152,9 +185,10 @@ if __name__ == "__main__":
     
     ## Please enter the gross power output of the OTEC plants. pyOTEC will determined the economically best system designs for on-design (nominal) and 
     ## off-design (operational) conditions. Make sure that you enter the power output in [kW] as a negative number. For example, if the user wants to size a
-    ## 136 MW_gross system, the user needs to enter -136000
+    ## 136 MW_gross system, the user needs to enter -136000. To compare several plant sizes, enter them separated by commas, e.g. -50000,-100000,-136000
     
-    p_gross = int(input('\nPlease enter the gross power output in [kW] as a negative number (default: -136000 kW).  '))
+    p_gross = [int(value) for value in input('\nPlease enter the gross power output in [kW] as a negative number (default: -136000 kW).  ').split(',')]
+    p_gross = p_gross[0] if len(p_gross) == 1 else p_gross
     
     print("If you are asked to enter your Copernicus username and password, you may prefer to avoid this by linking your PC with your account. For this, please follow the step 6 of the" , f'"README.md", line 26')
 
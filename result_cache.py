@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to hash run parameters and to cache the results of the processing, on-design and off-design stages on disk
+"""
+
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+## These parameters only control how a run is executed (downloads, memory, export, caching) and do not change any result.
+## They are left out of the parameter hashes, so that changing them does not invalidate the cache.
+
+execution_parameters = ['download_workers',
+                        'download_retries',
+                        'download_backoff',
+                        'memory_budget',
+                        'site_blocks',
+                        'block_time_series',
+                        'nc_chunk_size',
+                        'outlier_chunk_size',
+                        'design_grid',
+                        'export_variables',
+                        'export_sites',
+                        'export_chunks',
+                        'export_complevel',
+                        'cache_size',
+                        'cache_off_design',
+                        'region_workers',
+                        'telemetry',
+                        'profile_stage']
+
+## These parameters only affect the off-design operation and are left out of the hash of the nominal designs
+
+off_design_parameters = ['regulation_solver',
+                         'regulation_tol',
+                         'regulation_max_iter',
+                         'operation_backend',
+                         'precision']
+
+def freeze(value):
+
+    ## Converts the inputs into an immutable and hashable representation. Dictionaries become sorted tuples of key-value pairs,
+    ## and arrays are represented by their dtype, shape and a digest of their content, so that large profiles are not copied.
+
+    if isinstance(value,dict):
+        return tuple(sorted((str(key),freeze(item)) for key,item in value.items()))
+    elif isinstance(value,(list,tuple)):
+        return tuple(freeze(item) for item in value)
+    elif isinstance(value,(pd.DataFrame,pd.Series)):
+        return ('DataFrame',freeze(list(map(str,np.atleast_1d(value.index)))),freeze(list(map(str,getattr(value,'columns',[])))),freeze(value.to_numpy()))
+    elif isinstance(value,pd.Index):
+        return ('Index',freeze(np.array(value.astype(str))))
+    elif isinstance(value,np.ndarray):
+        if value.dtype == object or value.dtype.kind in 'UST':
+            content = pickle.dumps(value.tolist())
+        else:
+            content = np.ascontiguousarray(value).view(np.uint8)
+        return ('ndarray',value.dtype.str,value.shape,hashlib.blake2b(content,digest_size=16).hexdigest())
+    elif isinstance(value,np.generic):
+        return value.item()
+    elif value is None or isinstance(value,(bool,int,float,str,bytes)):
+        return value
+    else:
+        raise TypeError(f'Parameters of type {type(value)} cannot be hashed.')
+
+def parameter_hash(*values):
+
+    # the representation of the frozen values is deterministic, so that the same parameters always give the same hash
+
+    return hashlib.blake2b(repr(freeze(values)).encode(),digest_size=16).hexdigest()
+
+def model_parameters(inputs,exclude=()):
+
+    # returns the inputs without the execution parameters and the given keys, e.g. off_design_parameters for the nominal designs
+
+    return {key: value for key,value in inputs.items() if key not in execution_parameters and key not in exclude}
+
+def file_fingerprint(files):
+
+    # downloaded files are identified by their name, size and modification time instead of hashing their content
+
+    return [(os.path.basename(file),os.path.getsize(file),os.stat(file).st_mtime_ns) for file in files]
+
+def load_cached(cache_path,stage,key):
+
+    file = os.path.join(cache_path,f'{stage}_{key}.pkl')
+
+    # the modification time marks the entry as recently used, so that it is evicted last. Another process may evict the entry at any time.
+    try:
+        os.utime(file)
+        with open(file,'rb') as cached_file:
+            result = pickle.load(cached_file)
+    except FileNotFoundError:
+        return None
+
+    print(f'{stage} results loaded from cache.')
+
+    return result
+
+def pickled_size(result):
+
+    # size in bytes of the pickled result, the arrays are passed as out-of-band buffers, so that they are not copied
+
+    buffers = []
+    size = len(pickle.dumps(result,protocol=5,buffer_callback=buffers.append))
+
+    return size + sum(buffer.raw().nbytes for buffer in buffers)
+
+def store_cached(cache_path,stage,key,result,cache_size):
+
+    ## Results are pickled into one file per stage and parameter hash. If the cache exceeds cache_size in MB,
+    ## the least recently used entries are deleted. With a cache_size of 0, nothing is cached.
+
+    if cache_size <= 0:
+        return
+
+    # results that would not fit into the cache on their own are not written, because they would be evicted right away
+    if pickled_size(result) > cache_size*1024**2:
+        print(f'{stage} results exceed the cache size of {cache_size} MB and are not cached.')
+        return
+
+    os.makedirs(cache_path,exist_ok=True)
+
+    # the temporary file is unique per process, so that processes storing the same entry do not write into the same file
+    file = os.path.join(cache_path,f'{stage}_{key}.pkl')
+    with open(f'{file}.{os.getpid()}.tmp','wb') as cached_file:
+        pickle.dump(result,cached_file,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{file}.{os.getpid()}.tmp',file)
+
+    evict_cache(cache_path,cache_size)
+
+def evict_cache(cache_path,cache_size):
+
+    ## Several processes (e.g. the regions of global_analysis) may use and evict the same cache at the same time. Entries that another process has
+    ## removed in the meantime are skipped.
+
+    entries = []
+    for name in os.listdir(cache_path):
+        if name.endswith('.pkl'):
+            try:
+                status = os.stat(os.path.join(cache_path,name))
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime_ns,status.st_size,os.path.join(cache_path,name)))
+
+    total_size = sum([size for _,size,_ in sorted(entries)])
+
+    for _,size,file in sorted(entries):
+        if total_size <= cache_size*1024**2:
+            break
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+        total_size = total_size - size
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to register the results of every pyOTEC run in a local SQLite catalog and to query them for comparisons
+"""
+
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+## The catalog is one SQLite file in the results folder. Each run is identified by its region, year, gross power output in MW (positive)
+## and cost level. Registering the same run again replaces the previous entry, so that the catalog always describes the latest results.
+
+catalog_file = os.path.join('Data_Results','results_catalog.sqlite')
+
+run_columns = ['region','year','p_gross','cost_level','path','n_sites',
+               'LCOE_min','LCOE_median','AEP','CAPEX','p_net_nom',
+               'best_site','best_LCOE','best_p_net','registered']
+
+def open_catalog(file=catalog_file):
+
+    ## The table "runs" holds one row per run with the key metrics of all sites. The table "costs" holds the cost breakdown of all
+    ## configurations at the site with the lowest LCOE, in long format (one row per configuration and cost component).
+
+    if os.path.dirname(file) and not os.path.isdir(os.path.dirname(file)):
+        os.makedirs(os.path.dirname(file))
+
+    # the timeout lets parallel runs of global_analysis wait for each other instead of failing on a locked catalog
+    connection = sqlite3.connect(file,timeout=60)
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS runs (
+            region TEXT, year INTEGER, p_gross REAL, cost_level TEXT, path TEXT, n_sites INTEGER,
+            LCOE_min REAL, LCOE_median REAL, AEP REAL, CAPEX REAL, p_net_nom REAL,
+            best_site INTEGER, best_LCOE REAL, best_p_net REAL, registered TEXT,
+            PRIMARY KEY (region, year, p_gross, cost_level));
+        CREATE TABLE IF NOT EXISTS costs (
+            region TEXT, year INTEGER, p_gross REAL, cost_level TEXT, configuration INTEGER, component TEXT, value REAL,
+            PRIMARY KEY (region, year, p_gross, cost_level, configuration, component));
+        CREATE INDEX IF NOT EXISTS runs_by_p_gross ON runs (p_gross);''')
+
+    return connection
+
+def best_site_index(capex_opex_comparison):
+
+    # like in cost_analysis, the best site has the lowest LCOE averaged over all configurations, but sites without any feasible configuration are ignored
+
+    LCOE = np.array([np.ravel(all_CAPEX_OPEX[0]['LCOE']) for all_CAPEX_OPEX in capex_opex_comparison],dtype=np.float64)
+
+    if np.all(np.isnan(LCOE)):
+        return None
+
+    return int(np.nanargmin(np.where(np.all(np.isnan(LCOE),axis=0),np.inf,np.nanmean(np.where(np.isnan(LCOE),np.inf,LCOE),axis=0))))
+
+def register_run(studied_region,year,p_gross,cost_level,path,otec_plants,capex_opex_comparison,id_sites,file=catalog_file):
+
+    ## For a sweep over plant sizes, every size is registered as a separate run. The metrics of the selected plants (AEP, CAPEX, net power)
+    ## are only stored for single plant sizes, because the plants of a sweep can have different sizes at every site.
+
+    p_gross_sizes = np.atleast_1d(p_gross)
+    n_configurations = len(capex_opex_comparison)//len(p_gross_sizes)
+    id_sites = np.ravel(id_sites)
+
+    runs = []
+    costs = []
+    for index_size,p_gross_size in enumerate(p_gross_sizes):
+
+        comparison = capex_opex_comparison[index_size*n_configurations:(index_size+1)*n_configurations]
+
+        if np.ndim(p_gross) > 0:
+            lcoe = np.asarray(otec_plants['LCOE_per_size'][index_size],dtype=np.float64)
+        else:
+            lcoe = np.ravel(otec_plants['LCOE']).astype(np.float64)
+
+        best_site = best_site_index(comparison)
+        feasible = ~np.isnan(lcoe)
+
+        run = {'region': studied_region,
+               'year': int(year),
+               'p_gross': -float(p_gross_size)/1000,
+               'cost_level': cost_level,
+               'path': path,
+               'n_sites': int(np.sum(feasible)),
+               'LCOE_min': float(np.min(lcoe[feasible])) if np.any(feasible) else None,
+               'LCOE_median': float(np.median(lcoe[feasible])) if np.any(feasible) else None,
+               'AEP': None,
+               'CAPEX': None,
+               'p_net_nom': None,
+               'best_site': int(id_sites[best_site]) if best_site is not None else None,
+               'best_LCOE': float(lcoe[best_site]) if best_site is not None and feasible[best_site] else None,
+               'best_p_net': None,
+               'registered': pd.Timestamp.now().isoformat(timespec='seconds')}
+
+        if np.ndim(p_gross) == 0:
+            # AEP in GWh, CAPEX in million USD and power in MW, summed over all feasible sites
+            run['AEP'] = float(-np.nansum(np.nanmean(otec_plants['p_net'][:,feasible],axis=0))*8760/1000000)
+            run['CAPEX'] = float(np.nansum(np.ravel(otec_plants['CAPEX'])[feasible])/1000000)
+            run['p_net_nom'] = float(-np.nansum(np.ravel(otec_plants['p_net_nom'])[feasible])/1000)
+            if best_site is not None:
+                run['best_p_net'] = float(-np.nanmean(otec_plants['p_net'][:,best_site])/1000)
+
+        runs.append(run)
+
+        if best_site is not None:
+            for configuration,all_CAPEX_OPEX in enumerate(comparison):
+                for component,value in all_CAPEX_OPEX[0].items():
+                    costs.append((studied_region,int(year),run['p_gross'],cost_level,configuration+1,component,float(np.ravel(value)[best_site])))
+
+    with open_catalog(file) as connection:
+        for run in runs:
+            key = (run['region'],run['year'],run['p_gross'],run['cost_level'])
+            connection.execute('DELETE FROM costs WHERE region=? AND year=? AND p_gross=? AND cost_level=?',key)
+            connection.execute(f'INSERT OR REPLACE INTO runs ({",".join(run_columns)}) VALUES ({",".join(["?"]*len(run_columns))})',
+                               [run[column] for column in run_columns])
+        connection.executemany('INSERT OR REPLACE INTO costs VALUES (?,?,?,?,?,?,?)',costs)
+    connection.close()
+
+    print(f'{len(runs)} runs registered in {file}.')
+
+def filter_clause(region=None,year=None,p_gross=None,cost_level=None,table='runs'):
+
+    # builds the WHERE clause and its parameters; every filter can be a single value or a list of values
+
+    clauses = []
+    parameters = []
+    for column,value in [('region',region),('year',year),('p_gross',p_gross),('cost_level',cost_level)]:
+        if value is None:
+            continue
+        values = [item.item() if isinstance(item,np.generic) else item for item in np.atleast_1d(value).tolist()]
+        clauses.append(f'{table}.{column} IN ({",".join(["?"]*len(values))})')
+        parameters.extend(values)
+
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''),parameters
+
+def query_runs(region=None,year=None,p_gross=None,cost_level=None,file=catalog_file):
+
+    # returns the registered runs as a DataFrame, sorted by region and gross power output
+
+    where,parameters = filter_clause(region,year,p_gross,cost_level)
+
+    with open_catalog(file) as connection:
+        runs = pd.read_sql_query(f'SELECT * FROM runs{where} ORDER BY region, year, cost_level, p_gross',connection,params=parameters)
+    connection.close()
+
+    return runs
+
+def query_costs(components,configuration,region=None,year=None,p_gross=None,cost_level=None,file=catalog_file):
+
+    ## Returns the runs together with the given cost components of one configuration at the best site, with one column per component.
+    ## For example, configuration 5 is the plant designed for the median warm and cold seawater temperatures.
+
+    where,parameters = filter_clause(region,year,p_gross,cost_level)
+    components = list(np.atleast_1d(components))
+
+    columns = ', '.join([f"MAX(CASE WHEN costs.component = ? THEN costs.value END) AS {component}" for component in components])
+    join = ('JOIN costs ON costs.region = runs.region AND costs.year = runs.year AND costs.p_gross = runs.p_gross '
+            'AND costs.cost_level = runs.cost_level AND costs.configuration = ?')
+
+    with open_catalog(file) as connection:
+        costs = pd.read_sql_query(f'SELECT runs.*, {columns} FROM runs {join}{where} '
+                                  'GROUP BY runs.region, runs.year, runs.p_gross, runs.cost_level ORDER BY runs.region, runs.year, runs.cost_level, runs.p_gross',
+                                  connection,params=components + [int(configuration)] + parameters)
+    connection.close()
+
+    return costs
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight telemetry that records wall time, CPU time and array sizes of the stages of a pyOTEC run
+"""
+
+import os
+import json
+import time
+import datetime
+import cProfile
+import functools
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+## A run is started with start_run, which clears the records of the previous run. Every stage, e.g. the processing of the temperature data
+## or one batch of off-design configurations, is wrapped in the context manager "stage" or decorated with "timed". Stages can be nested,
+## the parent of each stage is stored with its record. At the end, write_report stores all records in a json file next to the results.
+## If profile_stage is set to the name of a stage, that stage is also run under cProfile and the statistics are stored next to the report.
+## Stages that run several times (e.g. one off-design batch after another) are profiled into the same statistics.
+
+run = {'records': [], 'enabled': True, 'profile_stage': None, 'profiler': None, 'path': None, 'started': None}
+stack = threading.local()
+lock = threading.Lock()
+
+def start_run(path,inputs):
+
+    run['records'] = []
+    run['enabled'] = inputs['telemetry']
+    run['profile_stage'] = inputs['profile_stage']
+    run['profiler'] = cProfile.Profile() if inputs['profile_stage'] is not None else None
+    run['path'] = path
+    run['started'] = time.perf_counter()
+
+def array_sizes(**arrays):
+
+    # shape, dtype and size in MB of the given arrays, other objects are stored with their length if they have one
+
+    sizes = {}
+    for name,value in arrays.items():
+        if isinstance(value,np.ndarray):
+            sizes[name] = {'shape': list(value.shape),'dtype': str(value.dtype),'MB': round(value.nbytes/1024**2,3)}
+        elif hasattr(value,'__len__'):
+            sizes[name] = {'length': len(value)}
+    return sizes
+
+@contextmanager
+def stage(name,**arrays):
+
+    ## Records the wall time and the CPU time of the process for the code inside the with statement. Arrays passed as keywords are recorded
+    ## with their shape and size. Further arrays, e.g. results of the stage, can be added to the record that is returned with "as".
+
+    if not run['enabled']:
+        yield {'arrays': {}}
+        return
+
+    parents = getattr(stack,'names',[])
+    record = {'stage': name,'parent': parents[-1] if parents else None,'arrays': array_sizes(**arrays)}
+    stack.names = parents + [name]
+
+    # a stage nested in a stage with the same name is already profiled by the outer one
+    profiler = run['profiler'] if name == run['profile_stage'] and name not in parents else None
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['wall_time'] = round(time.perf_counter()-wall_start,4)
+        record['cpu_time'] = round(time.process_time()-cpu_start,4)
+        stack.names = parents
+
+        if profiler is not None and run['path'] is not None:
+            record['profile'] = os.path.join(run['path'],f'profile_{name}.prof'.replace(" ","_"))
+            with lock:
+                profiler.dump_stats(record['profile'])
+
+        with lock:
+            run['records'].append(record)
+
+def timed(name=None):
+
+    # decorator that records every call of a function as a stage, named after the function if no name is given
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args,**kwargs):
+            with stage(name or function.__name__):
+                return function(*args,**kwargs)
+        return wrapper
+    return decorator
+
+def add_arrays(record,**arrays):
+
+    # adds arrays to the record of a stage, e.g. the results that are only known at the end of the stage
+
+    record['arrays'].update(array_sizes(**arrays))
+
+def write_report(file,**information):
+
+    ## Stores the records in the order in which the stages were finished, together with the total runtime and further information about the
+    ## run (e.g. region and plant size). The wall and CPU times of nested stages are included in the times of their parents.
+
+    if not run['enabled']:
+        return None
+
+    report = {**information,
+              'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'total_wall_time': round(time.perf_counter()-run['started'],4) if run['started'] is not None else None,
+              'stages': run['records']}
+
+    with open(file,'w') as report_file:
+        json.dump(report,report_file,indent=2,default=str)
+
+    return report
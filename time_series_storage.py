@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to write the off-design time series into one chunked, compressed HDF5 file and to read single variables or sites from it
+"""
+
+import numpy as np
+import pandas as pd
+
+## PyTables is imported by the functions that open the h5 files, so that importing this module (and pyOTEC) does not load it
+
+def export_time_series(file,otec_plant,site_labels,timestamp,inputs,variables=None,sites=None):
+
+    ## All variables are written through one open file handle into compressed arrays (blosc with zstd) that are chunked along time and sites,
+    ## so that one variable or one site can be read later without decompressing the whole file. Time series have the shape (time, sites),
+    ## nominal values and other per-site results have the shape (1, sites). Like before, the values are rounded to two decimals.
+
+    h5_file,columns = create_time_series_file(file,site_labels,timestamp,sites)
+
+    with h5_file:
+        variables = write_time_series_block(h5_file,otec_plant,columns,0,inputs,variables)
+
+    print(f'{len(variables)} variables of {len(columns)} sites exported to {file}.')
+
+def create_time_series_file(file,site_labels,timestamp,sites=None):
+
+    ## Opens the h5 file and stores the site labels and timestamps. The variables are added block by block with write_time_series_block, so that
+    ## the time series of a region can be exported while its sites are still being simulated. Returns the open file and the exported columns.
+
+    import tables
+
+    site_labels = np.array(site_labels,dtype=str)
+
+    # sites can be selected either by their label "longitude_latitude" or by their column index
+    if sites is None:
+        columns = np.arange(len(site_labels))
+    else:
+        columns = site_columns(site_labels,sites)
+
+    h5_file = tables.open_file(file,mode='w')
+    h5_file.create_array('/','sites',obj=site_labels[columns].astype(bytes))
+    h5_file.create_array('/','time',obj=np.array(pd.DatetimeIndex(timestamp).asi8,dtype=np.int64))
+
+    return h5_file,columns
+
+def write_time_series_block(h5_file,otec_plant,columns,first_site,inputs,variables=None):
+
+    ## Writes the results of the sites first_site, first_site+1, ... into the exported columns. Each variable is created at the first block with
+    ## its dtype, number of rows and the total number of exported sites. Since the blocks are contiguous and the columns sorted, the sites of
+    ## one block are written into one contiguous range of columns.
+
+    import tables
+
+    if variables is None:
+        variables = list(otec_plant.keys())
+
+    chunk_time,chunk_sites = inputs['export_chunks']
+    filters = tables.Filters(complevel=inputs['export_complevel'],complib='blosc:zstd',shuffle=True)
+
+    for key in variables:
+        value = np.asarray(otec_plant[key])
+        if value.ndim <= 1:
+            value = value.reshape(1,-1)
+
+        start,end = np.searchsorted(columns,[first_site,first_site+value.shape[1]])
+        value = np.round(value[:,columns[start:end]-first_site],2)
+
+        if key not in h5_file.root:
+            shape = (value.shape[0],len(columns))
+            chunkshape = (min(chunk_time,shape[0]),max(1,min(chunk_sites,shape[1])))
+            h5_file.create_carray('/',key,atom=tables.Atom.from_dtype(value.dtype),shape=shape,filters=filters,chunkshape=chunkshape)
+
+        if end > start:
+            h5_file.get_node('/',key)[:,start:end] = value
+
+    return variables
+
+def site_columns(site_labels,sites):
+
+    site_labels = np.array(site_labels,dtype=str)
+
+    if np.issubdtype(np.asarray(sites).dtype,np.integer):
+        return np.sort(np.asarray(sites,dtype=np.int64))
+
+    columns = np.flatnonzero(np.isin(site_labels,np.array(sites,dtype=str)))
+    if len(columns) < len(sites):
+        raise ValueError('Some of the selected sites are not in the time series data.')
+
+    return columns
+
+def load_time_series(file,variables=None,sites=None):
+
+    ## Here we only read the requested variables and sites, i.e. only the chunks that contain them are decompressed.
+    ## The time series are returned as DataFrames with the timestamp as index and the site labels as columns.
+
+    import tables
+
+    with tables.open_file(file,mode='r') as h5_file:
+        site_labels = h5_file.root.sites.read().astype(str)
+        timestamp = pd.to_datetime(h5_file.root.time.read())
+
+        if variables is None:
+            variables = [node.name for node in h5_file.list_nodes('/') if node.name not in ['sites','time']]
+        elif isinstance(variables,str):
+            variables = [variables]
+
+        if sites is None:
+            columns = np.arange(len(site_labels))
+        else:
+            columns = site_columns(site_labels,np.atleast_1d(sites))
+
+        time_series = {}
+        for key in variables:
+            node = h5_file.get_node('/',key)
+            if len(columns) == len(site_labels):
+                value = node.read()
+            else:
+                value = node[:,columns.tolist()]
+
+            if value.shape[0] == len(timestamp):
+                time_series[key] = pd.DataFrame(value,index=timestamp,columns=site_labels[columns])
+            else:
+                time_series[key] = pd.DataFrame(value,columns=site_labels[columns])
+
+    return time_series
+
+def time_series_variables(file):
+
+    # lists the stored variables and sites without reading any data
+
+    import tables
+
+    with tables.open_file(file,mode='r') as h5_file:
+        variables = [node.name for node in h5_file.list_nodes('/') if node.name not in ['sites','time']]
+        site_labels = h5_file.root.sites.read().astype(str)
+
+    return variables,site_labels